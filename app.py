@@ -6,19 +6,77 @@ License: MIT License
 Description: Entry point of the app, contains API implementation.
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
 from typing import List
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from io import BytesIO
 from pydantic import BaseModel
 from pathlib import Path
-from utils.invoice_processing import save_and_process_file
 from config.config import ALLOW_ORIGINS, ALLOW_HEADERS, ALLOW_CREDENTIALS, ALLOW_METHODS
+from config.config import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_STORE, JOB_STORE_PATH, JOB_RETRY_AFTER_SECONDS
 from utils.logs import logger
 from utils.invoice_processing import perform_reconciliation
+from utils.pipeline import (process_documents, process_document_batch, run_blocking, spool_uploads,
+                            reconcile_spooled_uploads, close_uploads, persist_reconciliations,
+                            reconciliation_entry, open_session, add_session_bills)
+from utils.storage import get_reconciliation_store
+from utils.sessions import get_session_store, SessionNotFoundError
+from utils.uploads import new_request_id
+from utils.extractors import UnsupportedFileTypeError
+from utils.jobs import JobManager, create_job_store, QueueFullError, JobManagerUnavailableError, FINISHED_STATES
+from utils.assignment import assign_bills_to_invoices
+import asyncio
+from utils.cache import get_extraction_cache
+from utils.llm_gateway import get_llm_gateway
+from utils.preprocessing import get_preprocessing_stats
+from utils.templates import get_template_extractor
+from utils.multi_extraction import get_multi_extraction_stats
+from utils.model_routing import get_model_routing_stats
+from utils.streaming import stream_reconciliation, STREAM_FORMATS
+from utils.metrics import (render_metrics, should_trace, start_trace, finish_trace, get_trace, HTTP_REQUEST_SECONDS,
+                           PROMETHEUS_CONTENT_TYPE)
+from config.config import METRICS_ENABLED
+import time
 
 app = FastAPI()
 
+job_manager = JobManager(create_job_store(JOB_STORE, JOB_STORE_PATH), workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE)
+
+@app.on_event("startup")
+async def start_job_manager():
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def stop_job_manager():
+    await job_manager.stop()
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    # Requests sending X-Trace: 1 are traced, others are sampled with TRACE_SAMPLE_RATE
+    trace_token = None
+    if should_trace(request.headers.get("X-Trace") == "1"):
+        trace, trace_token = start_trace(request.headers.get("X-Request-ID"))
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if trace_token is not None:
+            response.headers["X-Trace-Id"] = trace.trace_id
+        return response
+    finally:
+        if METRICS_ENABLED:
+            # The route template, not the path, so job ids do not become label values
+            route = request.scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                         route=getattr(route, "path", "unmatched"), status=status)
+        if trace_token is not None:
+            finish_trace(trace_token)
+
+@app.exception_handler(UnsupportedFileTypeError)
+async def unsupported_file_type(request: Request, exc: UnsupportedFileTypeError):
+    return JSONResponse(status_code=415, content={"detail": str(exc)})
+
 class Message(BaseModel):
     role: str
     content: str
@@ -33,19 +91,11 @@ async def reconcile_invoice(
     bill_files: List[UploadFile] = File(...)
 ):
     
-    # Process invoice file
-    invoice_details = save_and_process_file(invoice_file, is_invoice=True)
-    
-    # Process each bill file
-    bill_details_list = []
-    for bill_file in bill_files:
-        bill_details = {}
-        bill_details = save_and_process_file(bill_file, is_invoice=False)
-        bill_details_list.append(bill_details)
+    # Process the invoice and every bill concurrently, off the event loop
+    invoice_details, bill_details_list = await process_documents(invoice_file, bill_files)
 
-    print("=========bill_details_list=========", bill_details_list)
-
-    reconciliation_data = perform_reconciliation(invoice_details, bill_details_list)
+    reconciliation_data = await run_blocking(perform_reconciliation, invoice_details, bill_details_list)
+    await persist_reconciliations([reconciliation_entry(invoice_details, bill_details_list, reconciliation_data)])
     
     return {
         "invoice_details": invoice_details,
@@ -53,6 +103,187 @@ async def reconcile_invoice(
         "result": reconciliation_data
     }
 
+@app.post("/api/invoice/reconcile/stream")
+async def reconcile_invoice_stream(
+    invoice_file: UploadFile = File(...),
+    bill_files: List[UploadFile] = File(...),
+    format: str = Query("ndjson", description="'ndjson' or 'sse'")
+):
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail="Unknown stream format: {}".format(format))
+
+    # The uploads are spooled before the response starts, the stream closes the spools
+    uploads = await spool_uploads([invoice_file] + list(bill_files), new_request_id())
+    return StreamingResponse(
+        stream_reconciliation(uploads[0], uploads[1:], format),
+        media_type=STREAM_FORMATS[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/invoice/reconcile/batch")
+async def reconcile_invoice_batch(
+    invoice_files: List[UploadFile] = File(...),
+    bill_files: List[UploadFile] = File(...)
+):
+    # Every distinct document of the batch is extracted exactly once
+    invoice_details_list, bill_details_list = await process_document_batch(invoice_files, bill_files)
+
+    groups, reasons, unassigned = assign_bills_to_invoices(invoice_details_list, bill_details_list)
+
+    reconciliations = await asyncio.gather(*[
+        run_blocking(perform_reconciliation, invoice_details, [bill_details_list[i] for i in group])
+        for invoice_details, group in zip(invoice_details_list, groups)
+    ])
+
+    await persist_reconciliations([
+        reconciliation_entry(invoice_details, [bill_details_list[i] for i in group], reconciliation_data)
+        for invoice_details, group, reconciliation_data in zip(invoice_details_list, groups, reconciliations)
+    ])
+
+    results = []
+    for invoice_file, invoice_details, group, reconciliation_data in zip(
+            invoice_files, invoice_details_list, groups, reconciliations):
+        results.append({
+            "invoice_file": invoice_file.filename,
+            "invoice_details": invoice_details,
+            "bill_files": [bill_files[i].filename for i in group],
+            "bill_details": [bill_details_list[i] for i in group],
+            "assignment": [{"bill_file": bill_files[i].filename, "reason": reasons[i]} for i in group],
+            "result": reconciliation_data
+        })
+
+    return {
+        "results": results,
+        "unassigned_bills": [
+            {"bill_file": bill_files[i].filename, "bill_details": bill_details_list[i]} for i in unassigned
+        ]
+    }
+
+@app.post("/api/sessions")
+async def create_session(invoice_file: UploadFile = File(...)):
+    # Opening a session for an invoice that already has one returns that session
+    session = await open_session(invoice_file)
+    return await run_blocking(session.result)
+
+def get_session_or_404(session_id):
+    try:
+        return get_session_store().get(session_id)
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/api/sessions/{session_id}")
+async def session_details(session_id: str):
+    session = get_session_or_404(session_id)
+    return await run_blocking(session.result)
+
+@app.post("/api/sessions/{session_id}/bills")
+async def add_bills_to_session(session_id: str, bill_files: List[UploadFile] = File(...)):
+    # Only the new bills are extracted and matched, the earlier ones are not processed again
+    session = get_session_or_404(session_id)
+    bill_ids = await add_session_bills(session, bill_files)
+    # Fetched again, in case another worker changed the session meanwhile
+    session = get_session_or_404(session_id)
+    return {"bill_ids": bill_ids, **await run_blocking(session.result)}
+
+@app.delete("/api/sessions/{session_id}/bills/{bill_id}")
+async def remove_bill_from_session(session_id: str, bill_id: str):
+    session = get_session_or_404(session_id)
+    try:
+        await run_blocking(session.remove_bill, bill_id)
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    session = get_session_or_404(session_id)
+    return await run_blocking(session.result)
+
+@app.delete("/api/sessions/{session_id}", status_code=204)
+def close_session(session_id: str):
+    try:
+        get_session_store().close(session_id)
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(status_code=204)
+
+def raise_if_jobs_saturated():
+    if not job_manager.running:
+        raise HTTPException(status_code=503, detail="Job workers are not running",
+                            headers={"Retry-After": str(JOB_RETRY_AFTER_SECONDS)})
+    if not job_manager.has_capacity():
+        raise HTTPException(status_code=429, detail="Too many queued jobs, retry later",
+                            headers={"Retry-After": str(JOB_RETRY_AFTER_SECONDS)})
+
+@app.post("/api/jobs/reconcile", status_code=202)
+async def submit_reconcile_job(
+    invoice_file: UploadFile = File(...),
+    bill_files: List[UploadFile] = File(...)
+):
+    # Reject before reading the uploads when the queue is already saturated
+    raise_if_jobs_saturated()
+
+    # Uploads are closed when the request ends, so they are spooled before the job is queued
+    uploads = await spool_uploads([invoice_file] + list(bill_files), new_request_id())
+    try:
+        job_id = job_manager.submit("reconcile", reconcile_spooled_uploads, uploads[0], uploads[1:],
+                                    on_discard=lambda: close_uploads(uploads))
+    except (QueueFullError, JobManagerUnavailableError):
+        close_uploads(uploads)
+        raise_if_jobs_saturated()
+        raise
+    return {"job_id": job_id, "status": job_manager.get(job_id)["status"]}
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] in FINISHED_STATES or not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already {}".format(job["status"]))
+    return job_manager.get(job_id)
+
+@app.get("/api/reconciliations")
+async def list_reconciliations(
+    invoice_number: str = None,
+    bill_number: str = None,
+    date_from: str = Query(None, description="Earliest invoice date, YYYY-MM-DD"),
+    date_to: str = Query(None, description="Latest invoice date, YYYY-MM-DD"),
+    after: int = Query(0, description="The next_after value of the previous page"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    store = await run_blocking(get_reconciliation_store)
+    if store is None:
+        raise HTTPException(status_code=503, detail="No reconciliation store is configured")
+    items, next_after = await run_blocking(store.get_results_page, limit=limit, after=after,
+                                           invoice_number=invoice_number, bill_number=bill_number,
+                                           date_from=date_from, date_to=date_to)
+    return {"items": items, "next_after": next_after}
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    return get_extraction_cache().get_stats()
+
+@app.get("/api/llm/stats")
+def llm_stats():
+    return {**get_llm_gateway().get_metrics(), "preprocessing": get_preprocessing_stats(),
+            "templates": get_template_extractor().get_stats(), "multi_extraction": get_multi_extraction_stats(),
+            "model_routing": get_model_routing_stats()}
+
+@app.get("/metrics")
+def metrics():
+    return Response(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/api/traces/{trace_id}")
+def trace_details(trace_id: str):
+    trace = get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
 if __name__ == '__main__':
     import uvicorn
     uvicorn.run(app)
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""
+Filename: bench_chunked_extraction.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Times the extraction of synthetic invoices of growing page counts with one LLM call and
+             with chunked extraction, against a fake model whose latency grows with the line items it
+             writes, and checks that the merged line items are those of the document.
+
+Usage: python -m benchmarks.bench_chunked_extraction [pages ...]
+"""
+
+import json
+import re
+import sys
+import time
+from benchmarks.synthetic import LINES_PER_PAGE, generate_invoice, invoice_text
+from utils.general import PAGE_SEPARATOR
+from utils.llm_gateway import LLMGateway, FakeBackend, set_llm_gateway
+from utils.invoice_processing import fetch_invoice_details
+from utils.chunked_extraction import extract_in_chunks, split_into_chunks
+
+# Latency of the fake model: a fixed cost per call plus the time to write each line item, scaled
+# down from a model writing about 100 tokens per second
+CALL_SECONDS = 0.1
+SECONDS_PER_LINE_ITEM = 0.001
+
+_item = re.compile(r"^(.+?)  (\d+)  (\$[\d,.]+)  (\$[\d,.]+)$")
+_header_fields = {"Invoice No": "invoice_number", "Date": "invoice_date", "Due Date": "invoice_due_date",
+                  "Bill To": "invoice_to", "Phone": "contact_number", "Email": "email"}
+_total_fields = {"Subtotal": "invoice_subtotal_due", "Tax": "invoice_tax_due", "Total": "invoice_total_due"}
+
+
+def fake_model(prompt, model_name):
+    """Reads the fields and line items of the text in the prompt, as the model would."""
+    text = prompt.split("Context/Text:", 1)[1].split("***Important:***", 1)[0]
+    details = {"line_items": []}
+    for line in text.replace(PAGE_SEPARATOR, "\n").splitlines():
+        line = line.strip()
+        match = _item.match(line)
+        if match:
+            details["line_items"].append(dict(zip(("description", "hrs_or_quantity", "rate_or_cost", "line_total"),
+                                                  match.groups())))
+            continue
+        label, _, value = line.partition(": ") if ": " in line else line.partition(" ")
+        field = _header_fields.get(label) or _total_fields.get(label)
+        if field:
+            details[field] = value
+    time.sleep(CALL_SECONDS + SECONDS_PER_LINE_ITEM * len(details["line_items"]))
+    return json.dumps(details)
+
+
+def paged_text(invoice):
+    lines = invoice_text(invoice)
+    return PAGE_SEPARATOR.join("\n".join(lines[start:start + LINES_PER_PAGE])
+                               for start in range(0, len(lines), LINES_PER_PAGE))
+
+
+def main(page_counts):
+    set_llm_gateway(LLMGateway(FakeBackend(fake_model), requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9))
+    for pages in page_counts:
+        invoice = generate_invoice(line_items=pages * LINES_PER_PAGE - 13, seed=pages)
+        text = paged_text(invoice)
+
+        started = time.perf_counter()
+        single = fetch_invoice_details(text)
+        single_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        chunked = extract_in_chunks(text, True, fetch_invoice_details)
+        chunked_seconds = time.perf_counter() - started
+
+        complete = (chunked["line_items"] == invoice["line_items"]
+                    and chunked["invoice_number"] == invoice["invoice_number"]
+                    and chunked["invoice_total_due"] == invoice["invoice_total_due"])
+        print("{:>4} pages, {:>6,} items: one call {:6.2f}s, {:>3} chunks {:6.2f}s, merge {}, subtotal check {}".format(
+            pages, len(invoice["line_items"]), single_seconds, len(split_into_chunks(text)), chunked_seconds,
+            "complete" if complete else "INCOMPLETE", chunked["chunked_extraction"]["matches_subtotal"]))
+        assert single["line_items"] == invoice["line_items"]
+
+
+if __name__ == "__main__":
+    main([int(pages) for pages in sys.argv[1:]] or [8, 32, 64, 128, 256])
@@ -0,0 +1,60 @@
+"""
+Filename: bench_dates.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Compares the pattern-dispatched date parser in utils.dates with the previous
+             parse_date, which tried strptime formats one after another.
+
+Usage: python -m benchmarks.bench_dates [dates ...]
+"""
+
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from utils.dates import normalize_date_column
+
+LAYOUTS = ("%d/%m/%Y", "%m/%d/%Y", "%Y-%m-%d", "%d.%m.%Y", "%d %b %Y", "%B %d, %Y")
+
+
+def legacy_parse_date(date_string):
+    # parse_date before utils.dates
+    if date_string is None or date_string == "NA":
+        return None
+    date_formats = [
+        '%d/%m/%Y', '%m/%d/%Y', '%Y/%d/%m', '%Y/%m/%d',
+        '%d-%m-%Y', '%m-%d-%Y', '%Y-%d-%m', '%Y-%m-%d',
+        '%d.%m.%Y', '%m.%d.%Y', '%Y.%m.%d', '%Y.%m.%d'
+    ]
+    for fmt in date_formats:
+        try:
+            return datetime.strptime(date_string, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def generate_dates(count, seed=7):
+    rng = random.Random(seed)
+    start = date(2020, 1, 1)
+    return [(start + timedelta(days=rng.randrange(2000))).strftime(rng.choice(LAYOUTS)) for _ in range(count)]
+
+
+def main(sizes):
+    for count in sizes:
+        values = generate_dates(count)
+        started = time.perf_counter()
+        legacy = [legacy_parse_date(value) for value in values]
+        legacy_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        dates = normalize_date_column(values, day_first=True)
+        elapsed = time.perf_counter() - started
+
+        print("{:>9,} dates: strptime loop {:.3f}s ({:,} unparsed), column {:.3f}s ({:,} unparsed), {:.1f}x faster".format(
+            count, legacy_elapsed, legacy.count(None), elapsed, dates.count(None), legacy_elapsed / elapsed))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 100000])
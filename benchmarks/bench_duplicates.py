@@ -0,0 +1,87 @@
+"""
+Filename: bench_duplicates.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Grows a bill fingerprint index to millions of bills and times duplicate lookups at each
+             size, against a full scan of the stored signatures for the smaller sizes.
+
+Usage: python -m benchmarks.bench_duplicates [stored_bills ...]
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from array import array
+from utils.duplicates import BillFingerprintIndex, estimate_similarity, SIGNATURE_SIZE
+
+INSERT_BATCH = 10000
+LOOKUPS = 200
+# Full scans get slow fast, they are only timed up to this many stored bills
+MAX_SCAN_BILLS = 100000
+
+
+def random_fingerprint(rng, number):
+    return {
+        "sha256": "{:064x}".format(rng.getrandbits(256)), "bill_key": "b{}|customer {}".format(number, number % 5000),
+        "full_key": "b{}|customer {}|USD{}|2024-01-01".format(number, number % 5000, rng.randrange(10 ** 7)),
+        "bill_number": "B{}".format(number), "bill_paid_by": "Customer {}".format(number % 5000),
+        "bill_date": "01/01/2024", "bill_total_paid": "$1.00", "filename": "bill.pdf", "created_at": time.time(),
+        "signature": tuple(rng.getrandbits(61) for _ in range(SIGNATURE_SIZE)),
+    }
+
+
+def near_copy(rng, fingerprint):
+    """The fingerprint of a resubmission with small changes: a new file and number, 5% of the signature changed."""
+    signature = list(fingerprint["signature"])
+    for position in rng.sample(range(SIGNATURE_SIZE), SIGNATURE_SIZE // 20):
+        signature[position] = rng.getrandbits(61)
+    return dict(fingerprint, sha256="new", bill_key=None, full_key=None, signature=tuple(signature))
+
+
+def full_scan(index, fingerprint):
+    # What a lookup costs without the LSH buckets: every stored signature is compared
+    with index._lock:
+        rows = index._connection.execute("SELECT signature FROM bill_fingerprints").fetchall()
+    return [similarity for similarity in (estimate_similarity(fingerprint["signature"], array("Q", row[0]))
+                                          for row in rows) if similarity >= index.near_duplicate_threshold]
+
+
+def main(sizes):
+    rng = random.Random(7)
+    directory = tempfile.mkdtemp(prefix="bench-duplicates-")
+    index = BillFingerprintIndex(os.path.join(directory, "fingerprints.sqlite3"))
+    stored = 0
+    # A few stored bills of every batch, the lookups are near copies of them
+    samples = []
+    try:
+        for size in sorted(sizes):
+            started = time.perf_counter()
+            while stored < size:
+                batch = [random_fingerprint(rng, stored + i) for i in range(min(INSERT_BATCH, size - stored))]
+                index.add_many(batch)
+                samples.extend(rng.sample(batch, min(10, len(batch))))
+                stored += len(batch)
+            insert_seconds = time.perf_counter() - started
+
+            queries = [near_copy(rng, rng.choice(samples)) for _ in range(LOOKUPS)]
+            started = time.perf_counter()
+            found = sum(1 for query in queries if index.find_candidates(query))
+            lookup_ms = (time.perf_counter() - started) / LOOKUPS * 1000
+            line = "{:>9,} bills: grown in {:.1f}s, lookup {:.3f} ms ({}/{} near copies found)".format(
+                size, insert_seconds, lookup_ms, found, LOOKUPS)
+            if size <= MAX_SCAN_BILLS:
+                started = time.perf_counter()
+                full_scan(index, queries[0])
+                line += ", full scan {:.1f} ms".format((time.perf_counter() - started) * 1000)
+            print(line)
+        print("Index file: {:.0f} MB".format(os.path.getsize(os.path.join(directory, "fingerprints.sqlite3")) / 2 ** 20))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000])
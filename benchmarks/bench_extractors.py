@@ -0,0 +1,51 @@
+"""
+Filename: bench_extractors.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Compares the installed PDF text extraction backends on the sample documents in uploads/,
+             or on the PDFs given on the command line.
+
+Usage: python -m benchmarks.bench_extractors [file.pdf ...]
+"""
+
+import glob
+import io
+import sys
+import time
+from utils.extractors import PDF_MIME_TYPE, _backends
+
+REPEAT = 5
+
+
+def measure(backend, payload):
+    """The fastest of REPEAT extractions, in seconds, and the text of the last one."""
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        text = backend.extract(io.BytesIO(payload))
+        timings.append(time.perf_counter() - started)
+    return min(timings), text
+
+
+def main(paths):
+    backends = _backends[PDF_MIME_TYPE]
+    for path in paths:
+        with open(path, "rb") as pdf_file:
+            payload = pdf_file.read()
+        print("{} ({} KB)".format(path, len(payload) // 1024))
+        for backend in backends:
+            if not backend.available():
+                print("  {:<12} not installed".format(backend.name))
+                continue
+            try:
+                seconds, text = measure(backend, payload)
+            except Exception as e:
+                print("  {:<12} failed: {}".format(backend.name, e))
+                continue
+            print("  {:<12} {:>9.2f} ms  {:>6} chars  {:>4} lines".format(
+                backend.name, seconds * 1000, len(text), text.count("\n") + 1))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob("uploads/*.pdf")))
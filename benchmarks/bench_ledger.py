@@ -0,0 +1,93 @@
+"""
+Filename: bench_ledger.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Compares reconciling the amounts of an invoice through the columnar money ledger
+             with the previous per-field Decimal parsing, and with the float aggregation it replaced.
+
+Usage: python -m benchmarks.bench_ledger [bills ...]
+"""
+
+import random
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from utils.general import clean_currency
+from utils.ledger import BillLedger
+from utils.reconciliation import reconcile_amounts
+
+FIELDS = ("bill_subtotal_paid", "bill_tax_paid", "bill_total_paid")
+
+
+def legacy_parse_amount(value):
+    # parse_amount before the ledger, called once per field for the totals and again for the result
+    if value is None:
+        return Decimal("0.00")
+    try:
+        return Decimal(clean_currency(value).strip()).quantize(Decimal("0.01"))
+    except (InvalidOperation, ValueError):
+        return Decimal("0.00")
+
+
+def legacy_reconcile(invoice, bills):
+    totals = {field: sum((legacy_parse_amount(bill.get(field)) for bill in bills), Decimal("0.00"))
+              for field in FIELDS}
+    formatted = [["${:,.2f}".format(legacy_parse_amount(bill.get(field))) for field in FIELDS] for bill in bills]
+    return legacy_parse_amount(invoice["invoice_total_due"]) - totals["bill_total_paid"], formatted
+
+
+def float_total(bills):
+    # aggregate_bills_total before the ledger
+    return sum(float(clean_currency(bill['bill_total_paid'])) for bill in bills)
+
+
+def generate_bills(count, seed=7):
+    rng = random.Random(seed)
+    bills = []
+    for _ in range(count):
+        subtotal = rng.randint(1, 10000000)
+        tax = subtotal // 10
+        bills.append({
+            "bill_subtotal_paid": "${:,.2f}".format(subtotal / 100),
+            "bill_tax_paid": "${:,.2f}".format(tax / 100),
+            "bill_total_paid": "${:,.2f}".format((subtotal + tax) / 100),
+        })
+    return bills
+
+
+def main(sizes):
+    for count in sizes:
+        bills = generate_bills(count)
+        exact = sum(int(bill["bill_total_paid"].strip("$").replace(",", "").replace(".", "")) for bill in bills)
+        invoice = {"invoice_subtotal_due": "$0.00", "invoice_tax_due": "$0.00",
+                   "invoice_total_due": "${:,}.{:02d}".format(*divmod(exact, 100))}
+
+        started = time.perf_counter()
+        legacy_reconcile(invoice, bills)
+        legacy = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = reconcile_amounts(invoice, bills)
+        ledger = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for field in FIELDS:
+            sum((legacy_parse_amount(bill.get(field)) for bill in bills), Decimal("0.00"))
+        legacy_totals = time.perf_counter() - started
+
+        started = time.perf_counter()
+        bill_ledger = BillLedger(bills)
+        for field in FIELDS:
+            bill_ledger.total(field)
+        ledger_totals = time.perf_counter() - started
+
+        drift = Decimal(str(float_total(bills))) - Decimal(exact).scaleb(-2)
+        print("{:>9,} bills: reconcile decimal {:.3f}s, ledger {:.3f}s, {:.1f}x faster; totals decimal {:.3f}s, "
+              "ledger {:.3f}s, {:.1f}x faster; total difference {}, float drift {}".format(
+                  count, legacy, ledger, legacy / ledger, legacy_totals, ledger_totals, legacy_totals / ledger_totals,
+                  result["total_difference"], drift))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
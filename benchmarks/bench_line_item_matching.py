@@ -0,0 +1,100 @@
+"""
+Filename: bench_line_item_matching.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Compares the indexed line item matcher in utils.matching with the previous
+             nested-loop implementation of match_line_items, and times the semantic mode with the
+             local hashing embedder (needs NumPy).
+
+Usage: python -m benchmarks.bench_line_item_matching [invoice_items ...]
+"""
+
+import random
+import sys
+import time
+from utils.general import clean_currency
+from utils.matching import LineItemIndex, SemanticLineItemIndex, match_line_items
+
+WORDS = ["foundation", "labor", "pcc", "steel", "concrete", "transport", "materials", "excavation",
+         "formwork", "plumbing", "electrical", "paint", "tiles", "roofing", "scaffold", "crane"]
+
+
+def legacy_match_line_items(invoice_items, bill_items):
+    # The nested loop match_line_items used before the index was introduced
+    mismatches = []
+    matched_items = []
+    for b_item in bill_items:
+        b_desc = b_item.get('description', '').strip().lower()
+        b_raw_amount = b_item.get('amount') or b_item.get('Amount') or '0'
+        try:
+            b_amount = round(float(clean_currency(b_raw_amount)), 2)
+        except Exception:
+            b_amount = 0.00
+        match_found = False
+        for i_item in invoice_items:
+            i_desc = i_item.get('description', '').strip().lower()
+            try:
+                i_amount = round(float(clean_currency(i_item.get('line_total') or '0')), 2)
+            except Exception:
+                i_amount = 0.00
+            if b_desc == i_desc:
+                match_found = True
+                if b_amount != i_amount:
+                    mismatches.append(b_item)
+                else:
+                    matched_items.append(b_item)
+                break
+        if not match_found:
+            mismatches.append(b_item)
+    return matched_items, mismatches
+
+
+def generate_items(count, seed=7):
+    rng = random.Random(seed)
+    invoice_items = []
+    for i in range(count):
+        description = "{} {} {}".format(rng.choice(WORDS), rng.choice(WORDS), i)
+        amount = "{:,.2f}".format(rng.randint(100, 1000000) / 100)
+        invoice_items.append({"description": description, "line_total": amount})
+    bill_items = []
+    for item in rng.sample(invoice_items, count // 2):
+        description = item["description"]
+        if rng.random() < 0.2:
+            # Misspell a share of the bill descriptions so the fuzzy path is exercised
+            description = description.replace("o", "ou", 1)
+        bill_items.append({"description": description, "amount": item["line_total"]})
+    return invoice_items, bill_items
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def prepared_semantic_index(invoice_items, bill_items):
+    index = SemanticLineItemIndex(invoice_items)
+    index.prepare(bill_items)
+    return index
+
+
+def main(sizes):
+    for size in sizes:
+        invoice_items, bill_items = generate_items(size)
+        legacy_seconds, (legacy_matched, _) = timed(legacy_match_line_items, invoice_items, bill_items)
+        index_seconds, index = timed(LineItemIndex, invoice_items)
+        match_seconds, (matched, _) = timed(match_line_items, invoice_items, bill_items, index)
+        print("{:>7} invoice items, {:>6} bill items: legacy {:.3f}s ({} matched), "
+              "indexed {:.3f}s build + {:.3f}s match ({} matched)".format(
+                  size, len(bill_items), legacy_seconds, len(legacy_matched),
+                  index_seconds, match_seconds, len(matched)))
+        semantic_index_seconds, semantic_index = timed(prepared_semantic_index, invoice_items, bill_items)
+        semantic_match_seconds, (semantic_matched, _) = timed(match_line_items, invoice_items, bill_items,
+                                                              semantic_index)
+        print("{:>7} invoice items, semantic {:.3f}s build and embed + {:.3f}s match ({} matched)".format(
+            size, semantic_index_seconds, semantic_match_seconds, len(semantic_matched)))
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [100, 1000, 10000])
@@ -0,0 +1,109 @@
+"""
+Filename: bench_model_routing.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Compares extraction latency and accuracy of the strong model alone with tiered model
+             routing, on synthetic invoices and bills and a fake model pair: a fast model that gets
+             hard documents wrong and a slow one that gets everything right.
+
+Usage: python -m benchmarks.bench_model_routing [documents] [hard_share]
+"""
+
+import json
+import random
+import re
+import statistics
+import sys
+import time
+from benchmarks.synthetic import generate_invoice, generate_bills, invoice_text, bill_text
+from utils.llm_gateway import LLMGateway, FakeBackend, set_llm_gateway
+from utils.invoice_processing import extract_document
+from utils.model_routing import route_extraction, get_model_routing_stats
+from config.config import gemini_model_name, GEMINI_FAST_MODEL_NAME
+
+# Latency of the fake models, a fixed cost per call plus the time to write each line item
+FAST_SECONDS, FAST_SECONDS_PER_ITEM = 0.02, 0.0005
+STRONG_SECONDS, STRONG_SECONDS_PER_ITEM = 0.08, 0.002
+# Share of the fast model's mistakes that no local check can see, e.g. a misread description
+SILENT_MISTAKE_SHARE = 0.1
+
+_document_id = re.compile(r"Document: (\S+)")
+# Document id -> (true details, the mistake the fast model makes or None)
+_documents = {}
+
+
+def make_mistake(details, mistake):
+    """The details as the fast model reads them on a hard document."""
+    details = json.loads(json.dumps(details))
+    if mistake == "dropped_item":
+        details["line_items"].pop()
+    elif mistake == "missing_total":
+        details["invoice_total_due" if "invoice_total_due" in details else "bill_total_paid"] = "NA"
+    elif mistake == "misread_tax":
+        tax_field = "invoice_tax_due" if "invoice_tax_due" in details else "bill_tax_paid"
+        details[tax_field] = details[tax_field].replace("$", "$1")
+    elif mistake == "misread_description":
+        details["line_items"][0]["description"] += "s"
+    return details
+
+
+def fake_models(prompt, model_name):
+    true_details, mistake = _documents[_document_id.search(prompt).group(1)]
+    details = make_mistake(true_details, mistake) if model_name == GEMINI_FAST_MODEL_NAME and mistake \
+        else true_details
+    base, per_item = (FAST_SECONDS, FAST_SECONDS_PER_ITEM) if model_name == GEMINI_FAST_MODEL_NAME \
+        else (STRONG_SECONDS, STRONG_SECONDS_PER_ITEM)
+    time.sleep(base + per_item * len(details["line_items"]))
+    return json.dumps(details)
+
+
+def generate_documents(count, hard_share, seed=7):
+    """(text, is_invoice, document id) of count documents, an invoice and its bills at a time."""
+    rng = random.Random(seed)
+    documents = []
+    while len(documents) < count:
+        invoice = generate_invoice(line_items=rng.randint(3, 40), seed=len(documents) + seed)
+        for details, is_invoice in [(invoice, True)] + [(bill, False) for bill in generate_bills(invoice, 3, seed)]:
+            document_id = "D{}".format(len(documents))
+            mistake = None
+            if rng.random() < hard_share:
+                mistake = "misread_description" if rng.random() < SILENT_MISTAKE_SHARE else \
+                    rng.choice(("dropped_item", "missing_total", "misread_tax"))
+            _documents[document_id] = (details, mistake)
+            lines = invoice_text(details) if is_invoice else bill_text(details)
+            documents.append(("\n".join(["Document: {}".format(document_id)] + lines), is_invoice, document_id))
+    return documents[:count]
+
+
+def is_correct(details, document_id):
+    true_details = _documents[document_id][0]
+    return all(details.get(field) == value for field, value in true_details.items())
+
+
+def run(documents, extract):
+    latencies, correct = [], 0
+    for text, is_invoice, document_id in documents:
+        started = time.perf_counter()
+        details = extract(text, is_invoice)
+        latencies.append(time.perf_counter() - started)
+        correct += is_correct(details, document_id)
+    latencies.sort()
+    return "median {:.0f} ms, p95 {:.0f} ms, {}/{} correct".format(
+        statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.95)] * 1000, correct, len(documents))
+
+
+def main(count, hard_share):
+    set_llm_gateway(LLMGateway(FakeBackend(fake_models), requests_per_minute=10 ** 6, tokens_per_minute=10 ** 9))
+    documents = generate_documents(count, hard_share)
+    print("{} documents, {:.0%} hard".format(len(documents), hard_share))
+    print("  strong model only: " + run(documents, lambda text, is_invoice: extract_document(
+        text, is_invoice, gemini_model_name)))
+    print("  routed:            " + run(documents, lambda text, is_invoice: route_extraction(
+        lambda model_name: extract_document(text, is_invoice, model_name), is_invoice)))
+    stats = get_model_routing_stats()
+    print("  escalation rate {:.1%}, failed checks {}".format(stats["escalation_rate"], stats["failed_checks"]))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200, float(sys.argv[2]) if len(sys.argv) > 2 else 0.2)
@@ -0,0 +1,50 @@
+"""
+Filename: bench_startup.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Reports the import time and resident memory of config.config with lazy
+             providers, and with every provider built eagerly as before.
+
+Usage: python -m benchmarks.bench_startup [runs]
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+
+# Runs in a fresh interpreter so that nothing is imported beforehand
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import config.config as config
+if sys.argv[1] == "eager":
+    for name in ("gemini", "openai_client", "openai_embeddings", "openai_llm", "pinecone"):
+        try:
+            config.get_provider(name)
+        except Exception as e:
+            print("skipped {}: {}".format(name, e), file=sys.stderr)
+elapsed = time.perf_counter() - started
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": elapsed, "max_rss_mb": rss_kb / 1024}))
+"""
+
+
+def probe(mode):
+    output = subprocess.run([sys.executable, "-c", PROBE, mode], capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main(runs):
+    for mode, label in (("eager", "before (eager providers)"), ("lazy", "after (lazy providers)")):
+        samples = [probe(mode) for _ in range(runs)]
+        print("{:<26} import {:.3f}s median, max RSS {:.1f} MB".format(
+            label,
+            statistics.median(sample["seconds"] for sample in samples),
+            statistics.median(sample["max_rss_mb"] for sample in samples)
+        ))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
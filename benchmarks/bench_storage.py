@@ -0,0 +1,136 @@
+"""
+Filename: bench_storage.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Measures bulk insert and query throughput of the reconciliation store, and the
+             result row converter against the previous row-by-row implementation.
+
+Usage: python -m benchmarks.bench_storage [bill_rows]
+       Set BENCH_POSTGRES_DSN to run against Postgres as well as SQLite.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from utils.storage import (SQLiteReconciliationStore, PostgresReconciliationStore, convert_sql_results_to_dicts,
+                           iter_result_dicts, RESULT_KEYS)
+
+BILLS_PER_INVOICE = 4
+INVOICES_PER_BATCH = 5000
+
+
+def legacy_convert_sql_results_to_dicts(results):
+    # The converter used before the store rendered dates and flags in SQL
+    invoices = []
+    for result in results:
+        invoice = dict(zip(RESULT_KEYS, result))
+        if isinstance(invoice.get("invoice_date"), date):
+            invoice["invoice_date"] = invoice["invoice_date"].isoformat()
+        if isinstance(invoice.get("invoice_due_date"), date):
+            invoice["invoice_due_date"] = invoice["invoice_due_date"].isoformat()
+        if isinstance(invoice.get("bill_date"), date):
+            invoice["bill_date"] = invoice["bill_date"].isoformat()
+        if isinstance(invoice.get("bill_payment_date"), date):
+            invoice["bill_payment_date"] = invoice["bill_payment_date"].isoformat()
+        if "discrepancies" in invoice and isinstance(invoice["discrepancies"], bool):
+            invoice["discrepancies"] = 'Yes' if invoice["discrepancies"] else 'No'
+        invoices.append(invoice)
+    return invoices
+
+
+def make_entries(count, start, rng):
+    entries = []
+    for number in range(start, start + count):
+        issued = date(2024, 1, 1) + timedelta(days=number % 365)
+        bills = []
+        for bill_number in range(BILLS_PER_INVOICE):
+            amount = rng.randint(100, 100000) / 100
+            bills.append({
+                "bill_number": "B{}-{}".format(number, bill_number), "bill_date": issued.strftime("%m/%d/%Y"),
+                "bill_payment_date": "NA", "bill_paid_by": "Vendor {}".format(number % 50),
+                "bill_subtotal_paid": "${:,.2f}".format(amount), "bill_tax_paid": "$0.00",
+                "bill_total_paid": "${:,.2f}".format(amount)
+            })
+        total = sum(float(bill["bill_total_paid"].strip("$").replace(",", "")) for bill in bills)
+        invoice = {
+            "invoice_number": "INV{}".format(number), "invoice_date": issued.strftime("%m/%d/%Y"),
+            "invoice_due_date": "NA", "invoice_to": "Customer {}".format(number % 100),
+            "contact_number": "NA", "email": "NA", "invoice_subtotal_due": "${:,.2f}".format(total),
+            "invoice_tax_due": "$0.00", "invoice_total_due": "${:,.2f}".format(total)
+        }
+        result = {"discrepancies": "False", "reconciliation_summary": "No discrepancies found.",
+                  "subtotal_difference": "$0.00", "tax_difference": "$0.00", "total_difference": "$0.00"}
+        entries.append({"invoice_details": invoice, "bill_details": bills, "result": result})
+    return entries
+
+
+def bench_store(label, store, bill_rows):
+    rng = random.Random(7)
+    store.create_schema()
+    invoices = bill_rows // BILLS_PER_INVOICE
+    elapsed = 0.0
+    for start in range(0, invoices, INVOICES_PER_BATCH):
+        # Generating the entries is not timed
+        entries = make_entries(min(INVOICES_PER_BATCH, invoices - start), start, rng)
+        started = time.perf_counter()
+        store.save_reconciliations(entries)
+        elapsed += time.perf_counter() - started
+    print("{:<8} insert   {:>9,} bill rows in {:6.2f}s, {:>9,.0f} rows/s".format(
+        label, invoices * BILLS_PER_INVOICE, elapsed, invoices * BILLS_PER_INVOICE / elapsed))
+
+    started = time.perf_counter()
+    count = sum(1 for _ in store.iter_results())
+    elapsed = time.perf_counter() - started
+    print("{:<8} stream   {:>9,} rows in {:6.2f}s, {:>9,.0f} rows/s".format(label, count, elapsed, count / elapsed))
+
+    started = time.perf_counter()
+    pages, after = 0, 0
+    while after is not None and pages < 200:
+        _, after = store.get_results_page(limit=1000, after=after)
+        pages += 1
+    elapsed = time.perf_counter() - started
+    print("{:<8} keyset   {:>9,} pages of 1,000 in {:6.2f}s, {:.2f} ms/page".format(
+        label, pages, elapsed, elapsed / pages * 1000))
+
+    lookups = 1000
+    started = time.perf_counter()
+    for _ in range(lookups):
+        list(store.iter_results(invoice_number="INV{}".format(rng.randrange(invoices))))
+    elapsed = time.perf_counter() - started
+    print("{:<8} lookup   {:>9,} invoice_number queries, {:.3f} ms each".format(label, lookups, elapsed / lookups * 1000))
+
+
+def bench_converter(rows):
+    with_objects = [("INV1", date(2024, 1, 1), None, "ABC", 10, 1, 11, None, "B1", date(2024, 1, 2), None, "X",
+                     10, 1, 11, None, True, "ok", 0, "NA", "NA")] * rows
+    # What the store's queries return: dates and the flag are already rendered by the database
+    rendered = [("INV1", "2024-01-01", None, "ABC", 10, 1, 11, None, "B1", "2024-01-02", None, "X",
+                 10, 1, 11, None, "Yes", "ok", 0, "NA", "NA")] * rows
+    for label, convert, sample in (
+            ("before", legacy_convert_sql_results_to_dicts, with_objects),
+            ("after", convert_sql_results_to_dicts, with_objects),
+            ("store rows", lambda results: list(iter_result_dicts(results, convert=False)), rendered)):
+        started = time.perf_counter()
+        convert(sample)
+        print("converter {:<10} {:>9,} rows in {:.3f}s".format(label, rows, time.perf_counter() - started))
+
+
+def main(bill_rows):
+    with tempfile.TemporaryDirectory() as directory:
+        bench_store("sqlite", SQLiteReconciliationStore(os.path.join(directory, "bench.sqlite3")), bill_rows)
+    dsn = os.environ.get("BENCH_POSTGRES_DSN")
+    if dsn:
+        store = PostgresReconciliationStore(dsn)
+        with store.transaction() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS reconciliations, bills, invoices")
+        bench_store("postgres", store, bill_rows)
+        store.close()
+    bench_converter(min(bill_rows, 1000000))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
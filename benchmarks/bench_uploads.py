@@ -0,0 +1,85 @@
+"""
+Filename: bench_uploads.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Compares peak memory and disk I/O of the old copy-then-reopen upload
+             handling with the spooled uploads in utils.uploads.
+
+Usage: python -m benchmarks.bench_uploads [size_in_kb ...]
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+import utils.uploads as uploads
+
+
+def read_io_counters():
+    """Returns (bytes written, bytes read) by this process, or None where /proc/self/io is missing."""
+    try:
+        with open("/proc/self/io") as io_file:
+            counters = dict(line.split(": ") for line in io_file.read().splitlines())
+        return int(counters["wchar"]), int(counters["rchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def legacy_handling(file, directory):
+    # What save_and_process_file used to do: copy to uploads/<filename>, then reopen it
+    file_path = os.path.join(directory, file.filename)
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    with open(file_path, "rb") as pdf_file:
+        return len(pdf_file.read())
+
+
+def spooled_handling(file, directory):
+    with uploads.spool_upload(file, uploads.new_request_id()) as upload:
+        stream = upload.open_stream()
+        consumed = 0
+        while True:
+            chunk = stream.read(1024 * 1024)
+            if not chunk:
+                break
+            consumed += len(chunk)
+        return consumed
+
+
+def measure(handler, payload, directory):
+    file = SimpleNamespace(filename="invoice.pdf", file=io.BytesIO(payload))
+    io_before = read_io_counters()
+    tracemalloc.start()
+    started = time.perf_counter()
+    handler(file, directory)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    io_after = read_io_counters()
+    result = {"seconds": round(elapsed, 4), "peak_memory_bytes": peak}
+    if io_before and io_after:
+        result["disk_bytes_written"] = io_after[0] - io_before[0]
+        result["disk_bytes_read"] = io_after[1] - io_before[1]
+    return result
+
+
+def main(sizes_kb):
+    directory = tempfile.mkdtemp(prefix="bench-uploads-")
+    uploads.upload_directory_path = directory
+    try:
+        for size_kb in sizes_kb:
+            payload = os.urandom(size_kb * 1024)
+            print("{} KB upload".format(size_kb))
+            print("  before (copy + reopen): {}".format(measure(legacy_handling, payload, directory)))
+            print("  after  (spooled)      : {}".format(measure(spooled_handling, payload, directory)))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [64, 1024, 16 * 1024, 64 * 1024])
@@ -0,0 +1,220 @@
+"""
+Filename: suite.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Microbenchmarks of the CPU-bound stages (PDF text extraction, line item matching,
+             bill aggregation, amount and date parsing, SQL row conversion, reconciliation) on
+             synthetic documents at several scales. Results are written as JSON, and compared
+             against a baseline run to catch regressions.
+
+Usage: python -m benchmarks.suite [--scales small,medium] [--stages parse_date,...] [--repeat 5]
+                                  [--output results.json] [--baseline baseline.json] [--threshold 0.25]
+       Exits with status 1 when a stage is slower than its baseline by more than the threshold.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+from benchmarks.synthetic import generate_invoice, generate_bills, invoice_text, generate_pdf
+from utils import dates
+from utils.general import extract_text_from_pdf, clean_currency, parse_date
+from utils.invoice_processing import (verify_line_items, aggregate_bills_subtotal, aggregate_bills_tax,
+                                      aggregate_bills_total)
+from utils.ledger import MoneyColumn
+from utils.reconciliation import reconcile_amounts
+from utils.storage import convert_sql_results_to_dicts
+
+# Document sizes of each scale; rows is the number of bills, amounts, dates or SQL rows
+SCALES = {
+    "small": {"line_items": 20, "pages": 2, "bills_per_invoice": 4, "rows": 1000},
+    "medium": {"line_items": 200, "pages": 20, "bills_per_invoice": 20, "rows": 10000},
+    "large": {"line_items": 2000, "pages": 100, "bills_per_invoice": 100, "rows": 100000},
+}
+DEFAULT_OUTPUT_DIR = os.path.join(".cache", "benchmarks")
+# Fast stages are called in a loop until one timed run lasts this long, like timeit's autorange
+MIN_RUN_SECONDS = 0.05
+# Slowdowns smaller than this, per call, are timer noise and never reported as regressions
+MIN_REGRESSION_SECONDS = 0.0001
+
+
+def many_bills(rows):
+    """rows bills of one line item each."""
+    return generate_bills(generate_invoice(line_items=rows), bills_per_invoice=rows)
+
+
+def bench_pdf_extraction(scale):
+    pdf = generate_pdf(invoice_text(generate_invoice(scale["line_items"])), pages=scale["pages"])
+    return (lambda: extract_text_from_pdf(io.BytesIO(pdf), max_pages=None, parallel=False)), scale["pages"], "pages"
+
+
+def bench_line_item_matching(scale):
+    invoice = generate_invoice(scale["line_items"])
+    bills = generate_bills(invoice, scale["bills_per_invoice"])
+    return (lambda: verify_line_items(invoice, bills)), scale["line_items"], "line items"
+
+
+def bench_aggregate_bills(scale):
+    bills = many_bills(scale["rows"])
+    return (lambda: (aggregate_bills_subtotal(bills), aggregate_bills_tax(bills), aggregate_bills_total(bills)),
+            len(bills), "bills")
+
+
+def bench_clean_currency(scale):
+    amounts = [bill["bill_total_paid"] for bill in many_bills(scale["rows"])]
+    return (lambda: [clean_currency(amount) for amount in amounts]), len(amounts), "amounts"
+
+
+def bench_money_column(scale):
+    amounts = [bill["bill_total_paid"] for bill in many_bills(scale["rows"])]
+    return (lambda: MoneyColumn.parse(amounts)), len(amounts), "amounts"
+
+
+def bench_parse_date(scale):
+    values = [bill["bill_date"] for bill in many_bills(scale["rows"])]
+
+    def run():
+        # Cold: every run parses each distinct date again
+        dates._parse.cache_clear()
+        return [parse_date(value) for value in values]
+    return run, len(values), "dates"
+
+
+def bench_date_column(scale):
+    values = [bill["bill_date"] for bill in many_bills(scale["rows"])]
+
+    def run():
+        dates._parse.cache_clear()
+        return dates.normalize_date_column(values)
+    return run, len(values), "dates"
+
+
+def bench_convert_sql_results(scale):
+    row = ("INV1", date(2024, 1, 1), None, "ABC", 10, 1, 11, None, "B1", date(2024, 1, 2), None, "X",
+           10, 1, 11, None, True, "ok", 0, "NA", "NA")
+    rows = [row] * scale["rows"]
+    return (lambda: convert_sql_results_to_dicts(rows)), len(rows), "rows"
+
+
+def bench_reconciliation(scale):
+    invoice = generate_invoice(scale["line_items"])
+    bills = generate_bills(invoice, scale["bills_per_invoice"])
+    return (lambda: reconcile_amounts(invoice, bills)), len(bills), "bills"
+
+
+STAGES = {
+    "pdf_extraction": bench_pdf_extraction,
+    "line_item_matching": bench_line_item_matching,
+    "aggregate_bills": bench_aggregate_bills,
+    "clean_currency": bench_clean_currency,
+    "money_column": bench_money_column,
+    "parse_date": bench_parse_date,
+    "date_column": bench_date_column,
+    "convert_sql_results": bench_convert_sql_results,
+    "reconciliation": bench_reconciliation,
+}
+
+
+def _time_calls(run, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        run()
+    return time.perf_counter() - started
+
+
+def measure(run, items, repeat):
+    """
+    Times run after a warm-up, keeping the fastest of repeat timed runs, then traces the
+    allocations of one more call. A timed run calls run as many times as needed to last at
+    least MIN_RUN_SECONDS, the seconds reported are per call.
+    """
+    number = 1
+    while _time_calls(run, number) < MIN_RUN_SECONDS:
+        number *= 2
+    timings = [_time_calls(run, number) / number for _ in range(repeat)]
+    tracemalloc.start()
+    run()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = min(timings)
+    return {
+        "seconds": round(best, 6),
+        "median_seconds": round(statistics.median(timings), 6),
+        "calls_per_run": number,
+        "items": items,
+        "items_per_second": round(items / best, 1) if best else None,
+        "peak_memory_bytes": peak,
+        "retained_memory_bytes": current,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns the stages slower than the baseline by more than threshold (0.25 is 25%), as
+    (key, baseline seconds, seconds) tuples. Stages missing from the baseline are skipped.
+    """
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if not previous or result["seconds"] - previous["seconds"] < MIN_REGRESSION_SECONDS:
+            continue
+        if result["seconds"] > previous["seconds"] * (1 + threshold):
+            regressions.append((key, previous["seconds"], result["seconds"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the CPU-bound stages on synthetic documents.")
+    parser.add_argument("--scales", default="small,medium", help="Comma separated, from: " + ", ".join(SCALES))
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma separated, from: " + ", ".join(STAGES))
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per stage, the fastest one is kept")
+    parser.add_argument("--output", help="Where to write the JSON results, by default under " + DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Largest accepted slowdown against the baseline, 0.25 is 25%%")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for scale_name in args.scales.split(","):
+        scale = SCALES[scale_name]
+        for stage_name in args.stages.split(","):
+            run, items, unit = STAGES[stage_name](scale)
+            key = "{}@{}".format(stage_name, scale_name)
+            results[key] = dict(measure(run, items, args.repeat), unit=unit, scale=scale)
+            print("{:<32} {:>10.4f}s {:>14,.0f} {}/s  peak {:>12,} bytes".format(
+                key, results[key]["seconds"], results[key]["items_per_second"] or 0, unit,
+                results[key]["peak_memory_bytes"]))
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print("Results written to {}".format(output))
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for key, before, after in regressions:
+            print("REGRESSION {}: {:.4f}s -> {:.4f}s (+{:.0%})".format(key, before, after, after / before - 1))
+        if regressions:
+            return 1
+        print("No stage regressed by more than {:.0%}".format(args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Filename: synthetic.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Generators of synthetic invoices, bills, their text and multi-page PDFs for the benchmarks.
+             Everything is seeded, so two runs of a benchmark see the same documents.
+"""
+
+import random
+from datetime import date, timedelta
+
+WORDS = ["foundation", "labor", "pcc", "steel", "concrete", "transport", "materials", "excavation",
+         "formwork", "plumbing", "electrical", "paint", "tiles", "roofing", "scaffold", "crane"]
+DATE_LAYOUTS = ("%m/%d/%Y", "%d/%m/%Y", "%Y-%m-%d", "%d %b %Y")
+# Text lines that fit on a Letter page at the font size used by generate_pdf
+LINES_PER_PAGE = 60
+
+
+def money(cents):
+    return "${:,}.{:02d}".format(cents // 100, cents % 100)
+
+
+def generate_invoice(line_items=20, seed=7):
+    """An extracted invoice with line_items items, in the shape the extraction prompts return."""
+    rng = random.Random(seed)
+    issued = date(2024, 1, 1) + timedelta(days=rng.randrange(365))
+    items = []
+    subtotal = 0
+    for position in range(line_items):
+        quantity = rng.randint(1, 40)
+        rate = rng.randint(500, 50000)
+        subtotal += quantity * rate
+        items.append({
+            "description": "{} {} {}".format(rng.choice(WORDS), rng.choice(WORDS), position),
+            "hrs_or_quantity": str(quantity), "rate_or_cost": money(rate), "line_total": money(quantity * rate)
+        })
+    tax = subtotal // 10
+    return {
+        "invoice_number": "INV{:06d}".format(seed), "invoice_date": issued.strftime("%m/%d/%Y"),
+        "invoice_due_date": (issued + timedelta(days=30)).strftime("%m/%d/%Y"),
+        "invoice_to": "Customer {}".format(seed % 100), "contact_number": "555{:07d}".format(seed),
+        "email": "billing{}@example.com".format(seed), "invoice_subtotal_due": money(subtotal),
+        "invoice_tax_due": money(tax), "invoice_total_due": money(subtotal + tax), "line_items": items
+    }
+
+
+def generate_bills(invoice, bills_per_invoice=4, seed=7):
+    """Bills paying invoice: its line items dealt out between the bills, amounts adding up exactly."""
+    rng = random.Random(seed)
+    bills = [{"line_items": []} for _ in range(bills_per_invoice)]
+    for item in invoice["line_items"]:
+        rng.choice(bills)["line_items"].append({"description": item["description"], "amount": item["line_total"]})
+    issued = date(2024, 1, 1) + timedelta(days=rng.randrange(365))
+    for number, bill in enumerate(bills):
+        subtotal = sum(int(item["amount"].strip("$").replace(",", "").replace(".", "")) for item in bill["line_items"])
+        tax = subtotal // 10
+        bill.update({
+            "bill_number": "B{:06d}-{}".format(seed, number),
+            "bill_date": (issued + timedelta(days=number)).strftime(rng.choice(DATE_LAYOUTS)),
+            "bill_payment_date": "NA", "bill_paid_by": "Customer {}".format(seed % 100),
+            "bill_subtotal_paid": money(subtotal), "bill_tax_paid": money(tax), "bill_total_paid": money(subtotal + tax)
+        })
+    return bills
+
+
+def invoice_text(invoice):
+    """The invoice written out as the lines of a plain text document."""
+    lines = ["INVOICE", "Invoice No: {}".format(invoice["invoice_number"]),
+             "Date: {}".format(invoice["invoice_date"]), "Due Date: {}".format(invoice["invoice_due_date"]),
+             "Bill To: {}".format(invoice["invoice_to"]), "Phone: {}".format(invoice["contact_number"]),
+             "Email: {}".format(invoice["email"]), "", "Description  Qty  Rate  Amount"]
+    lines.extend("{}  {}  {}  {}".format(item["description"], item["hrs_or_quantity"], item["rate_or_cost"],
+                                         item["line_total"]) for item in invoice["line_items"])
+    lines.extend(["", "Subtotal {}".format(invoice["invoice_subtotal_due"]),
+                  "Tax {}".format(invoice["invoice_tax_due"]), "Total {}".format(invoice["invoice_total_due"])])
+    return lines
+
+
+def bill_text(bill):
+    lines = ["RECEIPT", "Bill No: {}".format(bill["bill_number"]), "Date: {}".format(bill["bill_date"]),
+             "Paid By: {}".format(bill["bill_paid_by"]), "", "Description  Amount"]
+    lines.extend("{}  {}".format(item["description"], item["amount"]) for item in bill["line_items"])
+    lines.extend(["", "Subtotal {}".format(bill["bill_subtotal_paid"]), "Tax {}".format(bill["bill_tax_paid"]),
+                  "Total {}".format(bill["bill_total_paid"])])
+    return lines
+
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def generate_pdf(lines, pages=None):
+    """
+    A PDF with a Helvetica text layer, LINES_PER_PAGE lines per page. With pages, the lines are
+    repeated until the document has that many pages.
+
+    Returns:
+        bytes: The PDF file.
+    """
+    lines = list(lines) or [""]
+    if pages:
+        lines = (lines * (pages * LINES_PER_PAGE // len(lines) + 1))[:pages * LINES_PER_PAGE]
+    page_lines = [lines[start:start + LINES_PER_PAGE] for start in range(0, len(lines), LINES_PER_PAGE)]
+
+    # 1: catalog, 2: page tree, 3: font, then a page and its content stream per page
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text_lines in page_lines:
+        page_number, content_number = len(objects) + 1, len(objects) + 2
+        kids.append("{} 0 R".format(page_number))
+        stream = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(
+            "{} Tj T*".format(_pdf_string(line)) for line in text_lines) + " ET"
+        stream = stream.encode("latin-1", errors="replace")
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+                       "/Contents {} 0 R >>".format(content_number).encode("ascii"))
+        objects.append(b"<< /Length " + str(len(stream)).encode("ascii") + b" >>\nstream\n" + stream +
+                       b"\nendstream")
+    objects[1] = "<< /Type /Pages /Kids [{}] /Count {} >>".format(" ".join(kids), len(kids)).encode("ascii")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += "{} 0 obj\n".format(number).encode("ascii") + body + b"\nendobj\n"
+    xref = len(output)
+    output += "xref\n0 {}\n0000000000 65535 f \n".format(len(objects) + 1).encode("ascii")
+    output += b"".join("{:010d} 00000 n \n".format(offset).encode("ascii") for offset in offsets)
+    output += "trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(len(objects) + 1, xref).encode("ascii")
+    return bytes(output)
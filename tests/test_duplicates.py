@@ -0,0 +1,56 @@
+"""
+Filename: test_duplicates.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Tests of the duplicate bill index, on the text of a sample bill in uploads.
+"""
+
+import hashlib
+from pathlib import Path
+from utils.general import extract_text_from_pdf
+from utils.duplicates import BillFingerprintIndex, bill_fingerprint
+
+UPLOADS = Path(__file__).resolve().parent.parent / "uploads"
+
+BILL_LABOR_DETAILS = {"bill_number": "99015", "bill_date": "6/27/2024", "bill_paid_by": "JP Constructions",
+                      "bill_total_paid": "$10,880.00"}
+
+
+def fingerprint(details, text):
+    return bill_fingerprint(details, hashlib.sha256(text.encode("utf-8")).hexdigest(), text)
+
+
+def test_recurring_bill_with_its_own_number_is_not_a_duplicate(tmp_path):
+    index = BillFingerprintIndex(tmp_path / "index.sqlite3")
+    text = extract_text_from_pdf(str(UPLOADS / "Bill_Labor.pdf"))
+    index.check_and_add(fingerprint(BILL_LABOR_DETAILS, text))
+    # Next month's bill of the same vendor, same work, same total
+    next_text = text.replace("99015", "99115").replace("6/27/2024", "7/27/2024").replace("6/29/2024", "7/29/2024")
+    next_details = dict(BILL_LABOR_DETAILS, bill_number="99115", bill_date="7/27/2024")
+
+    assert index.check_and_add(fingerprint(next_details, next_text)) == []
+
+
+def test_edited_resubmission_is_a_near_duplicate(tmp_path):
+    index = BillFingerprintIndex(tmp_path / "index.sqlite3")
+    text = extract_text_from_pdf(str(UPLOADS / "Bill_Labor.pdf"))
+    index.check_and_add(fingerprint({}, text))
+    edited = text.replace("Foundation Labor 1800", "Foundation Labour 1800")
+
+    candidates = index.check_and_add(fingerprint({}, edited))
+
+    assert [candidate["reason"] for candidate in candidates] == ["near_duplicate"]
+    assert candidates[0]["similarity"] >= 0.8
+
+
+def test_edited_resubmission_with_the_same_number_is_flagged_as_such(tmp_path):
+    index = BillFingerprintIndex(tmp_path / "index.sqlite3")
+    text = extract_text_from_pdf(str(UPLOADS / "Bill_Labor.pdf"))
+    index.check_and_add(fingerprint(BILL_LABOR_DETAILS, text))
+    edited = text.replace("Foundation Labor 1800", "Foundation Labour 1800")
+
+    candidates = index.check_and_add(fingerprint(BILL_LABOR_DETAILS, edited))
+
+    assert candidates[0]["reason"] == "same_bill"
+    assert candidates[0]["bill_number"] == "99015"
@@ -0,0 +1,48 @@
+"""
+Filename: test_json_repair.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Tests of the tolerant parsing of model replies.
+"""
+
+import pytest
+from utils.json_repair import parse_json_lenient, parse_llm_json, JSONRepairError
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"bill_number": "99015"}', {"bill_number": "99015"}),
+    ('```json\n{"a": [1, 2,], "b": true,}\n```', {"a": [1, 2], "b": True}),
+    ("{'a': 'it\\'s', 'b': None, 'c': False}", {"a": "it's", "b": None, "c": False}),
+    ('Here is the JSON: {"a": 1.5, "b": -2}', {"a": 1.5, "b": -2}),
+    ('{"items": { {"d": "PCC"}, {"d": "Sand"} }}', {"items": [{"d": "PCC"}, {"d": "Sand"}]}),
+    ('{"a": "x"]', {"a": "x"}),
+    ('{"a": "line\\nbreak \\u00e9"}', {"a": "line\nbreak é"}),
+])
+def test_repairs(text, expected):
+    assert parse_json_lenient(text) == (expected, True)
+
+
+def test_value_cut_off_inside_a_string_is_left_out():
+    assert parse_json_lenient('{"bill_number": "99015", "bill_total_paid": "$10,8') == \
+        ({"bill_number": "99015"}, False)
+    assert parse_llm_json('{"bill_total_paid": "$10,8') == {}
+
+
+def test_bare_value_cut_off_is_left_out():
+    assert parse_json_lenient('{"a": 1, "b": 10') == ({"a": 1}, False)
+
+
+def test_key_cut_off_is_left_out():
+    assert parse_json_lenient('{"a": "x", "bill_to') == ({"a": "x"}, False)
+
+
+def test_line_item_cut_off_is_left_out():
+    text = '{"line_items": [{"description": "PCC", "amount": "1,170"}, {"description": "Sand", "amo'
+
+    assert parse_json_lenient(text) == ({"line_items": [{"description": "PCC", "amount": "1,170"}]}, False)
+
+
+def test_text_without_json_raises():
+    with pytest.raises(JSONRepairError):
+        parse_json_lenient("The bill could not be read.")
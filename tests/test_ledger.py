@@ -0,0 +1,99 @@
+"""
+Filename: test_ledger.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Tests of the money parsing and of the columns of amounts in integer cents.
+"""
+
+from decimal import Decimal
+import pytest
+from utils.general import parse_amount
+from utils.ledger import parse_money, format_cents, decimal_mark_of, MoneyColumn, BillLedger
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("$1,234.50", (123450, "USD")),
+    ("1234.5", (123450, None)),
+    ("$.50", (50, "USD")),
+    ("$ .50", (50, "USD")),
+    (".5", (50, None)),
+    ("1.234,50 €", (123450, "EUR")),
+    ("EUR 12", (1200, "EUR")),
+    ("12 USD", (1200, "USD")),
+    ("(45.00)", (-4500, None)),
+    ("-$1,234.50", (-123450, "USD")),
+    ("$-5", (-500, "USD")),
+    ("₹1,23,456", (12345600, "INR")),
+    ("Rs.500", (50000, "INR")),
+    ("500 Fr.", (50000, "CHF")),
+    ("CHF 1'234.50", (123450, "CHF")),
+    ("1 234,50 zł", (123450, "PLN")),
+    ("90.625", (9062, None)),
+    ("1,170", (117000, None)),
+    (12, (1200, None)),
+    (12.345, (1234, None)),
+    (Decimal("0.015"), (2, None)),
+])
+def test_parse_money(value, expected):
+    assert parse_money(value) == expected
+
+
+@pytest.mark.parametrize("value", [None, "", "NA", "abc", "$ abc", "(45.00", "12 XYZ1", True])
+def test_unparsable_values_are_zero(value):
+    assert parse_money(value) == (0, None)
+
+
+def test_ambiguous_numbers_follow_the_given_decimal_mark():
+    assert decimal_mark_of("1,234") is None
+    assert parse_money("1,234") == (123400, None)
+    assert parse_money("1,234", ",") == (123, None)
+    assert parse_money("1.234,5", ".") == (123450, None)
+
+
+def test_parse_amount_keeps_the_cents_of_amounts_without_a_whole_part():
+    assert parse_amount("$.50") == Decimal("0.50")
+    assert parse_amount("NA") == Decimal("0.00")
+
+
+def test_format_cents():
+    assert format_cents(-123450, "USD") == "-$1,234.50"
+    assert format_cents(1200, "CHF") == "CHF 12.00"
+    assert format_cents(5, "EUR") == "€0.05"
+
+
+def test_uniform_column_is_parsed_in_bulk():
+    column = MoneyColumn.parse(["$1,234.50", "$99.00", "$0.50"])
+
+    assert list(column.cents) == [123450, 9900, 50]
+    assert column.currencies() == ["USD"]
+    assert column.format_all() == ["$1,234.50", "$99.00", "$0.50"]
+
+
+def test_mixed_column_matches_parse_money():
+    values = ["$1,234.50", "1.234,50 €", "NA", None, "(45.00)", "$.50", "EUR 12", "$1,234.50"]
+    column = MoneyColumn.parse(values)
+
+    assert [(column.cents[i], column.currency(i)) for i in range(len(values))] == \
+        [parse_money(value) for value in values]
+    assert column.total() == sum(parse_money(value)[0] for value in values)
+    assert column.currencies() == ["USD", "EUR"]
+
+
+def test_column_decides_ambiguous_decimal_marks():
+    column = MoneyColumn.parse(["1.234,50", "99,00", "1,234"])
+
+    assert list(column.cents) == [123450, 9900, 123]
+
+
+def test_bill_ledger_totals():
+    ledger = BillLedger([
+        {"bill_subtotal_paid": "$10,240", "bill_tax_paid": "$640", "bill_total_paid": "$10,880"},
+        {"bill_subtotal_paid": "$14,040", "bill_tax_paid": "$877.50", "bill_total_paid": "NA"},
+    ])
+
+    assert len(ledger) == 2
+    assert ledger.total("bill_subtotal_paid") == 2428000
+    assert ledger.total("bill_tax_paid") == 151750
+    assert ledger.total("bill_total_paid") == 1088000
+    assert ledger.format_all("bill_tax_paid") == ["$640.00", "$877.50"]
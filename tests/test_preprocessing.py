@@ -0,0 +1,88 @@
+"""
+Filename: test_preprocessing.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Tests of the preprocessing of extracted text, on the text of the sample documents in uploads.
+"""
+
+from pathlib import Path
+from utils.general import extract_text_from_pdf
+from utils.preprocessing import preprocess_document_text, line_priority
+
+UPLOADS = Path(__file__).resolve().parent.parent / "uploads"
+
+
+def document_lines(name):
+    return extract_text_from_pdf(str(UPLOADS / name)).splitlines()
+
+
+def preprocessed_lines(lines):
+    return preprocess_document_text("\n".join(lines), token_budget=0)[0].splitlines()
+
+
+def test_terms_on_a_line_with_text_keep_the_document():
+    lines = document_lines("InvoiceDocument.pdf")
+    lines.insert(1, "Terms and Conditions: Net 30")
+
+    kept = preprocessed_lines(lines)
+
+    for line in ("Invoice Number 10026", "Mr. Jane Doe", "Jash Enterprises", "PCC 15 78.00 1,170.00",
+                 "Consultation with Architects 1 1,000.00 1,000.00", "Subtotal $25,630.00"):
+        assert any(line in kept_line for kept_line in kept), line
+
+
+def test_boilerplate_block_ends_at_numbers_and_key_terms():
+    lines = document_lines("Bill_Labor.pdf")
+    lines[1:1] = ["Terms and Conditions", "Goods remain ours until settled in full.",
+                  "Disputes are settled in Hamilton courts."]
+
+    kept = preprocessed_lines(lines)
+
+    assert "Goods remain ours until settled in full." not in kept
+    assert "Disputes are settled in Hamilton courts." not in kept
+    assert "Beta Suppliers Bill Date 6/27/2024" in kept
+    assert "Paid By" in kept
+    assert "Foundation Labor 1800" in kept
+
+
+def test_boilerplate_block_is_capped():
+    lines = document_lines("Bill_Services.pdf")
+    lines[1:1] = ["Disclaimer"] + ["Prose line {}".format(word) for word in "abcdefgh"]
+
+    kept = preprocessed_lines(lines)
+
+    assert "Prose line a" not in kept
+    assert "Prose line h" in kept
+    assert "Transportation of Materials 450" in kept
+
+
+def test_repeated_rows_with_numbers_are_kept():
+    lines = document_lines("Bill_Materials.pdf")
+    position = lines.index("PCC 1,170")
+    lines.insert(position, "PCC 1,170")
+    lines[position:position] = ["PCC 15 78 1170", "PCC 15 78 1170", "Header", "Header"]
+
+    kept = preprocessed_lines(lines)
+
+    assert kept.count("PCC 1,170") == 2
+    assert kept.count("PCC 15 78 1170") == 2
+    assert kept.count("Header") == 1
+
+
+def test_rows_repeated_on_every_page_are_kept_when_they_have_numbers():
+    pages = ["\n".join(document_lines("Bill_Services.pdf") + ["Consultation fee 100"]) for _ in range(3)]
+
+    kept = preprocess_document_text("\f".join(pages), token_budget=0)[0]
+
+    assert kept.count("Consultation fee 100") == 3
+    assert kept.count("Paid By") == 1
+
+
+def test_amounts_without_cents_have_top_priority():
+    assert line_priority("PCC 1,170") == 2
+    assert line_priority("Foundation Labor 1800") == 2
+    assert line_priority("Subtotal $25,630.00") == 2
+    assert line_priority("Beta Suppliers Bill Date 6/27/2024") == 1
+    assert line_priority("Goods remain ours until paid in full.") == 1
+    assert line_priority("Jash Enterprises") == 0
@@ -0,0 +1,81 @@
+"""
+Filename: test_semantic_matching.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Tests of the semantic line item matching, on the local hashing embedder so that no
+             network is needed.
+"""
+
+import numpy as np
+from utils.embeddings import HashingEmbedder, assign_one_to_one, embed_texts
+from utils.matching import SemanticLineItemIndex, match_line_items
+
+
+class CountingEmbedder(HashingEmbedder):
+    """A hashing embedder that records the texts it embeds, under a name of its own in the cache."""
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded.extend(texts)
+        return super().embed(texts)
+
+
+def test_spelling_variants_match_semantically():
+    invoice_items = [{"description": "Foundation Labor", "line_total": "$500.00"},
+                     {"description": "Roof tiles", "line_total": "$300.00"}]
+    bill_items = [{"description": "Foundation labour", "amount": "$500.00"}]
+    index = SemanticLineItemIndex(invoice_items, embedder=HashingEmbedder())
+    index.prepare(bill_items)
+
+    matched, mismatched = match_line_items(None, bill_items, index)
+
+    assert not mismatched
+    assert matched[0]["invoice_description"] == "Foundation Labor"
+    assert matched[0]["match_type"] == "semantic"
+
+
+def test_assignment_is_one_to_one():
+    # Both queries are closest to column 0, only the more similar one gets it
+    similarities = np.array([[0.95, 0.1], [0.9, 0.8]], dtype=np.float32)
+
+    pairs = assign_one_to_one(similarities, 0.7)
+
+    assert sorted((row, column) for row, column, _ in pairs) == [(0, 0), (1, 1)]
+
+
+def test_competing_bill_items_share_no_invoice_item():
+    invoice_items = [{"description": "Foundation Labor", "line_total": "$500.00"}]
+    bill_items = [{"description": "Foundation labour", "amount": "$500.00"},
+                  {"description": "Foundation labours", "amount": "$500.00"}]
+    index = SemanticLineItemIndex(invoice_items, embedder=HashingEmbedder())
+    index.prepare(bill_items)
+
+    assert sum(len(assigned) for assigned in index.assigned.values()) == 1
+
+
+def test_pairs_below_the_threshold_stay_unmatched():
+    similarities = np.array([[0.69, 0.2]], dtype=np.float32)
+    assert assign_one_to_one(similarities, 0.7) == []
+
+    invoice_items = [{"description": "Plumbing fixtures", "line_total": "$120.00"}]
+    bill_items = [{"description": "Cement bags", "amount": "$120.00"}]
+    index = SemanticLineItemIndex(invoice_items, embedder=HashingEmbedder())
+    index.prepare(bill_items)
+    assert not index.assigned
+
+
+def test_cached_embeddings_are_not_embedded_again():
+    embedder = CountingEmbedder("counting-test")
+    first = embed_texts(["foundation labour", "roof tiles", "foundation labour"], embedder)
+    assert embedder.embedded == ["foundation labour", "roof tiles"]
+
+    second = embed_texts(["roof tiles", "foundation labour", "window frames"], embedder)
+
+    assert embedder.embedded == ["foundation labour", "roof tiles", "window frames"]
+    assert np.array_equal(second[0], first[1])
+    assert np.array_equal(second[1], first[0])
@@ -0,0 +1,61 @@
+"""
+Filename: test_templates.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Tests of the bill layout templates, learned from and applied to the sample bills in uploads.
+"""
+
+from pathlib import Path
+from utils.general import extract_text_from_pdf
+from utils.preprocessing import preprocess_document_text
+from utils.templates import TemplateExtractor, TemplateStore, check_bill_arithmetic
+
+UPLOADS = Path(__file__).resolve().parent.parent / "uploads"
+
+BILL_LABOR_DETAILS = {
+    "bill_number": "99015", "bill_date": "6/27/2024", "bill_payment_date": "6/29/2024",
+    "bill_paid_by": "JP Constructions", "bill_subtotal_paid": "$10,240.00", "bill_tax_paid": "$640.00",
+    "bill_total_paid": "$10,880.00",
+    "line_items": [
+        {"description": "Marking of foundation layout at site", "amount": "$400.00"},
+        {"description": "Foundation Labor", "amount": "$1,800.00"},
+        {"description": "Placing of PCC Labor", "amount": "$2,100.00"},
+        {"description": "Placement of Reinforcement Steel", "amount": "$4,560.00"},
+        {"description": "Excavation Machine Labor", "amount": "$1,380.00"},
+    ]
+}
+
+
+def bill_text(name):
+    return preprocess_document_text(extract_text_from_pdf(str(UPLOADS / name)))[0]
+
+
+def test_template_learned_from_one_bill_extracts_another(tmp_path):
+    extractor = TemplateExtractor(TemplateStore(tmp_path))
+    assert extractor.learn(bill_text("Bill_Labor.pdf"), BILL_LABOR_DETAILS)
+
+    details = extractor.extract(bill_text("Bill_Materials.pdf"))
+
+    assert details is not None
+    assert details["bill_number"] == "99016"
+    assert details["bill_date"] == "6/30/2024"
+    assert details["bill_paid_by"] == "JP Constructions"
+    assert details["bill_total_paid"] == "14,918"
+    assert [item["description"] for item in details["line_items"]] == \
+        ["PCC", "Reinforcement Steel", "Concrete Formworks for Footings"]
+    assert extractor.get_stats()["hits"] == 1
+
+
+def test_template_rejects_a_bill_whose_amounts_do_not_add_up(tmp_path):
+    extractor = TemplateExtractor(TemplateStore(tmp_path))
+    extractor.learn(bill_text("Bill_Labor.pdf"), BILL_LABOR_DETAILS)
+
+    assert extractor.extract(bill_text("Bill_Materials.pdf").replace("14,918", "14,968")) is None
+
+
+def test_total_without_cents_may_be_rounded_to_the_unit():
+    details = {"bill_subtotal_paid": "1,450", "bill_tax_paid": "90.625", "line_items": []}
+    assert check_bill_arithmetic(dict(details, bill_total_paid="1,541"))
+    assert not check_bill_arithmetic(dict(details, bill_total_paid="1,541.00"))
+    assert not check_bill_arithmetic(dict(details, bill_total_paid="1,542"))
@@ -0,0 +1,223 @@
+"""
+Filename: assignment.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Assigns a pool of unpaired bills to the invoices they pay.
+"""
+
+import re
+from datetime import timedelta
+from utils.dates import parse_date, document_day_first
+from utils.ledger import parse_money
+from config.config import RECONCILIATION_TOLERANCE
+
+# Bills may be dated a little before the invoice, e.g. advance payments
+DATE_SLACK_BEFORE_INVOICE = timedelta(days=30)
+# Bills paid this long after the due date are not considered for an invoice
+DATE_GRACE_AFTER_DUE = timedelta(days=180)
+# Largest number of candidate bills handed to the amount-sum solver for one invoice
+MAX_SUBSET_CANDIDATES = 24
+# Largest number of partial sums tracked by the solver for one invoice
+MAX_SUBSET_STATES = 200000
+# Smallest party/date score for a leftover bill to be assigned to an invoice
+MIN_ASSIGNMENT_SCORE = 0.5
+
+# Words that do not help telling two parties apart
+PARTY_STOP_WORDS = {"inc", "ltd", "llc", "llp", "corp", "corporation", "co", "company", "limited",
+                    "pvt", "private", "the", "and", "mr", "mrs", "ms", "dr", "enterprises"}
+
+_non_alphanumeric = re.compile(r"[^0-9A-Za-z]+")
+
+
+def normalize_reference(value):
+    """Uppercases a document number and drops everything but letters and digits."""
+    if not value or value == "NA":
+        return ""
+    return _non_alphanumeric.sub("", str(value)).upper()
+
+
+def party_tokens(value):
+    if not value or value == "NA":
+        return frozenset()
+    tokens = _non_alphanumeric.sub(" ", str(value).lower()).split()
+    return frozenset(token for token in tokens if token not in PARTY_STOP_WORDS)
+
+
+def to_cents(value):
+    return parse_money(value)[0]
+
+
+class _Invoice:
+    def __init__(self, details):
+        self.reference = normalize_reference(details.get('invoice_number'))
+        self.party = party_tokens(details.get('invoice_to'))
+        day_first = document_day_first(details, True)
+        self.date = parse_date(details.get('invoice_date'), day_first)
+        self.due_date = parse_date(details.get('invoice_due_date'), day_first)
+        self.total_cents = to_cents(details.get('invoice_total_due'))
+
+
+class _Bill:
+    def __init__(self, details):
+        self.reference = normalize_reference(details.get('bill_number'))
+        line_items = details.get('line_items') or []
+        if isinstance(line_items, dict):
+            line_items = list(line_items.values())
+        # Bills often quote the invoice they pay in a line item description
+        self.text = " ".join(normalize_reference(item.get('description')) for item in line_items
+                             if isinstance(item, dict))
+        self.party = party_tokens(details.get('bill_paid_by'))
+        day_first = document_day_first(details, False)
+        self.date = (parse_date(details.get('bill_payment_date'), day_first)
+                     or parse_date(details.get('bill_date'), day_first))
+        self.total_cents = to_cents(details.get('bill_total_paid'))
+
+
+def references_match(invoice, bill):
+    """True when the bill quotes the invoice number, in its bill number or in a line item."""
+    if len(invoice.reference) < 3:
+        return False
+    return invoice.reference == bill.reference or invoice.reference in bill.text
+
+
+def party_score(invoice, bill):
+    """Jaccard similarity of the payer names, or None when either name is unknown."""
+    if not invoice.party or not bill.party:
+        return None
+    return len(invoice.party & bill.party) / len(invoice.party | bill.party)
+
+
+def dates_compatible(invoice, bill):
+    if invoice.date is None or bill.date is None:
+        return True
+    if bill.date < invoice.date - DATE_SLACK_BEFORE_INVOICE:
+        return False
+    latest = (invoice.due_date or invoice.date) + DATE_GRACE_AFTER_DUE
+    return bill.date <= latest
+
+
+def assignment_score(invoice, bill):
+    """Scores how plausible it is that a bill pays an invoice, from 0 to 1, using party and date."""
+    if not dates_compatible(invoice, bill):
+        return 0.0
+    party = party_score(invoice, bill)
+    score = 0.5 if party is None else party
+    if invoice.date is not None and bill.date is not None:
+        score += 0.25
+    return min(score, 1.0)
+
+
+def find_subset_with_sum(candidates, target_cents, tolerance_cents, max_states=MAX_SUBSET_STATES):
+    """
+    Finds a subset of candidates whose amounts add up to the target, within the tolerance.
+
+    Dynamic programming over reachable sums in cents. Candidates are tried in the order
+    given, so put the most plausible ones first.
+
+    Args:
+        candidates (list): (key, amount in cents) pairs.
+        target_cents (int): The amount to reach.
+        tolerance_cents (int): Largest accepted difference from the target.
+        max_states (int): Stops exploring once this many partial sums are tracked.
+
+    Returns:
+        list: The keys of the subset, or None when no subset was found.
+    """
+    if target_cents <= 0:
+        return None
+    reachable = {0: ()}
+    for key, amount in candidates:
+        if amount <= 0:
+            continue
+        additions = {}
+        for total, keys in reachable.items():
+            new_total = total + amount
+            if new_total > target_cents + tolerance_cents or new_total in reachable or new_total in additions:
+                continue
+            new_keys = keys + (key,)
+            if abs(new_total - target_cents) <= tolerance_cents:
+                return list(new_keys)
+            additions[new_total] = new_keys
+        if len(reachable) + len(additions) > max_states:
+            break
+        reachable.update(additions)
+    return None
+
+
+def assign_bills_to_invoices(invoice_details_list, bill_details_list, tolerance=RECONCILIATION_TOLERANCE):
+    """
+    Assigns each bill of a pool to the invoice it pays.
+
+    Bills are assigned in three passes:
+    1. Reference: the bill quotes exactly one invoice number.
+    2. Amount sum: for each invoice, a subset of the remaining plausible bills whose totals
+       add up to what is still outstanding on the invoice.
+    3. Party and date: a leftover bill goes to the invoice with the best party/date score,
+       if that score reaches MIN_ASSIGNMENT_SCORE.
+
+    Args:
+        invoice_details_list (list): The extracted invoice details.
+        bill_details_list (list): The extracted bill details.
+        tolerance (Decimal): Largest difference accepted by the amount-sum solver.
+
+    Returns:
+        tuple: A list with the bill indexes of each invoice, a dict with the pass that
+        assigned each bill and the sorted indexes of the bills left unassigned.
+    """
+    invoices = [_Invoice(details) for details in invoice_details_list]
+    bills = [_Bill(details) for details in bill_details_list]
+    groups = [[] for _ in invoices]
+    reasons = {}
+    unassigned = set(range(len(bills)))
+    tolerance_cents = int(tolerance * 100)
+
+    def assign(invoice_index, bill_index, reason):
+        groups[invoice_index].append(bill_index)
+        reasons[bill_index] = reason
+        unassigned.discard(bill_index)
+
+    # Pass 1: explicit references
+    invoices_by_reference = {}
+    for invoice_index, invoice in enumerate(invoices):
+        if len(invoice.reference) >= 3:
+            invoices_by_reference.setdefault(invoice.reference, []).append(invoice_index)
+    for bill_index, bill in enumerate(bills):
+        matches = invoices_by_reference.get(bill.reference)
+        if not matches and bill.text:
+            matches = [i for i, invoice in enumerate(invoices) if references_match(invoice, bill)]
+        if len(matches) == 1:
+            assign(matches[0], bill_index, "reference")
+
+    # Pass 2: amount sums, largest invoices first since they have the most combinations
+    for invoice_index in sorted(range(len(invoices)), key=lambda i: -invoices[i].total_cents):
+        invoice = invoices[invoice_index]
+        outstanding = invoice.total_cents - sum(bills[b].total_cents for b in groups[invoice_index])
+        if outstanding <= tolerance_cents:
+            continue
+        scored = []
+        for bill_index in unassigned:
+            score = assignment_score(invoice, bills[bill_index])
+            if score > 0 and 0 < bills[bill_index].total_cents <= outstanding + tolerance_cents:
+                scored.append((score, bill_index))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        candidates = [(bill_index, bills[bill_index].total_cents) for _, bill_index in scored[:MAX_SUBSET_CANDIDATES]]
+        subset = find_subset_with_sum(candidates, outstanding, tolerance_cents)
+        for bill_index in subset or []:
+            assign(invoice_index, bill_index, "amount_sum")
+
+    # Pass 3: leftovers by party and date, only a payer name that actually matches counts
+    for bill_index in sorted(unassigned):
+        best_index, best_score = None, 0.0
+        for invoice_index, invoice in enumerate(invoices):
+            if not party_score(invoice, bills[bill_index]):
+                continue
+            score = assignment_score(invoice, bills[bill_index])
+            if score > best_score:
+                best_index, best_score = invoice_index, score
+        if best_index is not None and best_score >= MIN_ASSIGNMENT_SCORE:
+            assign(best_index, bill_index, "party_date")
+
+    for group in groups:
+        group.sort()
+    return groups, reasons, sorted(unassigned)
@@ -0,0 +1,224 @@
+"""
+Filename: cache.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Content-addressed cache for document extraction results.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from utils.logs import logger
+from config.config import (EXTRACTION_CACHE_MEMORY_ITEMS, EXTRACTION_CACHE_DIR,
+                           EXTRACTION_CACHE_MAX_BYTES, EXTRACTION_CACHE_MAX_AGE_SECONDS)
+
+
+def make_cache_key(content_hash, kind, model_name, prompt_version):
+    """Builds the cache key of an extraction from everything that can change its result."""
+    raw = "{}:{}:{}:{}".format(content_hash, kind, model_name, prompt_version)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory least-recently-used cache."""
+
+    def __init__(self, max_items=256):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DiskCache:
+    """
+    Persistent JSON store, one file per key, with size- and age-based eviction.
+
+    Entries are sharded by the first two characters of the key. Entries older than
+    max_age_seconds are dropped, and the least recently used entries are removed
+    whenever the store grows beyond max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, max_age_seconds=30 * 24 * 3600):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._size = None
+
+    def _path(self, key):
+        return self.directory / key[:2] / (key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            stat = path.stat()
+            if time.time() - stat.st_mtime > self.max_age_seconds:
+                self._remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as cache_file:
+                value = json.load(cache_file)
+            # Touch the entry so that eviction treats it as recently used
+            os.utime(path, (time.time(), stat.st_mtime))
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Dropping unreadable cache entry {}: {}".format(path, e))
+            self._remove(path)
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(value).encode("utf-8")
+        # Write to a temporary file first so that readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def _remove(self, path):
+        try:
+            size = path.stat().st_size
+            path.unlink()
+            if self._size is not None:
+                self._size -= size
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        if not self.directory.exists():
+            return []
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat))
+        return entries
+
+    def _scan_size(self):
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def evict(self):
+        """Removes expired entries, then least recently used ones until the store fits max_bytes."""
+        now = time.time()
+        entries = []
+        total = 0
+        for path, stat in self._entries():
+            if now - stat.st_mtime > self.max_age_seconds:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+
+class ExtractionCache:
+    """Two-tier cache: an in-memory LRU in front of a persistent disk store."""
+
+    def __init__(self, memory_items, directory, max_bytes, max_age_seconds):
+        self.memory = LRUCache(memory_items)
+        self.disk = DiskCache(directory, max_bytes, max_age_seconds)
+        self._stats_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return copy.deepcopy(value)
+        value = self.disk.get(key)
+        if value is not None:
+            self._count("disk_hits")
+            self.memory.put(key, value)
+            return copy.deepcopy(value)
+        self._count("misses")
+        return None
+
+    def put(self, key, value):
+        value = copy.deepcopy(value)
+        self.memory.put(key, value)
+        try:
+            self.disk.put(key, value)
+        except OSError as e:
+            logger.warning("Could not persist extraction cache entry: {}".format(e))
+        self._count("stores")
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        stats["memory_items"] = len(self.memory)
+        return stats
+
+
+_extraction_cache = None
+_extraction_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """Returns the process-wide extraction cache configured from config.config."""
+    global _extraction_cache
+    if _extraction_cache is None:
+        with _extraction_cache_lock:
+            if _extraction_cache is None:
+                _extraction_cache = ExtractionCache(
+                    EXTRACTION_CACHE_MEMORY_ITEMS,
+                    EXTRACTION_CACHE_DIR,
+                    EXTRACTION_CACHE_MAX_BYTES,
+                    EXTRACTION_CACHE_MAX_AGE_SECONDS
+                )
+    return _extraction_cache
@@ -0,0 +1,238 @@
+"""
+Filename: chunked_extraction.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Map-reduce extraction of documents too long for one prompt. The text is split at page
+             and line boundaries into chunks that are extracted in parallel, then the details of
+             the chunks are merged into those of the document.
+"""
+
+import contextvars
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from utils.logs import logger
+from utils.metrics import stage
+from utils.general import PAGE_SEPARATOR
+from utils.llm_gateway import estimate_tokens
+from utils.ledger import parse_money, format_cents, cents_to_decimal
+from utils.matching import normalize_description
+from utils.reconciliation import is_discrepancy
+from utils.schemas import INVOICE_FIELDS, BILL_FIELDS
+from config.config import EXTRACTION_CHUNK_TOKENS, EXTRACTION_CHUNK_OVERLAP_LINES, EXTRACTION_CHUNK_CONCURRENCY
+
+# Taken from the last chunk that has them, documents end with their totals while earlier pages of
+# a statement may carry balances forward. Every other field is taken from the first chunk having it
+LAST_VALUE_FIELDS = frozenset(("invoice_subtotal_due", "invoice_tax_due", "invoice_total_due",
+                               "bill_subtotal_paid", "bill_tax_paid", "bill_total_paid"))
+# Put before the text of every chunk, the prompt is the one of a whole document
+CHUNK_NOTE = "[Part {} of {} of a longer document. Leave out what is not in this part.]"
+MISSING_VALUES = (None, "", "NA")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_chunk_executor():
+    """Returns the thread pool that extracts chunks, separate from the document workers that wait on it."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=EXTRACTION_CHUNK_CONCURRENCY,
+                                               thread_name_prefix="chunk-worker")
+    return _executor
+
+
+def needs_chunking(text, max_tokens=EXTRACTION_CHUNK_TOKENS):
+    return estimate_tokens(text or "") > max_tokens
+
+
+def split_into_chunks(text, max_tokens=EXTRACTION_CHUNK_TOKENS, overlap_lines=EXTRACTION_CHUNK_OVERLAP_LINES,
+                      overlaps=None):
+    """
+    Splits document text into chunks of at most max_tokens.
+
+    A page that fits into a chunk of its own is never split, larger pages are split between
+    lines, so a table row stays whole. Every chunk after the first starts with the last
+    overlap_lines lines of the one before it.
+
+    Args:
+        overlaps (list): Receives the text each chunk starts with that repeats the chunk before
+            it, '' for the first chunk, see merge_line_items.
+
+    Returns:
+        list: The text of each chunk, pages separated by PAGE_SEPARATOR.
+    """
+    chunks = []
+    # The lines of each page of the chunk being filled, its tokens and the lines added after the overlap
+    pages, tokens, added = [[]], 0, 0
+    overlap = []
+
+    def close():
+        nonlocal pages, tokens, added, overlap
+        chunks.append(PAGE_SEPARATOR.join("\n".join(lines) for lines in pages if lines))
+        if overlaps is not None:
+            overlaps.append("\n".join(overlap))
+        overlap = [line for lines in pages for line in lines][-overlap_lines:] if overlap_lines else []
+        pages, tokens, added = [list(overlap)], sum(estimate_tokens(line) for line in overlap), 0
+
+    for page_number, page in enumerate((text or "").split(PAGE_SEPARATOR)):
+        lines = page.split("\n")
+        costs = [estimate_tokens(line) for line in lines]
+        if page_number:
+            if added and tokens + sum(costs) > max_tokens:
+                close()
+            pages.append([])
+        for line, cost in zip(lines, costs):
+            if added and tokens + cost > max_tokens:
+                close()
+            pages[-1].append(line)
+            tokens += cost
+            added += 1
+    if added:
+        close()
+    return chunks
+
+
+def _amount_field(is_invoice):
+    return "line_total" if is_invoice else "amount"
+
+
+def _item_key(item, is_invoice):
+    return normalize_description(item.get("description")), parse_money(item.get(_amount_field(is_invoice)))[0]
+
+
+def _is_partial(item, whole, is_invoice):
+    """Whether item is the start of whole cut off by a chunk edge: no amount and a description whole begins with."""
+    if item.get(_amount_field(is_invoice)) not in MISSING_VALUES:
+        return False
+    description = normalize_description(item.get("description"))
+    return bool(description) and normalize_description(whole.get("description")).startswith(description)
+
+
+def _count_rows(text, key):
+    """The lines of text that have the description and the amount of an item key."""
+    description, cents = key
+    amounts = {"{}.{:02d}".format(abs(cents) // 100, abs(cents) % 100),
+               "{:,}.{:02d}".format(abs(cents) // 100, abs(cents) % 100)}
+    return sum(1 for line in text.replace(PAGE_SEPARATOR, "\n").split("\n")
+               if description in normalize_description(line) and any(amount in line for amount in amounts))
+
+
+def _overlap_item_counts(items, chunk, overlap, is_invoice):
+    """
+    How many items of each key a chunk read from the lines it repeats from the chunk before: the
+    items it has beyond the rows of that item in the rest of its text, at most the rows in the overlap.
+    """
+    counts = Counter(_item_key(item, is_invoice) for item in items)
+    rest = chunk[len(overlap):]
+    return {key: max(0, min(count - _count_rows(rest, key), _count_rows(overlap, key)))
+            for key, count in counts.items() if key[0]}
+
+
+def merge_line_items(item_lists, is_invoice, chunks, overlaps):
+    """
+    Joins the line items of consecutive chunks. At each edge, a last item cut off without its
+    amount is dropped when the next chunk has it whole, and the first items of a chunk that
+    repeat the last ones of the chunk before are dropped when they were read from the
+    overlapping lines. An identical item after the overlap is kept, so is one the model left
+    out of the overlap, and so are repeated items away from the edges.
+
+    Args:
+        item_lists (list): The line items of each chunk.
+        chunks (list): The text of each chunk, see split_into_chunks.
+        overlaps (list): The text each chunk repeats from the one before, see split_into_chunks.
+    """
+    merged = []
+    for items, chunk, overlap in zip(item_lists, chunks, overlaps):
+        items = list(items)
+        if merged and items and _is_partial(merged[-1], items[0], is_invoice):
+            merged.pop()
+        if merged and items and _is_partial(items[0], merged[-1], is_invoice):
+            items.pop(0)
+        if merged and items and overlap:
+            from_overlap = _overlap_item_counts(items, chunk, overlap, is_invoice)
+            repeated = 0
+            for item in items:
+                key = _item_key(item, is_invoice)
+                if not from_overlap.get(key):
+                    break
+                from_overlap[key] -= 1
+                repeated += 1
+            for size in range(min(repeated, len(merged)), 0, -1):
+                if [_item_key(item, is_invoice) for item in merged[-size:]] == \
+                        [_item_key(item, is_invoice) for item in items[:size]]:
+                    items = items[size:]
+                    break
+        merged.extend(items)
+    return merged
+
+
+def merge_fields(chunk_details, is_invoice):
+    """The fields of the document, see LAST_VALUE_FIELDS. A field no chunk has is 'NA'."""
+    merged = {}
+    for field in INVOICE_FIELDS if is_invoice else BILL_FIELDS:
+        values = [details.get(field) for details in chunk_details if details.get(field) not in MISSING_VALUES]
+        if not values:
+            merged[field] = "NA"
+        else:
+            merged[field] = values[-1] if field in LAST_VALUE_FIELDS else values[0]
+    return merged
+
+
+def check_line_item_total(details, is_invoice):
+    """
+    Compares the sum of the line item amounts with the extracted subtotal, a line item lost or
+    counted twice at a chunk edge shows up as a difference.
+
+    Returns:
+        dict: The line item total, the difference and whether it is within RECONCILIATION_TOLERANCE,
+            None when the document has no subtotal.
+    """
+    subtotal_field = "invoice_subtotal_due" if is_invoice else "bill_subtotal_paid"
+    subtotal, currency = parse_money(details.get(subtotal_field))
+    total = sum(parse_money(item.get(_amount_field(is_invoice)))[0] for item in details["line_items"])
+    has_subtotal = details.get(subtotal_field) not in MISSING_VALUES
+    return {
+        "line_items_total": format_cents(total, currency),
+        "subtotal_difference": format_cents(total - subtotal, currency) if has_subtotal else "NA",
+        "matches_subtotal": not is_discrepancy(cents_to_decimal(total - subtotal)) if has_subtotal else None
+    }
+
+
+def extract_in_chunks(text, is_invoice, fetch, max_tokens=EXTRACTION_CHUNK_TOKENS,
+                      overlap_lines=EXTRACTION_CHUNK_OVERLAP_LINES):
+    """
+    Extracts a long document chunk by chunk and merges the results.
+
+    Args:
+        text (str): The prompt text of the document.
+        is_invoice (bool): The kind of document.
+        fetch: The single prompt extraction of that kind, called with the text of each chunk.
+
+    Returns:
+        dict: The details of the document, with a chunked_extraction entry holding the number of
+            chunks and the check of the line items against the subtotal.
+    """
+    overlaps = []
+    chunks = split_into_chunks(text, max_tokens, overlap_lines, overlaps)
+    with stage("chunked_extraction", chunks=len(chunks)):
+        executor = get_chunk_executor()
+        # Each chunk runs in a copy of the caller's context, so its LLM call is part of the request's trace
+        futures = [executor.submit(contextvars.copy_context().run, fetch,
+                                   "{}\n{}".format(CHUNK_NOTE.format(number, len(chunks)), chunk))
+                   for number, chunk in enumerate(chunks, 1)]
+        chunk_details = [future.result() for future in futures]
+
+    details = merge_fields(chunk_details, is_invoice)
+    details["line_items"] = merge_line_items([chunk["line_items"] for chunk in chunk_details], is_invoice,
+                                             chunks, overlaps)
+    check = check_line_item_total(details, is_invoice)
+    details["chunked_extraction"] = dict(chunks=len(chunks), **check)
+    logger.info("Extracted {} line items from {} chunks".format(len(details["line_items"]), len(chunks)))
+    if check["matches_subtotal"] is False:
+        logger.warning("Line items of the chunked extraction add up to {}, {} off the subtotal".format(
+            check["line_items_total"], check["subtotal_difference"]))
+    return details
@@ -0,0 +1,305 @@
+"""
+Filename: dates.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Date parsing with compiled patterns, day/month order inference remembered per party,
+             relative due terms such as "Net 30" and bulk normalisation of date columns.
+"""
+
+import calendar
+import re
+import threading
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from utils.cache import LRUCache
+from config.config import DATE_DAY_FIRST, DATE_ORDER_MEMORY_ITEMS
+
+MONTHS = {name: number for number, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)}
+_month = r"(?P<month_name>jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+# An optional time after the date, e.g. 2024-03-10T14:00:00Z or 03/10/2024 14:00
+_time = r"(?:[t\s,]+\d{1,2}:\d{2}.*)?"
+
+# Year first is read as year-month-day, numbers alone do not say whether the day or the month comes first
+_year_first = re.compile(r"(?P<year>\d{4})(?P<sep>[-/.])(?P<first>\d{1,2})(?P=sep)(?P<second>\d{1,2})" + _time)
+_numeric = re.compile(r"(?P<first>\d{1,2})(?P<sep>[-/.\s])(?P<second>\d{1,2})(?P=sep)(?P<year>\d{4}|\d{2})" + _time)
+_compact = re.compile(r"(?P<year>(?:19|20)\d{2})(?P<first>\d{2})(?P<second>\d{2})")
+_day_month_name = re.compile(r"(?:[a-z]+,?\s+)?(?P<day>\d{1,2})(?:st|nd|rd|th)?[\s\-/.,]*" + _month +
+                             r"[\s\-/.,]*(?P<year>\d{4}|\d{2})" + _time)
+_month_name_day = re.compile(r"(?:[a-z]+,?\s+)?" + _month + r"[\s\-/.,]*(?P<day>\d{1,2})(?:st|nd|rd|th)?,?[\s\-/.,]*"
+                             r"(?P<year>\d{4}|\d{2})" + _time)
+
+# "Net 30", "net30 EOM", "30 days", "due in 15 days", "payable within 45 days of invoice date"
+_net_terms = re.compile(r"\bnet\s*(?P<days>\d{1,3})(?:\s*days?)?(?P<eom>\s*(?:eom|end of month))?\b")
+_day_terms = re.compile(r"^(?:(?:payment\s+)?(?:(?:due|payable)\s+)?(?:in|within)\s+)?(?P<days>\d{1,3})\s*days?\b")
+_on_receipt = re.compile(r"\b(?:due\s+(?:on|upon)\s+receipt|upon\s+receipt|on\s+receipt|immediate(?:ly)?)\b")
+
+DOCUMENT_DATE_FIELDS = {True: ("invoice_date", "invoice_due_date"), False: ("bill_date", "bill_payment_date")}
+DOCUMENT_PARTY_FIELD = {True: "invoice_to", False: "bill_paid_by"}
+
+_non_alphanumeric = re.compile(r"[^0-9a-z]+")
+_date_order_memory = None
+_date_order_memory_lock = threading.Lock()
+
+
+def _full_year(year_text):
+    year = int(year_text)
+    if len(year_text) == 2:
+        year += 2000 if year < 70 else 1900
+    return year
+
+
+def _match(text):
+    """Returns the pattern that matches text and its match, trying the most common layouts first."""
+    for pattern in (_numeric, _year_first, _day_month_name, _month_name_day, _compact):
+        match = pattern.fullmatch(text)
+        if match:
+            return pattern, match
+    return None, None
+
+
+def numeric_order(text):
+    """
+    The (first, second) numbers of a numeric day/month date such as 03/10/2024, None for other layouts.
+    Used to tell the day and the month apart: a number above 12 can only be a day.
+    """
+    if not isinstance(text, str):
+        return None
+    return _numeric_order(text.strip().lower())
+
+
+@lru_cache(maxsize=65536)
+def _numeric_order(text):
+    pattern, match = _match(text)
+    if pattern is not _numeric:
+        return None
+    return int(match.group("first")), int(match.group("second"))
+
+
+@lru_cache(maxsize=65536)
+def _parse(text, day_first):
+    pattern, match = _match(text)
+    if pattern is None:
+        return None
+    try:
+        if pattern is _day_month_name or pattern is _month_name_day:
+            return datetime(_full_year(match.group("year")), MONTHS[match.group("month_name")[:3]],
+                            int(match.group("day")))
+        year = _full_year(match.group("year"))
+        first, second = int(match.group("first")), int(match.group("second"))
+        if pattern is _numeric:
+            # A number above 12 settles the order whatever day_first says
+            if first > 12 or (day_first and second <= 12):
+                return datetime(year, second, first)
+            return datetime(year, first, second)
+        # Year first is year-month-day, unless the month would be above 12
+        if first > 12:
+            return datetime(year, second, first)
+        return datetime(year, first, second)
+    except ValueError:
+        return None
+
+
+def parse_date(value, day_first=None):
+    """
+    Parses a date written as 03/10/2024, 2024-03-10, 10 Mar 2024, March 10th, 2024, 20240310 and
+    similar layouts, with or without a time.
+
+    Args:
+        value (str): The date text, 'NA' or None.
+        day_first (bool): How to read a numeric date whose day and month are both 12 or less.
+            Defaults to DATE_DAY_FIRST, see document_day_first to infer it.
+
+    Returns:
+        datetime: The date at midnight, or None when value is not a date.
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if not isinstance(value, str) or value == "NA":
+        return None
+    return _parse(value.strip().lower(), DATE_DAY_FIRST if day_first is None else bool(day_first))
+
+
+def infer_day_first(values):
+    """
+    Infers the day/month order from dates written by the same hand.
+
+    Returns:
+        bool: True for day first, False for month first, None when the dates do not tell or disagree.
+    """
+    day_first = month_first = False
+    for value in values:
+        order = numeric_order(value)
+        if order is None:
+            continue
+        first, second = order
+        day_first = day_first or first > 12
+        month_first = month_first or second > 12
+    if day_first == month_first:
+        return None
+    return day_first
+
+
+def party_key(value):
+    if not isinstance(value, str) or value == "NA":
+        return None
+    return _non_alphanumeric.sub(" ", value.lower()).strip() or None
+
+
+class DateOrderMemory:
+    """
+    Remembers the day/month order of each party's documents. A party whose dates once showed
+    the order, e.g. 25/03/2024, has its ambiguous dates read the same way afterwards.
+    """
+
+    def __init__(self, max_items=DATE_ORDER_MEMORY_ITEMS):
+        self._orders = LRUCache(max_items)
+
+    def day_first_for(self, party, values):
+        """
+        The day/month order of a document: inferred from its own dates when they tell, and then
+        remembered for the party, otherwise the order last seen for the party, or None.
+        """
+        key = party_key(party)
+        day_first = infer_day_first(values)
+        if day_first is not None:
+            if key:
+                self._orders.put(key, day_first)
+            return day_first
+        return self._orders.get(key) if key else None
+
+    def __len__(self):
+        return len(self._orders)
+
+
+def get_date_order_memory():
+    global _date_order_memory
+    if _date_order_memory is None:
+        with _date_order_memory_lock:
+            if _date_order_memory is None:
+                _date_order_memory = DateOrderMemory()
+    return _date_order_memory
+
+
+def document_day_first(details, is_invoice):
+    """The day/month order of an extracted invoice or bill, see DateOrderMemory."""
+    values = [details.get(field) for field in DOCUMENT_DATE_FIELDS[is_invoice]]
+    return get_date_order_memory().day_first_for(details.get(DOCUMENT_PARTY_FIELD[is_invoice]), values)
+
+
+def parse_due_terms(value):
+    """
+    Reads relative payment terms such as 'Net 30', 'Net 30 EOM', '15 days' or 'Due on receipt'.
+
+    Returns:
+        tuple: The number of days and whether they count from the end of the invoice month,
+        or None when value is not a payment term.
+    """
+    if not isinstance(value, str):
+        return None
+    text = value.strip().lower()
+    match = _net_terms.search(text)
+    if match:
+        return int(match.group("days")), bool(match.group("eom"))
+    match = _day_terms.search(text)
+    if match:
+        return int(match.group("days")), False
+    if _on_receipt.search(text):
+        return 0, False
+    return None
+
+
+def resolve_due_date(due_value, invoice_date, day_first=None):
+    """
+    The calendar due date of an invoice: due_value itself when it is a date, otherwise its
+    payment terms counted from invoice_date.
+
+    Returns:
+        datetime: The due date, or None when it cannot be worked out.
+    """
+    due_date = parse_date(due_value, day_first)
+    if due_date is not None:
+        return due_date
+    terms = parse_due_terms(due_value)
+    issued = parse_date(invoice_date, day_first)
+    if terms is None or issued is None:
+        return None
+    days, end_of_month = terms
+    if end_of_month:
+        issued = issued.replace(day=calendar.monthrange(issued.year, issued.month)[1])
+    return issued + timedelta(days=days)
+
+
+def format_date_like(value, reference, day_first=None):
+    """
+    Writes a date in the layout of reference when it is a numeric date, e.g. 03/25/2024 next to
+    03/10/2024, and as YYYY-MM-DD otherwise.
+    """
+    reference = reference.strip().lower() if isinstance(reference, str) else ""
+    pattern, match = _match(reference)
+    if pattern is _numeric:
+        first, second = int(match.group("first")), int(match.group("second"))
+        if first > 12 or second > 12:
+            day_first = first > 12
+        elif day_first is None:
+            day_first = DATE_DAY_FIRST
+        sep = match.group("sep")
+        year = value.year if len(match.group("year")) == 4 else value.year % 100
+        parts = (value.day, value.month) if day_first else (value.month, value.day)
+        return "{:02d}{sep}{:02d}{sep}{:0{width}d}".format(*parts, year, sep=sep, width=len(match.group("year")))
+    if pattern is _year_first:
+        return value.strftime("%Y{0}%m{0}%d".format(match.group("sep")))
+    return value.strftime("%Y-%m-%d")
+
+
+def normalize_document_dates(details, is_invoice):
+    """
+    Resolves the due date of an invoice written as payment terms ('Net 30', '15 days') against
+    its invoice date, in the invoice date's layout. Learns the party's day/month order on the way.
+
+    Returns:
+        dict: details, updated in place.
+    """
+    day_first = document_day_first(details, is_invoice)
+    if is_invoice and parse_due_terms(details.get("invoice_due_date")) is not None:
+        due_date = resolve_due_date(details["invoice_due_date"], details.get("invoice_date"), day_first)
+        if due_date is not None:
+            details["invoice_due_date"] = format_date_like(due_date, details.get("invoice_date"), day_first)
+    return details
+
+
+def normalize_date_column(values, day_first=None):
+    """
+    Parses a whole column of dates at once, for batch reconciliation and exports.
+
+    Args:
+        values (list): The date texts.
+        day_first: One order for the whole column, a list with the order of each value, or None
+            to infer it from the column itself and fall back on DATE_DAY_FIRST.
+
+    Returns:
+        list: A date, or None, per value.
+    """
+    values = list(values)
+    if isinstance(day_first, (list, tuple)):
+        orders = day_first
+    else:
+        if day_first is None:
+            day_first = infer_day_first(set(value for value in values if isinstance(value, str)))
+        orders = [day_first] * len(values)
+    dates = []
+    parsed = {}
+    for value, order in zip(values, orders):
+        key = (value, order) if isinstance(value, str) else None
+        if key is not None and key in parsed:
+            dates.append(parsed[key])
+            continue
+        moment = parse_date(value, order)
+        result = moment.date() if moment is not None else None
+        if key is not None:
+            parsed[key] = result
+        dates.append(result)
+    return dates
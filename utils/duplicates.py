@@ -0,0 +1,269 @@
+"""
+Filename: duplicates.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Persistent fingerprint index of every bill seen, to flag bills that were already
+             submitted, identically or with small changes. Exact keys are looked up through SQLite
+             indexes and near duplicates through MinHash signatures bucketed by LSH bands, so a
+             lookup never scans the archive.
+"""
+
+import hashlib
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+from pathlib import Path
+from utils.dates import document_day_first, parse_date, party_key
+from utils.ledger import parse_money
+from config.config import DUPLICATE_INDEX_PATH, NEAR_DUPLICATE_THRESHOLD
+
+# MinHash signatures are LSH_BANDS bands of LSH_ROWS values. Two bills share a bucket with a
+# probability of 1 - (1 - J^LSH_ROWS)^LSH_BANDS for a Jaccard similarity J of their shingles:
+# 95% at J = 0.8, 15% at J = 0.5
+LSH_BANDS = 10
+LSH_ROWS = 6
+SIGNATURE_SIZE = LSH_BANDS * LSH_ROWS
+# Words per shingle of the bill text
+SHINGLE_WORDS = 3
+# Bills sharing an LSH bucket that are checked per lookup, bounds the work on very common layouts
+MAX_BUCKET_CANDIDATES = 1000
+# Candidates reported per bill
+MAX_DUPLICATE_CANDIDATES = 10
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(20261018)
+_PERMUTATIONS = [(_random.randrange(1, _MERSENNE_PRIME), _random.randrange(_MERSENNE_PRIME))
+                 for _ in range(SIGNATURE_SIZE)]
+_word = re.compile(r"[0-9a-z]+")
+
+# Strongest first: an identical file, the same bill number, payer, total and date, the same bill
+# number and payer, then text that is almost the same
+DUPLICATE_REASONS = ("same_file", "same_bill", "same_bill_number", "near_duplicate")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bill_fingerprints (
+    id INTEGER PRIMARY KEY, sha256 TEXT, bill_key TEXT, full_key TEXT, bill_number TEXT, bill_paid_by TEXT,
+    bill_date TEXT, bill_total_paid TEXT, filename TEXT, created_at REAL, signature BLOB
+);
+CREATE INDEX IF NOT EXISTS bill_fingerprints_sha256 ON bill_fingerprints (sha256);
+CREATE INDEX IF NOT EXISTS bill_fingerprints_bill_key ON bill_fingerprints (bill_key);
+CREATE INDEX IF NOT EXISTS bill_fingerprints_full_key ON bill_fingerprints (full_key);
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    bucket INTEGER, bill_id INTEGER, PRIMARY KEY (bucket, bill_id)
+) WITHOUT ROWID;
+"""
+FINGERPRINT_COLUMNS = ("sha256", "bill_key", "full_key", "bill_number", "bill_paid_by", "bill_date",
+                       "bill_total_paid", "filename", "created_at", "signature")
+
+_bill_fingerprint_index = None
+_bill_fingerprint_index_lock = threading.Lock()
+
+
+def shingles(text):
+    """The hashes of the runs of SHINGLE_WORDS consecutive words of a text, lowercased."""
+    words = _word.findall((text or "").lower())
+    if len(words) < SHINGLE_WORDS:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode("utf-8"))
+            for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(text):
+    """The MinHash signature of a text, SIGNATURE_SIZE values, or None for a text without words."""
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    return tuple(min((a * value + b) % _MERSENNE_PRIME for value in hashes) for a, b in _PERMUTATIONS)
+
+
+def estimate_similarity(signature, other):
+    """The share of equal values of two signatures, an estimate of the Jaccard similarity of the texts."""
+    return sum(1 for a, b in zip(signature, other) if a == b) / SIGNATURE_SIZE
+
+
+def lsh_buckets(signature):
+    """One bucket per band of a signature, as signed 64-bit integers."""
+    buckets = []
+    for band in range(LSH_BANDS):
+        values = array("Q", signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]).tobytes() + bytes([band])
+        buckets.append(int.from_bytes(hashlib.blake2b(values, digest_size=8).digest(), "big", signed=True))
+    return buckets
+
+
+def _key_part(value):
+    return party_key(value) or ""
+
+
+def bill_fingerprint(details, sha256, text=None, filename=None, signature=None):
+    """
+    The fingerprint of an extracted bill: its content hash, exact keys and MinHash signature.
+
+    bill_key is the normalized bill number and payer, full_key adds the total in cents and the
+    date. A key is None when the bill number is missing, such bills only match by content.
+    """
+    number = _key_part(details.get("bill_number"))
+    payer = _key_part(details.get("bill_paid_by"))
+    cents, currency = parse_money(details.get("bill_total_paid"))
+    moment = parse_date(details.get("bill_date"), document_day_first(details, is_invoice=False))
+    bill_key = full_key = None
+    if number:
+        bill_key = "{}|{}".format(number, payer)
+        full_key = "{}|{}{}|{}".format(bill_key, currency or "", cents, moment.date().isoformat() if moment else "")
+    if signature is None and text:
+        signature = minhash(text)
+    return {
+        "sha256": sha256, "bill_key": bill_key, "full_key": full_key,
+        "bill_number": details.get("bill_number", "NA"), "bill_paid_by": details.get("bill_paid_by", "NA"),
+        "bill_date": details.get("bill_date", "NA"), "bill_total_paid": details.get("bill_total_paid", "NA"),
+        "filename": filename, "created_at": time.time(), "signature": signature,
+    }
+
+
+class BillFingerprintIndex:
+    """
+    Fingerprints of every bill seen, in a SQLite file that grows one bill at a time.
+
+    A lookup reads the bills with the same content hash or exact keys through their indexes, and
+    the bills sharing an LSH bucket with the signature, whose similarity is then estimated from
+    the stored signatures. The cost depends on the number of matches, not on the size of the archive.
+    Bills with different bill keys are never near duplicates, recurring bills of a vendor share most
+    of their text.
+    """
+
+    def __init__(self, path=DUPLICATE_INDEX_PATH, near_duplicate_threshold=NEAR_DUPLICATE_THRESHOLD):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def _find(self, fingerprint):
+        exact = self._connection.execute(
+            "SELECT id, sha256, bill_key, full_key, bill_number, bill_paid_by, bill_total_paid, filename, created_at "
+            "FROM bill_fingerprints WHERE sha256 = ? OR bill_key = ? OR full_key = ? LIMIT ?",
+            (fingerprint["sha256"], fingerprint["bill_key"], fingerprint["full_key"], MAX_BUCKET_CANDIDATES)
+        ).fetchall()
+        candidates = {}
+        for bill_id, sha256, bill_key, full_key, *summary in exact:
+            if sha256 == fingerprint["sha256"]:
+                reason = "same_file"
+            elif fingerprint["full_key"] is not None and full_key == fingerprint["full_key"]:
+                reason = "same_bill"
+            else:
+                reason = "same_bill_number"
+            candidates[bill_id] = (reason, 1.0, summary)
+
+        signature = fingerprint["signature"]
+        if signature is not None:
+            buckets = lsh_buckets(signature)
+            rows = self._connection.execute(
+                "SELECT f.id, f.signature, f.bill_key, f.bill_number, f.bill_paid_by, f.bill_total_paid, f.filename, "
+                "f.created_at "
+                "FROM bill_fingerprints f WHERE f.id IN (SELECT DISTINCT bill_id FROM lsh_buckets WHERE bucket IN "
+                "({}) LIMIT ?)".format(", ".join("?" * len(buckets))),
+                (*buckets, MAX_BUCKET_CANDIDATES)
+            ).fetchall()
+            for bill_id, stored_signature, bill_key, *summary in rows:
+                if bill_id in candidates or stored_signature is None:
+                    continue
+                # A recurring bill of the same vendor has almost the same text but its own bill number
+                if fingerprint["bill_key"] is not None and bill_key is not None and bill_key != fingerprint["bill_key"]:
+                    continue
+                similarity = estimate_similarity(signature, array("Q", stored_signature))
+                if similarity >= self.near_duplicate_threshold:
+                    candidates[bill_id] = ("near_duplicate", round(similarity, 4), summary)
+
+        ranked = sorted(candidates.values(), key=lambda candidate: (DUPLICATE_REASONS.index(candidate[0]),
+                                                                    -candidate[1], candidate[2][-1]))
+        return [{
+            "reason": reason, "similarity": similarity, "bill_number": bill_number, "bill_paid_by": bill_paid_by,
+            "bill_total_paid": bill_total_paid, "filename": filename,
+            "first_seen": datetime.fromtimestamp(created_at).isoformat(timespec="seconds")
+        } for reason, similarity, (bill_number, bill_paid_by, bill_total_paid, filename, created_at)
+            in ranked[:MAX_DUPLICATE_CANDIDATES]]
+
+    def _add(self, fingerprints):
+        for fingerprint in fingerprints:
+            row = [fingerprint[column] for column in FINGERPRINT_COLUMNS]
+            signature = fingerprint["signature"]
+            row[-1] = array("Q", signature).tobytes() if signature is not None else None
+            bill_id = self._connection.execute(
+                "INSERT INTO bill_fingerprints ({}) VALUES ({})".format(
+                    ", ".join(FINGERPRINT_COLUMNS), ", ".join("?" * len(FINGERPRINT_COLUMNS))), row
+            ).lastrowid
+            if signature is not None:
+                self._connection.executemany("INSERT OR IGNORE INTO lsh_buckets VALUES (?, ?)",
+                                             [(bucket, bill_id) for bucket in lsh_buckets(signature)])
+
+    def find_candidates(self, fingerprint):
+        """
+        The earlier bills a fingerprint duplicates, strongest reason first, see DUPLICATE_REASONS.
+
+        Returns:
+            list: Dicts with the reason, the similarity (1.0 for exact keys) and a summary of the earlier bill.
+        """
+        with self._lock:
+            return self._find(fingerprint)
+
+    def add_many(self, fingerprints):
+        """Adds fingerprints in one transaction."""
+        with self._lock, self._connection:
+            self._add(fingerprints)
+
+    def check_and_add(self, fingerprint):
+        """
+        Finds the candidates of a new bill, then adds it. A file already in the index is not added
+        again, so resubmitting it keeps pointing at its first submission.
+        """
+        with self._lock, self._connection:
+            candidates = self._find(fingerprint)
+            if not any(candidate["reason"] == "same_file" for candidate in candidates):
+                self._add([fingerprint])
+        return candidates
+
+    def signature_of(self, sha256):
+        """The stored signature of a file, for bills whose text was not extracted again, e.g. cache hits."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT signature FROM bill_fingerprints WHERE sha256 = ? AND signature IS NOT NULL LIMIT 1", (sha256,)
+            ).fetchone()
+        return tuple(array("Q", row[0])) if row else None
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM bill_fingerprints").fetchone()[0]
+
+
+def get_bill_fingerprint_index():
+    global _bill_fingerprint_index
+    if _bill_fingerprint_index is None:
+        with _bill_fingerprint_index_lock:
+            if _bill_fingerprint_index is None:
+                _bill_fingerprint_index = BillFingerprintIndex()
+    return _bill_fingerprint_index
+
+
+def same_upload_candidate(details, filename, bill_index):
+    """
+    The candidate of a bill uploaded twice in one request, pointing at the first upload. The
+    repeat shares the first upload's extraction, so the fingerprint index never sees it.
+    """
+    return {
+        "reason": "same_file", "similarity": 1.0, "bill_number": details.get("bill_number", "NA"),
+        "bill_paid_by": details.get("bill_paid_by", "NA"), "bill_total_paid": details.get("bill_total_paid", "NA"),
+        "filename": filename, "first_seen": datetime.now().isoformat(timespec="seconds"), "bill_index": bill_index
+    }
+
+
+def collect_duplicate_flags(bills_data):
+    """The bills of a reconciliation flagged as duplicates, for the reconciliation result."""
+    return [{"bill_number": bill.get("bill_number", "NA"), "candidates": bill["duplicate_candidates"]}
+            for bill in bills_data if bill.get("duplicate_candidates")]
@@ -0,0 +1,202 @@
+"""
+Filename: embeddings.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Description embeddings for semantic line item matching: a deterministic local hashing
+             embedder and OpenAI embeddings behind a cache keyed by normalized text, an in-process
+             NumPy vector index or a Pinecone one, and one-to-one assignment of the best matches.
+"""
+
+import threading
+import uuid
+import zlib
+import numpy as np
+from utils.cache import LRUCache
+from config.config import (get_provider, EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE, EMBEDDING_CACHE_ITEMS,
+                           VECTOR_INDEX_BACKEND, PINECONE_INDEX_NAME)
+
+# Dimensions of the hashing embedder's vectors
+HASHING_DIMENSIONS = 1024
+# Invoice items returned by the remote index per bill item
+REMOTE_TOP_K = 10
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+_embedding_cache = LRUCache(EMBEDDING_CACHE_ITEMS)
+
+
+def normalize_rows(vectors):
+    """Scales every row to unit length, so that dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def _hashing_features(text):
+    """The words of a normalized description and the character trigrams of each word."""
+    features = text.split()
+    for word in text.split():
+        padded = " {} ".format(word)
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+class HashingEmbedder:
+    """
+    Embeds a description by hashing its words and character trigrams into a fixed number of
+    dimensions. Deterministic and local, so it needs no network and suits tests and benchmarks.
+    Trigrams make spelling variants such as 'labour' and 'labor' land close together.
+    """
+
+    def __init__(self, dimensions=HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = "hashing-{}".format(dimensions)
+
+    def embed(self, texts):
+        rows, columns, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in _hashing_features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                columns.append(digest % self.dimensions)
+                signs.append(1.0 if digest & 0x80000000 else -1.0)
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(vectors, (rows, columns), signs)
+        return normalize_rows(vectors)
+
+
+class OpenAIEmbedder:
+    """Embeds descriptions with the OpenAI embeddings provider of config.config."""
+
+    def __init__(self):
+        self.provider = get_provider("openai_embeddings")
+        self.name = "openai-{}".format(getattr(self.provider, "model", ""))
+
+    def embed(self, texts):
+        return normalize_rows(np.asarray(self.provider.embed_documents(list(texts)), dtype=np.float32))
+
+
+_embedder_factories = {"hashing": HashingEmbedder, "openai": OpenAIEmbedder}
+
+
+def get_embedder(name=EMBEDDING_BACKEND):
+    embedder = _embedders.get(name)
+    if embedder is None:
+        with _embedders_lock:
+            embedder = _embedders.get(name)
+            if embedder is None:
+                if name not in _embedder_factories:
+                    raise ValueError("Unknown embedding backend: {}".format(name))
+                embedder = _embedders[name] = _embedder_factories[name]()
+    return embedder
+
+
+def embed_texts(texts, embedder=None, batch_size=EMBEDDING_BATCH_SIZE):
+    """
+    Embeds normalized descriptions. Each distinct text is embedded once, texts already in the
+    cache are not embedded again, and the rest are sent in calls of up to batch_size texts.
+
+    Returns:
+        numpy.ndarray: One unit-length row per text.
+    """
+    embedder = embedder or get_embedder()
+    vectors = {}
+    missing = []
+    for text in dict.fromkeys(texts):
+        vector = _embedding_cache.get((embedder.name, text))
+        if vector is None:
+            missing.append(text)
+        else:
+            vectors[text] = vector
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        for text, vector in zip(batch, embedder.embed(batch)):
+            _embedding_cache.put((embedder.name, text), vector)
+            vectors[text] = vector
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([vectors[text] for text in texts])
+
+
+class LocalVectorIndex:
+    """The invoice item vectors in memory, every bill item is scored in one matrix product."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def similarities(self, queries):
+        """The cosine similarity of every query (row) with every indexed vector (column)."""
+        return queries @ self.vectors.T
+
+    def close(self):
+        pass
+
+
+class PineconeVectorIndex:
+    """
+    The invoice item vectors in a Pinecone index, in a namespace of their own that close deletes.
+    Each bill item is a query of its own and only the REMOTE_TOP_K best scores are known, the
+    others count as no match.
+    """
+
+    def __init__(self, vectors, index_name=PINECONE_INDEX_NAME):
+        self.index = get_provider("pinecone").Index(index_name)
+        self.namespace = uuid.uuid4().hex
+        self.size = len(vectors)
+        for start in range(0, self.size, EMBEDDING_BATCH_SIZE):
+            self.index.upsert(vectors=[(str(position), vectors[position].tolist())
+                                       for position in range(start, min(start + EMBEDDING_BATCH_SIZE, self.size))],
+                              namespace=self.namespace)
+
+    def similarities(self, queries):
+        scores = np.full((len(queries), self.size), -1.0, dtype=np.float32)
+        for row, query in enumerate(queries):
+            response = self.index.query(vector=query.tolist(), top_k=REMOTE_TOP_K, namespace=self.namespace)
+            for match in response["matches"]:
+                scores[row, int(match["id"])] = match["score"]
+        return scores
+
+    def close(self):
+        self.index.delete(delete_all=True, namespace=self.namespace)
+
+
+_vector_index_factories = {"local": LocalVectorIndex, "pinecone": PineconeVectorIndex}
+
+
+def create_vector_index(vectors, backend=VECTOR_INDEX_BACKEND):
+    if backend not in _vector_index_factories:
+        raise ValueError("Unknown vector index backend: {}".format(backend))
+    return _vector_index_factories[backend](vectors)
+
+
+def assign_one_to_one(similarities, threshold, preferred=None):
+    """
+    Pairs queries (rows) with indexed items (columns) one to one, best similarity first.
+
+    Args:
+        similarities (numpy.ndarray): The similarity matrix, see LocalVectorIndex.similarities.
+        threshold (float): Pairs less similar than this are never made.
+        preferred (numpy.ndarray): Optional boolean matrix, breaks ties in favour of its pairs,
+            e.g. a bill item and an invoice item with the same amount.
+
+    Returns:
+        list: (row, column, similarity) tuples.
+    """
+    rows, columns = np.nonzero(similarities >= threshold)
+    if not len(rows):
+        return []
+    scores = similarities[rows, columns]
+    tie_breaks = preferred[rows, columns] if preferred is not None else np.zeros(len(rows), dtype=bool)
+    pairs = []
+    taken_rows, taken_columns = set(), set()
+    for position in np.lexsort((~tie_breaks, -scores)):
+        if len(taken_rows) == similarities.shape[0] or len(taken_columns) == similarities.shape[1]:
+            break
+        row, column = int(rows[position]), int(columns[position])
+        if row in taken_rows or column in taken_columns:
+            continue
+        taken_rows.add(row)
+        taken_columns.add(column)
+        pairs.append((row, column, float(scores[position])))
+    return pairs
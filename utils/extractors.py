@@ -0,0 +1,263 @@
+"""
+Filename: extractors.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Text extraction backends chosen per MIME type. A backend that is not installed or
+             fails hands the document to the next one. The PDF engines lay words out by position,
+             so the cells of a table row stay on one line.
+"""
+
+import csv
+import importlib.util
+import io
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from utils.logs import logger
+from utils.metrics import stage
+from utils.general import PAGE_SEPARATOR, PdfEngine, iter_pdf_pages, extract_text_from_pdf, extract_text_from_file
+from config.config import PDF_EXTRACTION_BACKENDS, PDF_MAX_PAGES, PDF_SKIP_EMPTY_PAGES
+
+# Bump whenever the text a backend produces changes, it is part of the extraction cache key
+LAYOUT_VERSION = "1"
+# Written between the cells of a table row, and between words further apart than a column gap
+CELL_SEPARATOR = " | "
+# Words further apart than this many character widths are in different columns
+COLUMN_GAP_CHARACTERS = 2.0
+
+PDF_MIME_TYPE = "application/pdf"
+CSV_MIME_TYPE = "text/csv"
+# Delimiters of CSV bills, the first one is used when the header line has none
+CSV_DELIMITERS = ",;\t|"
+XLSX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# MIME type -> backends in the order they are registered
+_backends = {}
+# MIME type -> backend names in the order they are tried, for types whose order is configured
+_preferences = {PDF_MIME_TYPE: PDF_EXTRACTION_BACKENDS}
+
+
+class UnsupportedFileTypeError(Exception):
+    """Raised for a document no installed backend can extract text from."""
+
+
+class ExtractionBackend:
+    """
+    A function extracting the text of a document given as a path or a seekable binary stream.
+
+    Attributes:
+        name (str): The name used in PDF_EXTRACTION_BACKENDS and in the logs.
+        requires (str): The module the backend imports, it is only tried when the module is installed.
+    """
+
+    def __init__(self, name, extract, requires=None):
+        self.name = name
+        self.extract = extract
+        self.requires = requires
+        self._available = None
+
+    def available(self):
+        if self._available is None:
+            self._available = self.requires is None or importlib.util.find_spec(self.requires) is not None
+        return self._available
+
+
+def register_backend(mime_type, name, extract, requires=None):
+    """Adds a backend for a MIME type, after the backends already registered for it."""
+    backend = ExtractionBackend(name, extract, requires)
+    _backends.setdefault(mime_type, []).append(backend)
+    return backend
+
+
+def get_backends(mime_type):
+    """The installed backends of a MIME type, in the order they are tried."""
+    backends = _backends.get(mime_type, [])
+    if mime_type in _preferences:
+        by_name = {backend.name: backend for backend in backends}
+        backends = [by_name[name] for name in _preferences[mime_type] if name in by_name]
+    return [backend for backend in backends if backend.available()]
+
+
+def get_extraction_signature():
+    """Identifies the PDF engine and layout text comes from, part of the extraction cache key."""
+    backends = get_backends(PDF_MIME_TYPE)
+    return "{}-l{}".format(backends[0].name if backends else "none", LAYOUT_VERSION)
+
+
+def check_file_type(file_type, filename):
+    """Raises UnsupportedFileTypeError unless an installed backend can extract file_type."""
+    if not get_backends(file_type):
+        raise UnsupportedFileTypeError("Unsupported file type {} of '{}'".format(file_type, filename))
+
+
+def extract_text_based_on_file_type(file_type, source):
+    """
+    Extracts the text of a document with the first backend of its MIME type that succeeds.
+
+    Args:
+        file_type (str): The MIME type, see utils.general.get_file_type.
+        source (str or file-like): The path to the file or a seekable binary stream.
+
+    Returns:
+        str: The text, pages or sheets separated by PAGE_SEPARATOR.
+
+    Raises:
+        UnsupportedFileTypeError: When no installed backend handles file_type.
+    """
+    backends = get_backends(file_type)
+    if not backends:
+        raise UnsupportedFileTypeError("Unsupported file type: {}".format(file_type))
+    for position, backend in enumerate(backends):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        try:
+            logger.debug("Extracting text of type {} with {}".format(file_type, backend.name))
+            return backend.extract(source)
+        except Exception as e:
+            if position == len(backends) - 1:
+                raise
+            logger.warning("Text extraction with {} failed, falling back to {}: {}".format(
+                backend.name, backends[position + 1].name, e))
+
+
+def layout_lines(words):
+    """
+    Lays positioned words out as the lines of a page, top to bottom.
+
+    Words whose vertical middles are within half a line height of each other share a line, so a
+    table row stays on one line even when the PDF stores its cells column by column. Words further
+    apart than COLUMN_GAP_CHARACTERS character widths are separated by CELL_SEPARATOR.
+
+    Args:
+        words (iterable): (x0, top, x1, bottom, text) tuples, y growing downwards.
+
+    Returns:
+        list: The text of each line.
+    """
+    rows = []
+    for x0, top, x1, bottom, text in sorted(words, key=lambda word: ((word[1] + word[3]) / 2, word[0])):
+        middle, height = (top + bottom) / 2, bottom - top
+        if rows and abs(middle - rows[-1][0]) <= max(rows[-1][1], height) / 2:
+            rows[-1][2].append((x0, x1, text))
+        else:
+            rows.append((middle, height, [(x0, x1, text)]))
+
+    lines = []
+    for _, _, cells in rows:
+        cells.sort()
+        parts = [cells[0][2]]
+        for (previous_x0, previous_x1, previous_text), (x0, _, text) in zip(cells, cells[1:]):
+            character_width = (previous_x1 - previous_x0) / max(len(previous_text), 1)
+            parts.append(CELL_SEPARATOR if x0 - previous_x1 > COLUMN_GAP_CHARACTERS * character_width else " ")
+            parts.append(text)
+        lines.append("".join(parts))
+    return lines
+
+
+def _join_pages(page_texts, skip_empty, span):
+    pages = [text for text in page_texts if not (skip_empty and not text.strip())]
+    span["pages"] = len(pages)
+    return PAGE_SEPARATOR.join(pages)
+
+
+@contextmanager
+def open_pymupdf_pages(source):
+    import fitz
+    if isinstance(source, (str, os.PathLike)):
+        document = fitz.open(source)
+    else:
+        document = fitz.open(stream=source.read(), filetype="pdf")
+    with document:
+        yield document
+
+
+def pymupdf_page_text(page):
+    return "\n".join(layout_lines(word[:5] for word in page.get_text("words")))
+
+
+@contextmanager
+def open_pdfplumber_pages(source):
+    import pdfplumber
+    with pdfplumber.open(source) as pdf:
+        yield pdf.pages
+
+
+def pdfplumber_page_text(page):
+    return "\n".join(layout_lines((word["x0"], word["top"], word["x1"], word["bottom"], word["text"])
+                                  for word in page.extract_words()))
+
+
+PYMUPDF_ENGINE = PdfEngine(open_pymupdf_pages, pymupdf_page_text)
+PDFPLUMBER_ENGINE = PdfEngine(open_pdfplumber_pages, pdfplumber_page_text)
+
+
+def extract_pdf_with_pymupdf(source, max_pages=PDF_MAX_PAGES or None, skip_empty=PDF_SKIP_EMPTY_PAGES, parallel=None):
+    """
+    Extracts the text of a PDF with PyMuPDF, the fastest engine, laid out with layout_lines.
+    Pages are read like those of PyPDF2, large documents on the process pool, see iter_pdf_pages.
+    """
+    with stage("pdf_extraction", backend="pymupdf") as span:
+        return _join_pages(iter_pdf_pages(source, max_pages, False, parallel, PYMUPDF_ENGINE), skip_empty, span)
+
+
+def extract_pdf_with_pdfplumber(source, max_pages=PDF_MAX_PAGES or None, skip_empty=PDF_SKIP_EMPTY_PAGES,
+                                parallel=None):
+    """Extracts the text of a PDF with pdfplumber, laid out with layout_lines, see extract_pdf_with_pymupdf."""
+    with stage("pdf_extraction", backend="pdfplumber") as span:
+        return _join_pages(iter_pdf_pages(source, max_pages, False, parallel, PDFPLUMBER_ENGINE), skip_empty, span)
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d") if value.time() == datetime.min.time() else value.isoformat(" ")
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _table_lines(rows):
+    """One line per row that is not empty, cells separated by CELL_SEPARATOR, trailing empty cells dropped."""
+    lines = []
+    for row in rows:
+        cells = [_cell_text(value) for value in row]
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            lines.append(CELL_SEPARATOR.join(cells))
+    return lines
+
+
+def extract_text_from_csv(source):
+    """The rows of a CSV bill, one line each, in whatever delimiter the file uses."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as csv_file:
+            data = csv_file.read()
+    else:
+        data = source.read()
+    text = data.decode("utf-8-sig", errors="replace")
+    # The header line tells the delimiter, amounts such as 1,200.00 in the rows would mislead a sniffer
+    header = text.lstrip().split("\n", 1)[0]
+    delimiter = max(CSV_DELIMITERS, key=header.count)
+    return "\n".join(_table_lines(csv.reader(io.StringIO(text), delimiter=delimiter)))
+
+
+def extract_text_from_xlsx(source):
+    """The rows of every sheet of an Excel bill, sheets separated by PAGE_SEPARATOR."""
+    import openpyxl
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        return PAGE_SEPARATOR.join("\n".join(_table_lines(sheet.iter_rows(values_only=True)))
+                                   for sheet in workbook.worksheets)
+    finally:
+        workbook.close()
+
+
+register_backend(PDF_MIME_TYPE, "pymupdf", extract_pdf_with_pymupdf, requires="fitz")
+register_backend(PDF_MIME_TYPE, "pdfplumber", extract_pdf_with_pdfplumber, requires="pdfplumber")
+register_backend(PDF_MIME_TYPE, "pypdf2", extract_text_from_pdf, requires="PyPDF2")
+register_backend("text/plain", "text", extract_text_from_file)
+register_backend(CSV_MIME_TYPE, "csv", extract_text_from_csv)
+register_backend(XLSX_MIME_TYPE, "openpyxl", extract_text_from_xlsx, requires="openpyxl")
@@ -7,9 +7,31 @@ Description: This file contains generic functions.
 """
 
 from utils.logs import logger
+from utils.metrics import stage
+import io
+import os
+import math
 import mimetypes
-from PyPDF2 import PdfReader
-from datetime import datetime
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from utils import dates
+from utils.ledger import parse_money, cents_to_decimal
+from config.config import (PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_RANGE, PDF_EXTRACTION_WORKERS, PDF_MAX_PAGES,
+                           PDF_SKIP_EMPTY_PAGES)
+
+# Separates consecutive pages in extracted PDF text
+PAGE_SEPARATOR = "\f"
+
+# How iter_pdf_pages reads a PDF: open is a context manager yielding the sequence of pages of a
+# path or binary stream, page_text gives the text of one page. Both must be module-level functions,
+# page ranges are extracted with them in other processes
+PdfEngine = namedtuple("PdfEngine", ("open", "page_text"))
+
+_pdf_process_pool = None
+_pdf_process_pool_lock = threading.Lock()
     
 def get_file_type(filename):
     mime_type, _ = mimetypes.guess_type(filename)
@@ -19,49 +41,114 @@ def get_file_type(filename):
         return extension
     return mime_type
 
-def extract_text_from_pdf(file_path):
+def get_pdf_process_pool():
+    """Returns the process pool used for page-parallel PDF extraction."""
+    global _pdf_process_pool
+    if _pdf_process_pool is None:
+        with _pdf_process_pool_lock:
+            if _pdf_process_pool is None:
+                # Spawn instead of fork, the API process runs many threads
+                _pdf_process_pool = ProcessPoolExecutor(
+                    max_workers=PDF_EXTRACTION_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pdf_process_pool
+
+@contextmanager
+def open_pypdf2_pages(source):
+    from PyPDF2 import PdfReader
+    yield PdfReader(source).pages
+
+def pypdf2_page_text(page):
+    return page.extract_text() or ""
+
+PYPDF2_ENGINE = PdfEngine(open_pypdf2_pages, pypdf2_page_text)
+
+def extract_pdf_page_range(source, start, stop, engine=PYPDF2_ENGINE):
+    """Extracts the text of pages [start, stop) of a PDF given as a path or raw bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    with engine.open(source) as pages:
+        return [engine.page_text(pages[i]) for i in range(start, stop)]
+
+def iter_pdf_pages(source, max_pages=None, skip_empty=False, parallel=None, engine=PYPDF2_ENGINE):
+    """
+    Yields the text of each page of a PDF, in page order.
+
+    Large documents are split into page ranges that are extracted on a process pool, so
+    the cost scales with the number of cores rather than the number of pages.
+
+    Args:
+        source (str or file-like): The path to the PDF file or a seekable binary stream.
+        max_pages (int): Only the first max_pages pages are extracted when given.
+        skip_empty (bool): Drops pages without any text, e.g. scanned pages.
+        parallel (bool): Forces page-parallel extraction on or off. By default it is used
+            for documents with at least PDF_PARALLEL_MIN_PAGES pages.
+        engine (PdfEngine): The library reading the PDF, PyPDF2 by default.
+
+    Yields:
+        str: The text of a page.
+    """
+    with engine.open(source) as pages:
+        total_pages = len(pages)
+        if max_pages is not None:
+            total_pages = min(total_pages, max_pages)
+        if parallel is None:
+            parallel = total_pages >= PDF_PARALLEL_MIN_PAGES and PDF_EXTRACTION_WORKERS > 1
+
+        if parallel and total_pages > 1:
+            if isinstance(source, (str, os.PathLike)):
+                payload = str(source)
+            else:
+                source.seek(0)
+                payload = source.read()
+            # Aim for a couple of ranges per worker so that slow pages do not leave cores idle
+            range_size = max(PDF_PAGES_PER_RANGE, math.ceil(total_pages / (PDF_EXTRACTION_WORKERS * 2)))
+            pool = get_pdf_process_pool()
+            futures = [
+                pool.submit(extract_pdf_page_range, payload, start, min(start + range_size, total_pages), engine)
+                for start in range(0, total_pages, range_size)
+            ]
+            page_texts = (text for future in futures for text in future.result())
+        else:
+            page_texts = (engine.page_text(pages[i]) for i in range(total_pages))
+
+        for text in page_texts:
+            if skip_empty and not text.strip():
+                continue
+            yield text
+
+def extract_text_from_pdf(source, max_pages=PDF_MAX_PAGES or None, skip_empty=PDF_SKIP_EMPTY_PAGES, parallel=None):
   """
   Extracts text from a PDF file and returns the combined text.
 
   Args:
-      file_path (str): The path to the PDF file.
+      source (str or file-like): The path to the PDF file, or a seekable binary stream
+          such as the buffer of a spooled upload.
+      max_pages (int): Only the first max_pages pages are extracted when given.
+      skip_empty (bool): Drops pages without any text.
+      parallel (bool): Forces page-parallel extraction on or off, see iter_pdf_pages.
 
   Returns:
-      str: The extracted text from the PDF file.
+      str: The extracted text from the PDF file, pages separated by PAGE_SEPARATOR.
   """
 
-  print("Extracting text from pdf...")
   try:
-    with open(file_path, 'rb') as pdf_file:
-      reader = PdfReader(pdf_file)
-      totalPages = len(reader.pages)
-      extracted_text = ""
-
-      for i in range(0, totalPages):
-        extracted_text += reader.pages[i].extract_text()
-      return extracted_text
+    with stage("pdf_extraction", backend="pypdf2") as span:
+      text = PAGE_SEPARATOR.join(iter_pdf_pages(source, max_pages, skip_empty, parallel))
+      span["pages"] = text.count(PAGE_SEPARATOR) + 1 if text else 0
+      return text
   except FileNotFoundError:
-      print(f"Error: File not found at {file_path}")
+      logger.error("PDF file not found at {}".format(source))
       return ""
 
-def extract_text_from_file(file_path):
-    with open(file_path, 'r') as file:
+def extract_text_from_file(source):
+    if hasattr(source, 'read'):
+        return source.read().decode('utf-8', errors='replace')
+    with open(source, 'r') as file:
         text = file.read()
     return text
      
-def extract_text_based_on_file_type(file_type, file_path):
-    extraction_functions = {
-        'application/pdf': extract_text_from_pdf,
-        'text/plain': extract_text_from_file
-    }
-    if file_type in extraction_functions:
-        logger.info("======= {} =======".format(file_type))
-        text_extraction_function = extraction_functions[file_type]
-        return text_extraction_function(file_path)
-    else:
-        logger.error("Unsupported file type:", file_type)
-        return None
-    
 def clean_currency(value):
     """Removes dollar signs and commas from a currency string."""
     if value is None:
@@ -70,18 +157,11 @@ def clean_currency(value):
         raise ValueError("Input must be a string or None")
     return value.replace('$', '').replace(',', '')
 
-def parse_date(date_string):
-    """Parses a date string using various date formats."""
-    if date_string is None or date_string == "NA":
-        return None  # Return None for NA or None input
-    date_formats = [
-        '%d/%m/%Y', '%m/%d/%Y', '%Y/%d/%m', '%Y/%m/%d',
-        '%d-%m-%Y', '%m-%d-%Y', '%Y-%d-%m', '%Y-%m-%d',
-        '%d.%m.%Y', '%m.%d.%Y', '%Y.%m.%d', '%Y.%m.%d'
-    ]
-    for fmt in date_formats:
-        try:
-            return datetime.strptime(date_string, fmt)
-        except ValueError:
-            continue
-    return None #return none if no format matches
\ No newline at end of file
+def parse_amount(value):
+    """Parses a currency string into an exact Decimal rounded to cents, 'NA' and unparsable values count as zero."""
+    cents, _ = parse_money(value)
+    return cents_to_decimal(cents)
+
+def parse_date(date_string, day_first=None):
+    """Parses a date string in any of the layouts utils.dates understands, None for 'NA' or unknown layouts."""
+    return dates.parse_date(date_string, day_first)
@@ -5,38 +5,86 @@ Date created: 15/06/2025
 License: MIT License
 Description: This file contains invoice processing related functions.
 """
+import functools
+import logging
 from fastapi import UploadFile
-from utils.logs import logger
-from config.config import upload_directory_path
-from utils.general import get_file_type,extract_text_based_on_file_type, clean_currency
-from datetime import date
-import json
-import shutil
-from pathlib import Path
-from config.config import gemini_model_name, upload_directory_path
-import google.generativeai as genai # 👈 Add this import
-
-# Define the prompts for invoice and bill separately
-def fetch_invoice_details(text):
-    prompt = f'''
-    You are an advanced data extraction system specialized in parsing invoice documents. Your task is to extract specific details from the provided text and output them in a structured JSON format. The details to extract include:
-    
-    - invoice_number: The unique number identifying the invoice.
+from utils.logs import logger, log_event
+from utils.metrics import stage
+from utils.general import get_file_type
+from utils.extractors import extract_text_based_on_file_type, get_extraction_signature
+from config.config import EXTRACTION_CACHE_ENABLED, RECONCILIATION_NARRATIVE_ENABLED, MODEL_ROUTING_ENABLED
+from config.config import PROMPT_PREPROCESSING_ENABLED, PROMPT_TOKEN_BUDGET, TEMPLATE_EXTRACTION_ENABLED
+from config.config import LOG_PAYLOAD_SAMPLE_RATE, DUPLICATE_DETECTION_ENABLED
+from config.config import CHUNKED_EXTRACTION_ENABLED, EXTRACTION_CHUNK_TOKENS, EXTRACTION_CHUNK_OVERLAP_LINES
+from utils.cache import get_extraction_cache, make_cache_key
+from utils.uploads import SpooledUpload, spool_upload, new_request_id
+from utils.reconciliation import reconcile_amounts
+from utils.ledger import BillLedger, cents_to_decimal
+from utils.dates import normalize_document_dates
+from utils.matching import create_line_item_index, match_line_items, as_item_list
+from utils.llm_gateway import get_llm_gateway
+from utils.preprocessing import preprocess_document_text, PREPROCESSING_VERSION
+from utils.templates import get_template_extractor
+from utils.json_repair import parse_llm_json
+from utils.duplicates import get_bill_fingerprint_index, bill_fingerprint, collect_duplicate_flags
+from utils.chunked_extraction import extract_in_chunks, needs_chunking
+from utils.model_routing import route_extraction, get_model_signature
+from utils.validation import validate_details
+from utils.schemas import INVOICE_SCHEMA, BILL_SCHEMA, json_generation_config, normalize_details
+
+# Bump these whenever a prompt changes so that cached extractions are not reused
+INVOICE_PROMPT_VERSION = "3"
+BILL_PROMPT_VERSION = "2"
+
+def get_text_signature():
+    """Identifies how document text is prepared before it reaches the prompt, part of the cache key."""
+    if CHUNKED_EXTRACTION_ENABLED:
+        chunking = "-c{}o{}".format(EXTRACTION_CHUNK_TOKENS, EXTRACTION_CHUNK_OVERLAP_LINES)
+    else:
+        chunking = ""
+    if PROMPT_PREPROCESSING_ENABLED:
+        return "{}-pp{}-{}{}".format(get_extraction_signature(), PREPROCESSING_VERSION, get_prompt_token_budget(),
+                                     chunking)
+    return "{}-raw{}".format(get_extraction_signature(), chunking)
+
+def get_prompt_token_budget():
+    """Long documents are chunked rather than cut down to PROMPT_TOKEN_BUDGET when chunked extraction is enabled."""
+    return 0 if CHUNKED_EXTRACTION_ENABLED else PROMPT_TOKEN_BUDGET
+
+# Field definitions shared by the single and multi-document extraction prompts, continuation
+# lines are indented like the prompts they are inserted into
+INVOICE_FIELD_GUIDE = '''- invoice_number: The unique number identifying the invoice.
     - invoice_date: The date the invoice was issued.
-    - invoice_due_date: The date or number of days by which the payment should be made. If the due_date is given in number of days, add those many days to the invoice_date and get the new calendar due_date. For example if the invoice date is 03/10/2024 and the due days/date is 15 days the new calendar due date will be 03/15/2024.
+    - invoice_due_date: The date by which the payment should be made. If it is given as payment terms or a number of days, e.g. "Net 30" or "15 days", return the terms exactly as written, the calendar date is worked out from the invoice_date afterwards.
     - invoice_to: The entity/company to which the invoice is addressed or in other words the entity which will pay.
     - contact_number: The contact number of the company to which the invoice is raised.
     - email: The email of the company to which the invoice is raised.
     - invoice_subtotal_due: Sub total due of all the line items before tax.
     - invoice_tax_due: Total tax amount due specifiend in the invoice text which is levied on Sub total.
     - invoice_total_due: Total amount due including tax and subtotal.
-    - line_items: Invoice items containing item description, hrs or quantity, rate or cost and line total.
+    - line_items: Invoice items containing item description, hrs or quantity, rate or cost and line total.'''
+
+BILL_FIELD_GUIDE = '''- bill_number: The unique number identifying the bill. Please note that, bill number is different than invoice number, pick bill number only.
+    - bill_date: The date the bill was issued.
+    - bill_payment_date: The date on which the payment was done.
+    - bill_paid_by: The amount paid by which person or company.
+    - bill_subtotal_paid: Total amount before tax.
+    - bill_tax_paid: Tax amount.
+    - bill_total_paid: Total amount including tax.
+    - line_items: Bill items containing item description, amount.'''
+
+# Define the prompts for invoice and bill separately
+def fetch_invoice_details(text, model_name=None):
+    prompt = f'''
+    You are an advanced data extraction system specialized in parsing invoice documents. Your task is to extract specific details from the provided text and output them in a structured JSON format. The details to extract include:
+    
+    {INVOICE_FIELD_GUIDE}
 
     Context/Text:
     {text}
 
     ***Important:***
-    - If the due_date is given in number of days, add those many days to the invoice_date and get the new calendar due_date. For example if the invoice date is 03/10/2024 and the due days/date is 15 days the new calendar due date will be 03/15/2024.
+    - Return dates exactly as they are written in the text, do not reorder the day and the month.
     - Only use information directly from the text given in context above. Do not infer or hallucinate values.
     - Double check for the invoice line items and ensure that you are not missing any of it.
 
@@ -59,20 +107,20 @@ def fetch_invoice_details(text):
         "invoice_subtotal_due": "$1,800.00",
         "invoice_tax_due": "$180.00",
         "invoice_total_due": "$1,980.00",
-        "line_items": {
-          {
+        "line_items": [
+          {{
             "description": "Foundation Labor",
             "hrs_or_quantity": "10",
             "rate_or_cost": "50",
             "line_total": "500"
-          },
-          {
+          }},
+          {{
             "description": "PCC",
             "hrs_or_quantity": "15",
             "rate_or_cost": "78.00",
             "line_total": "1,170.00"
-          }
-        }
+          }}
+        ]
     }}
 
     Example output when some fields are missing:
@@ -86,110 +134,50 @@ def fetch_invoice_details(text):
         "invoice_subtotal_due": "$1,800.00",
         "invoice_tax_due": "$180.00",
         "invoice_total_due": "$1,980.00",
-        "line_items": {
-          {
+        "line_items": [
+          {{
             "description": "Foundation Labor",
             "hrs_or_quantity": "10",
             "rate_or_cost": "50",
             "line_total": "500"
-          },
-          {
+          }},
+          {{
             "description": "PCC",
             "hrs_or_quantity": "15",
             "rate_or_cost": "78.00",
             "line_total": "1,170.00"
-          }
-        }
+          }}
+        ]
     }}
 
     Now, please provide the extracted details in JSON format. Do not miss any field in the JSON, if any value is not available, return 'NA' for that.
     '''
 
-     # --- Gemini API Call ---
-    model = genai.GenerativeModel(gemini_model_name)
-    response = model.generate_content(prompt)
-    # --- End of Change ---
+    response = get_llm_gateway().generate(prompt, model_name=model_name,
+                                          generation_config=json_generation_config(INVOICE_SCHEMA))
 
-    logger.info("======invoice details========")
-    
-    # The Gemini response text is in response.text
-    # We need to clean it up to ensure it's valid JSON
-    cleaned_response = response.text.strip().replace('```json', '').replace('```', '').strip()
-    logger.info(cleaned_response)
-    
-    invoice_details = json.loads(cleaned_response)
+    log_event(logging.DEBUG, "llm_response", LOG_PAYLOAD_SAMPLE_RATE, kind="invoice", text=response.text)
+
+    # The reply is repaired when needed instead of failing on a stray token
+    invoice_details = normalize_details(parse_llm_json(response.text), is_invoice=True)
     return invoice_details
 
 def verify_invoice_details(details):
-    prompt = f'''
-    As an advanced verification system, you are tasked with verifying the correctness of the invoice details by performing mathematical checks:
-
-    - Calculate if the sub_total plus tax equals the total.
-    - Calculate if the total minus amount_paid equals the total_due.
+    """
+    Checks that subtotal + tax equals the total, that the line totals add up to the subtotal and
+    that the required fields are present, locally instead of with an LLM call.
 
-    Given Invoice Details:
-    sub_total: {details['sub_total']}
-    tax: {details['tax']}
-    total: {details['total']}
-    amount_paid: {details['amount_paid']}
-    total_due: {details['total_due']}
+    Returns:
+        dict: The verification result and the checks that failed, see utils.validation.validate_details.
+    """
+    problems = validate_details(details, is_invoice=True)
+    return {"verification": not problems, "problems": problems}
 
-    if (sub_total + tax) == total and (total - amount_paid) == total_due: 
-        verification_result = True
-    else:
-        verification_result = False
-
-    Instructions:
-    - Perform the required verifications.
-    - Return the results of the verifications in a structured JSON format.
-    - If any amount/price/money field have missing values, assume '$0.00' for that field.
-    - Include the details of the calculations that you will do on the above given invoice details in the response.
-    - Always give amount fields with the precision of 2 decimal places e.g. 102.20
-
-    Response fromat:
-    {{
-        "verification": verification
-        
-    }}
-
-    Example output when 'verification_result' is equal to 'True':
-    {{
-        "verification": True
-    }}
-
-    Example output when 'verification_result' is equal to 'False':
-    {{
-        "verification": False
-    }}
-
-    Now, please provide the extracted details in JSON format. Do not miss any field in the JSON, if any value is not available, return 'NA' for that.
-    '''
-
-    # --- Gemini API Call ---
-    model = genai.GenerativeModel(gemini_model_name)
-    response = model.generate_content(prompt)
-    # --- End of Change ---
-    
-    logger.info("======bill details========")
-    
-    cleaned_response = response.text.strip().replace('```json', '').replace('```', '').strip()
-    logger.info(cleaned_response)
-    
-    reconciliation_data = json.loads(cleaned_response)
-    return reconciliation_data
-
-def fetch_bill_details(text):
+def fetch_bill_details(text, model_name=None):
     prompt = f'''
     You are an advanced data extraction system specialized in parsing a bill or list of bill documents. Your task is to extract specific details from the provided text and output them in a structured JSON format. The details to extract include:
 
-    - bill_number: The unique number identifying the bill. Please note that, bill number is different than invoice number, pick bill number only.
-    - bill_date: The date the bill was issued.
-    - bill_payment_date: The date on which the payment was done.
-    - bill_paid_by: The amount paid by which person or company.
-    - bill_subtotal_paid: Total amount before tax.
-    - bill_tax_paid: Tax amount.
-    - bill_total_paid: Total amount including tax.
-    - line_items: Bill items containing item description, amount.
+    {BILL_FIELD_GUIDE}
 
     Context/Text:
     {text}
@@ -218,16 +206,16 @@ def fetch_bill_details(text):
         "bill_subtotal_paid": "$25,233.00",
         "bill_tax_paid": "$1,601.88",
         "bill_total_paid": "$27,231.88",
-        "line_items": {
-          {
+        "line_items": [
+          {{
             "description": "Transportation of Materials",
-            "Amount": "450"
-          },
-          {
+            "amount": "450"
+          }},
+          {{
             "description": "Transportation of Materials",
-            "Amount": "1000"
-          }
-        }
+            "amount": "1000"
+          }}
+        ]
     }}
 
     Example output when some fields are missing:
@@ -239,322 +227,205 @@ def fetch_bill_details(text):
         "bill_subtotal_paid": "$25,233.00",
         "bill_tax_paid": "$1,601.88",
         "bill_total_paid": "$27,231.88",
-        "line_items": {
-          {
+        "line_items": [
+          {{
             "description": "Foundation Labor",
-            "Amount": "500"
-          },
-          {
+            "amount": "500"
+          }},
+          {{
             "description": "PCC",
             "amount": "1170"
-          }
-        }
+          }}
+        ]
     }}
 
     Now, please provide the extracted details in JSON format. Do not miss any field in the JSON, if any value is not available, return 'NA' for that.
     '''
-    # --- Gemini API Call ---
-    model = genai.GenerativeModel(gemini_model_name)
-    response = model.generate_content(prompt)
-    # --- End of Change ---
-    
-    logger.info("======bill details========")
-    
-    cleaned_response = response.text.strip().replace('```json', '').replace('```', '').strip()
-    logger.info(cleaned_response)
-    
-    reconciliation_data = json.loads(cleaned_response)
-    return reconciliation_data
-
-def save_and_process_file(file: UploadFile, is_invoice: bool = False):
-    file_name = file.filename
-    file_path = upload_directory_path + file_name
-
-    # 👈 To create the directory if it doesn't exist
-    Path(upload_directory_path).mkdir(parents=True, exist_ok=True)
+    response = get_llm_gateway().generate(prompt, model_name=model_name,
+                                          generation_config=json_generation_config(BILL_SCHEMA))
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    file_type = get_file_type(file_name)
-    text = extract_text_based_on_file_type(file_type, str(file_path))
+    log_event(logging.DEBUG, "llm_response", LOG_PAYLOAD_SAMPLE_RATE, kind="bill", text=response.text)
+    
+    bill_details = normalize_details(parse_llm_json(response.text), is_invoice=False)
+    return bill_details
+
+def extract_document(text, is_invoice: bool = False, model_name: str = None):
+    """Extracts a document with one LLM call, or chunk by chunk when it is too long for one prompt."""
+    fetch = functools.partial(fetch_invoice_details if is_invoice else fetch_bill_details, model_name=model_name)
+    if CHUNKED_EXTRACTION_ENABLED and needs_chunking(text):
+        return extract_in_chunks(text, is_invoice, fetch)
+    return fetch(text)
+
+def fetch_document_details(text, is_invoice: bool = False):
+    """
+    Extracts a document, with the fast model first when model routing is enabled. Output failing
+    the local checks is extracted again with the strong model, see utils.model_routing.
+    """
+    if MODEL_ROUTING_ENABLED:
+        return route_extraction(functools.partial(extract_document, text, is_invoice), is_invoice)
+    return extract_document(text, is_invoice)
+
+def save_and_process_file(file: UploadFile, is_invoice: bool = False, request_id: str = None):
+    upload = spool_upload(file, request_id or new_request_id())
+    try:
+        return process_spooled_file(upload, is_invoice)
+    finally:
+        upload.close()
+
+def prepare_spooled_file(upload: SpooledUpload, is_invoice: bool = False):
+    """
+    Does everything of an extraction that needs no LLM call: the cache lookup, text extraction
+    and preprocessing, and the layout templates for bills.
+
+    Returns:
+        tuple: The cache key, the details when they are already known (None otherwise) and the
+            prompt text of the document (None on a cache hit).
+    """
     if is_invoice:
-        details = fetch_invoice_details(text)
-        #verification = verify_invoice_details(details)
-        return details
+        kind, prompt_version = "invoice", INVOICE_PROMPT_VERSION
     else:
-        details = fetch_bill_details(text)
+        kind, prompt_version = "bill", BILL_PROMPT_VERSION
+    cache_key = make_cache_key(upload.sha256, kind, get_model_signature(),
+                               "{}-{}".format(prompt_version, get_text_signature()))
+    if EXTRACTION_CACHE_ENABLED:
+        cached_details = get_extraction_cache().get(cache_key)
+        if cached_details is not None:
+            logger.info("Extraction cache hit for {} '{}'".format(kind, upload.filename))
+            return cache_key, cached_details, None
+
+    file_type = get_file_type(upload.filename)
+    text = extract_text_based_on_file_type(file_type, upload.open_stream())
+    if PROMPT_PREPROCESSING_ENABLED:
+        text, token_counts = preprocess_document_text(text, get_prompt_token_budget())
+        logger.info("Request {}: {} '{}' prompt tokens {} -> {} after preprocessing".format(
+            upload.request_id, kind, upload.filename, token_counts["tokens_before"], token_counts["tokens_after"]))
+
+    if not is_invoice and TEMPLATE_EXTRACTION_ENABLED:
+        details = get_template_extractor().extract(text)
+        if details is not None:
+            store_extraction(cache_key, details)
+            return cache_key, details, text
+    return cache_key, None, text
+
+def complete_extraction(cache_key, is_invoice, text, details):
+    """
+    Resolves due terms such as 'Net 30' into a date, learns a layout template from a bill
+    extracted by the LLM and caches the details.
+    """
+    details = normalize_document_dates(details, is_invoice)
+    if not is_invoice and TEMPLATE_EXTRACTION_ENABLED:
+        try:
+            get_template_extractor().learn(text, details)
+        except Exception as e:
+            logger.warning("Could not learn a template from the extracted bill: {}".format(e))
+    store_extraction(cache_key, details)
+    return details
+
+def store_extraction(cache_key, details):
+    if EXTRACTION_CACHE_ENABLED:
+        get_extraction_cache().put(cache_key, details)
+
+def flag_duplicate_bill(upload: SpooledUpload, details, text=None):
+    """
+    Adds the earlier bills this one duplicates to a copy of its details, as duplicate_candidates,
+    and adds the bill to the fingerprint index. The cached details are left without the flags.
+    """
+    if not DUPLICATE_DETECTION_ENABLED:
+        return details
+    try:
+        index = get_bill_fingerprint_index()
+        # Without text, e.g. on a cache hit, the signature stored for the same file is reused
+        signature = index.signature_of(upload.sha256) if text is None else None
+        fingerprint = bill_fingerprint(details, upload.sha256, text, upload.filename, signature)
+        candidates = index.check_and_add(fingerprint)
+    except Exception as e:
+        logger.warning("Duplicate detection failed for bill '{}': {}".format(upload.filename, e))
         return details
+    if candidates:
+        logger.info("Bill '{}' may duplicate {} earlier bill(s)".format(upload.filename, len(candidates)))
+    return {**details, "duplicate_candidates": candidates}
+
+def process_spooled_file(upload: SpooledUpload, is_invoice: bool = False):
+    cache_key, details, text = prepare_spooled_file(upload, is_invoice)
+    if details is None:
+        details = fetch_document_details(text, is_invoice)
+        details = complete_extraction(cache_key, is_invoice, text, details)
+    if not is_invoice:
+        details = flag_duplicate_bill(upload, details, text)
+    return details
     
 def aggregate_bills_subtotal(bills):
-    return sum(float(clean_currency(bill['bill_subtotal_paid'])) for bill in bills)
+    return cents_to_decimal(BillLedger(bills).total('bill_subtotal_paid'))
 
 def aggregate_bills_tax(bills):
-    return sum(float(clean_currency(bill['bill_tax_paid'])) for bill in bills)
+    return cents_to_decimal(BillLedger(bills).total('bill_tax_paid'))
 
 def aggregate_bills_total(bills):
-    return sum(float(clean_currency(bill['bill_total_paid'])) for bill in bills)
-
-def perform_reconciliation(invoice_data, bills_data):
-    subtotal_bills = aggregate_bills_subtotal(bills_data)
-    tax_bills = aggregate_bills_tax(bills_data)
-    total_bills = aggregate_bills_total(bills_data)
-
-    # Ensure all monetary values are formatted with 2 decimal places
-    invoice_subtotal_due = float(clean_currency(invoice_data['invoice_subtotal_due']))
-    invoice_tax_due = float(clean_currency(invoice_data['invoice_tax_due']))
-    invoice_total_due = float(clean_currency(invoice_data['invoice_total_due']))
-
-    all_matches = []
-    all_mismatches = []
-
-    for bill in bills_data:
-        matched, mismatched = match_line_items(invoice_data["line_items"], bill["line_items"])
-        all_matches.extend(matched)
-        all_mismatches.extend(mismatched)
-
+    return cents_to_decimal(BillLedger(bills).total('bill_total_paid'))
 
+def fetch_reconciliation_narrative(reconciliation_data):
     prompt = f'''
-    You are an advanced data reconciliation system. Your task is to reconcile the details between an invoice and multiple bills. Below are the details extracted from the invoice and the list of bills. Perform a reconciliation and provide a summary of any discrepancies or confirmations.
+    You are an accounts payable assistant. An invoice has been reconciled against its bills and every amount below has already been computed exactly. Write a short reconciliation summary for a finance team.
+
+    ***Reconciliation***
+    **invoice_number**: {reconciliation_data['invoice_number']}
+    **invoice_to**: {reconciliation_data['invoice_to']}
+    **invoice_subtotal_due**: {reconciliation_data['invoice_subtotal_due']}
+    **invoice_tax_due**: {reconciliation_data['invoice_tax_due']}
+    **invoice_total_due**: {reconciliation_data['invoice_total_due']}
+    **number_of_bills**: {len(reconciliation_data['bills'])}
+    **subtotal_difference**: {reconciliation_data['subtotal_difference']}
+    **tax_difference**: {reconciliation_data['tax_difference']}
+    **total_difference**: {reconciliation_data['total_difference']}
+    **discrepancies**: {reconciliation_data['discrepancies']}
 
-    ***Context***
-    **invoice_number**: {invoice_data['invoice_number']}
-    **invoice_date**: {invoice_data['invoice_date']}
-    **invoice_due_date**: {invoice_data['invoice_due_date']}
-    **invoice_to**: {invoice_data['invoice_to']}
-    **invoice_subtotal_due**: {invoice_subtotal_due:.2f}
-    **invoice_tax_due**: {invoice_tax_due:.2f}
-    **invoice_total_due**: {invoice_total_due:.2f}
-
-    '''
-    
-    for i, bill in enumerate(bills_data, 1):
-        prompt += f'''
-      **bills:**
-        *bill_number*: {bill['bill_number']}
-        *bill_date*: {bill['bill_date']}
-        *bill_payment_date*: {bill['bill_payment_date']}
-        *bill_paid_by*: {bill['bill_paid_by']}
-        *bill_subtotal_paid*: {float(clean_currency(bill['bill_subtotal_paid'])):.2f}
-        *bill_tax_paid*: {float(clean_currency(bill['bill_tax_paid'])):.2f}
-        *bill_total_paid*: {float(clean_currency(bill['bill_total_paid'])):.2f}
+    ***Instructions***
+    - Use only the amounts given above, do not recompute or change them.
+    - Answer with at most three sentences of plain text, no JSON and no markdown.
     '''
-    
-    prompt += f'''
-
-    **subtotal_difference**: 
-        {invoice_subtotal_due:.2f} - {subtotal_bills:.2f}
-    **tax_difference**: 
-        {invoice_tax_due:.2f} - {tax_bills:.2f}
-    **total_difference**: 
-        {invoice_total_due:.2f} - {total_bills:.2f}
-
-
-    **discrepancies**: 
-        True if subtotal_difference > 0 OR tax_difference > 0 OR total_difference > 0 else False
-    
-    **reconciliation_summary**: 
-        Please refer to the following examples
-        
-        Case 1: Discrepancies Found
-        1. If discrepancy found in subtotal: "There is a discrepancy of {{give the value of subtotal_difference here}} in the subtotal. The invoice shows a subtotal of ${invoice_subtotal_due:.2f}, while the bill indicates a subtotal of ${subtotal_bills:.2f}."
-        2. If discrepancy found in the tax: "There is a discrepancy of {{give the value of tax_difference here}} in the tax. The invoice indicates tax due of ${invoice_tax_due:.2f}, whereas the bill shows tax paid as ${tax_bills:.2f}."
-        
-        Always include the following line at the last:
-        "The total amount differs by {{give the value of total_difference here}}. According to the invoice, the total due is ${invoice_total_due:.2f}, but the bill records a total paid of ${total_bills:.2f}."
-        
-        Case 2: No Discrepancies Found
-        "All amounts match. No discrepancies found between the invoice and bill."
 
-    ***Instructions***
-    - Compare the similar details between the invoice and the bill.
-    - Highlight any discrepancies.
-    - Do not miss any of the fields, especially the fields like subtotal_difference, tax_difference, and total_difference in the response JSON.
-    - Confirm if the details match or if there are any inconsistencies.
-    - Provide a structured JSON output summarizing the reconciliation.
-    - Always give amount fields with the precision of 2 decimal places e.g. 102.20
-
-    Example output: when the difference amount is zero.
-    {{
-        "invoice_number": "10001",
-        "invoice_date": "6/15/2024",
-        "invoice_due_date": "30 days",
-        "invoice_to": "Jash Enterprises",
-        "invoice_subtotal_due": "$30,000.00",
-        "invoice_tax_due": "$3,000.00",
-        "invoice_total_due": "$33,000.00",
-        "bills": [
-            {{
-                "bill_number": "99011",
-                "bill_date": "6/26/2024",
-                "bill_payment_date": "6/26/2024",
-                "bill_subtotal_paid": "$10,000.00",
-                "bill_tax_paid": "$1,000.00",
-                "bill_total_paid": "$11,000.00",
-                "bill_paid_by": "Mr. John Doe"
-            }},
-            {{
-                "bill_number": "99012",
-                "bill_date": "6/27/2024",
-                "bill_payment_date": "6/28/2024",
-                "bill_subtotal_paid": "$20,000.00",
-                "bill_tax_paid": "$2,000.00",
-                "bill_total_paid": "$22,000.00",
-                "bill_paid_by": "Mr. John Doe"
-            }}
-        ],
-        "subtotal_difference": "$0.00",
-        "tax_difference": "$0.00",
-        "total_difference": "$0.00",
-        "discrepancies": "False",
-        "reconciliation_summary": "No discrepancies found between the given invoice and bill."
-    }}
+    response = get_llm_gateway().generate(prompt)
 
-    Example output when the difference amount is non-zero:
-    {{
-        "invoice_number": "10001",
-        "invoice_date": "6/15/2024",
-        "invoice_due_date": "30 days",
-        "invoice_to": "Jash Enterprises",
-        "invoice_subtotal_due": "$30,000.00",
-        "invoice_tax_due": "$3,000.00",
-        "invoice_total_due": "$33,000.00",
-        "bills": [
-            {{
-                "bill_number": "99011",
-                "bill_date": "6/26/2024",
-                "bill_payment_date": "6/26/2024",
-                "bill_subtotal_paid": "$10,000.00",
-                "bill_tax_paid": "$900.00",
-                "bill_total_paid": "$10,900.00",
-                "bill_paid_by": "Mr. John Doe"
-            }},
-            {{
-                "bill_number": "99012",
-                "bill_date": "6/27/2024",
-                "bill_payment_date": "6/28/2024",
-                "bill_subtotal_paid": "$20,000.00",
-                "bill_tax_paid": "$1,800.00",
-                "bill_total_paid": "$21,800.00",
-                "bill_paid_by": "Mr. John Doe"
-            }}
-        ],
-        "subtotal_difference": "$0.00",
-        "tax_difference": "$300.00",
-        "total_difference": "$300.00",
-        "discrepancies": "True",
-        "reconciliation_summary": "Discrepancies found between the given invoice and bills."
-    }}
+    return response.text.strip()
 
-    Now, please provide the extracted details in JSON format only. Do not miss any field in the output JSON, if any value is not available, return 'NA' for that.
-    '''
+def verify_line_items(invoice_data, bills_data):
+    """Matches the line items of every bill against the invoice line items."""
+    all_matches = []
+    all_mismatches = []
 
-    # --- Gemini API Call ---
-    model = genai.GenerativeModel(gemini_model_name)
-    response = model.generate_content(prompt)
-    # --- End of Change ---
-    
-    # ... (rest of the function)
-    
-    # You will also need to update how the response is parsed here
-    cleaned_response = response.text.strip().replace('```json', '').replace('```', '').strip()
-    logger.info(cleaned_response)
-    
-    reconciliation_data = json.loads(cleaned_response)
+    with stage("line_item_matching", bills=len(bills_data)):
+        # Normalize and index the invoice line items once for all bills
+        line_item_index = create_line_item_index(invoice_data["line_items"])
+        line_item_index.prepare([item for bill in bills_data for item in as_item_list(bill["line_items"])])
+        for bill in bills_data:
+            matched, mismatched = match_line_items(invoice_data["line_items"], bill["line_items"], line_item_index)
+            all_matches.extend(matched)
+            all_mismatches.extend(mismatched)
 
-    # Inject line item verification results
-    reconciliation_data['line_item_verification'] = {
+    return {
         "matched_items": all_matches,
         "mismatched_items": all_mismatches,
         "discrepancy_found": bool(all_mismatches)
     }
 
-    return reconciliation_data
+def perform_reconciliation(invoice_data, bills_data, narrative: bool = RECONCILIATION_NARRATIVE_ENABLED,
+                           line_item_verification: dict = None):
+    if line_item_verification is None:
+        line_item_verification = verify_line_items(invoice_data, bills_data)
 
+    # Amounts, differences and the summary are computed locally with exact decimal arithmetic
+    with stage("reconciliation", bills=len(bills_data)):
+        reconciliation_data = reconcile_amounts(invoice_data, bills_data)
 
-def convert_sql_results_to_dicts(results):
-    keys = [
-        "invoice_number", "invoice_date", "invoice_due_date", "invoice_to", "invoice_subtotal_due", 
-        "invoice_tax_due", "invoice_total_due", "invoice_file_url", "bill_number", "bill_date", 
-        "bill_payment_date", "bill_paid_by", "bill_subtotal_paid", "bill_tax_paid", "bill_total_paid", 
-        "bill_file_url", "discrepancies", "reconciliation_summary", "total_difference", "contact_number", 
-        "email"
-    ]
-    invoices = []
-
-    for result in results:
-        invoice = dict(zip(keys, result))
-        if isinstance(invoice.get("invoice_date"), date):
-            invoice["invoice_date"] = invoice["invoice_date"].isoformat()
-        if isinstance(invoice.get("invoice_due_date"), date):
-            invoice["invoice_due_date"] = invoice["invoice_due_date"].isoformat()
-        if isinstance(invoice.get("bill_date"), date):
-            invoice["bill_date"] = invoice["bill_date"].isoformat()
-        if isinstance(invoice.get("bill_payment_date"), date):
-            invoice["bill_payment_date"] = invoice["bill_payment_date"].isoformat()
-        if "discrepancies" in invoice and isinstance(invoice["discrepancies"], bool):
-            invoice["discrepancies"] = 'Yes' if invoice["discrepancies"] else 'No'
-        invoices.append(invoice)
-    return invoices
-
-def match_line_items(invoice_items, bill_items):
-    mismatches = []
-    matched_items = []
-
-    for b_item in bill_items:
-        b_desc = b_item.get('description', '').strip().lower()
-        b_raw_amount = b_item.get('amount') or b_item.get('Amount') or '0'
+    # The LLM is only used to reword the summary when the narrative mode is enabled
+    if narrative:
         try:
-            b_amount = round(float(clean_currency(b_raw_amount)), 2)
-        except Exception:
-            b_amount = 0.00  # Fallback if amount parsing fails
-
-        if not b_desc:
-            mismatches.append({
-                "description": "NA",
-                "bill_amount": f"${b_amount:.2f}",
-                "invoice_amount": "NA",
-                "match": False,
-                "reason": "Missing description in bill line item"
-            })
-            continue
-
-        match_found = False
-
-        for i_item in invoice_items:
-            i_desc = i_item.get('description', '').strip().lower()
-            i_raw_amount = i_item.get('line_total') or '0'
-            try:
-                i_amount = round(float(clean_currency(i_raw_amount)), 2)
-            except Exception:
-                i_amount = 0.00
-
-            # Normalize and match descriptions
-            if b_desc == i_desc:
-                match_found = True
-                if b_amount != i_amount:
-                    mismatches.append({
-                        "description": b_item['description'],
-                        "bill_amount": f"${b_amount:.2f}",
-                        "invoice_amount": f"${i_amount:.2f}",
-                        "match": False,
-                        "reason": "Amount mismatch"
-                    })
-                else:
-                    matched_items.append({
-                        "description": b_item['description'],
-                        "amount": f"${b_amount:.2f}",
-                        "match": True
-                    })
-                break
-
-        if not match_found:
-            mismatches.append({
-                "description": b_item['description'],
-                "bill_amount": f"${b_amount:.2f}",
-                "invoice_amount": "NA",
-                "match": False,
-                "reason": "Line item not found in invoice"
-            })
-
-    return matched_items, mismatches
\ No newline at end of file
+            reconciliation_data['reconciliation_summary'] = fetch_reconciliation_narrative(reconciliation_data)
+        except Exception as e:
+            logger.warning("Falling back to the template summary, narrative generation failed: {}".format(e))
+
+    # Inject line item verification results
+    reconciliation_data['line_item_verification'] = line_item_verification
+    reconciliation_data['duplicate_bills'] = collect_duplicate_flags(bills_data)
+
+    return reconciliation_data
@@ -0,0 +1,270 @@
+"""
+Filename: jobs.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Background jobs run by a bounded worker pool, with pluggable job stores.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from utils.logs import logger
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is full."""
+
+
+class JobManagerUnavailableError(Exception):
+    """Raised when a job is submitted while the manager is not running."""
+
+
+class JobStore(ABC):
+    """Keeps the status and result of every job."""
+
+    @abstractmethod
+    def create(self, job_id, kind):
+        pass
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        pass
+
+    @abstractmethod
+    def get(self, job_id):
+        """Returns the job as a dict, or None when it is unknown."""
+
+
+def new_job_record(job_id, kind):
+    now = time.time()
+    return {"job_id": job_id, "kind": kind, "status": JOB_QUEUED, "created_at": now,
+            "updated_at": now, "result": None, "error": None}
+
+
+class InMemoryJobStore(JobStore):
+    """Job store for a single process; the oldest finished jobs are dropped beyond max_jobs."""
+
+    def __init__(self, max_jobs=10000):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, job_id, kind):
+        with self._lock:
+            self._jobs[job_id] = new_job_record(job_id, kind)
+            if len(self._jobs) > self.max_jobs:
+                for old_id in list(self._jobs):
+                    if len(self._jobs) <= self.max_jobs:
+                        break
+                    if self._jobs[old_id]["status"] in FINISHED_STATES:
+                        del self._jobs[old_id]
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+
+class SQLiteJobStore(JobStore):
+    """Job store persisted in a SQLite file, so finished jobs survive restarts."""
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, kind TEXT, status TEXT, "
+                "created_at REAL, updated_at REAL, result TEXT, error TEXT)"
+            )
+            # Jobs that were queued or running when the process stopped will never finish
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, error = ? WHERE status IN (?, ?)",
+                (JOB_FAILED, "Interrupted by a restart", JOB_QUEUED, JOB_RUNNING)
+            )
+
+    def create(self, job_id, kind):
+        job = new_job_record(job_id, kind)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, NULL, NULL)",
+                (job_id, kind, job["status"], job["created_at"], job["updated_at"])
+            )
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        columns = ", ".join("{} = ?".format(column) for column in fields)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET {} WHERE job_id = ?".format(columns), (*fields.values(), job_id)
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT job_id, kind, status, created_at, updated_at, result, error FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(["job_id", "kind", "status", "created_at", "updated_at", "result", "error"], row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class JobManager:
+    """
+    Runs submitted coroutines on a fixed number of workers fed by a bounded queue.
+
+    When the queue is full submit fails right away with QueueFullError, so bursts are
+    rejected instead of slowing down every job already accepted.
+    """
+
+    def __init__(self, store: JobStore, workers=4, queue_size=100):
+        self.store = store
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queue = None
+        self._worker_tasks = []
+        self._pending = {}
+        self._running = {}
+
+    @property
+    def running(self):
+        return bool(self._worker_tasks)
+
+    def has_capacity(self):
+        return self.running and not self._queue.full()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._worker_tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info("Started {} job workers".format(self.workers))
+
+    async def stop(self):
+        tasks, self._worker_tasks = self._worker_tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job_id, (_, on_discard) in list(self._pending.items()):
+            self._discard(job_id, on_discard, JOB_FAILED, "Shut down before the job started")
+
+    def submit(self, kind, coroutine_function, *args, on_discard=None):
+        """
+        Queues a job.
+
+        Args:
+            kind (str): Kind of job, stored with its status.
+            coroutine_function: Called with args when a worker picks the job up, its return
+                value is stored as the job result and must be JSON serialisable.
+            on_discard: Called when the job is cancelled or dropped before it started, so
+                that resources handed to it can be released.
+
+        Returns:
+            str: The job id.
+        """
+        if not self.running:
+            raise JobManagerUnavailableError("The job manager is not running")
+        job_id = uuid.uuid4().hex
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            raise QueueFullError("The job queue is full")
+        self._pending[job_id] = ((coroutine_function, args), on_discard)
+        self.store.create(job_id, kind)
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued or running job.
+
+        A running job is cancelled at its next await. Blocking work it already handed
+        to a thread pool runs to completion, but its result is discarded.
+
+        Returns:
+            bool: False when the job is unknown or already finished.
+        """
+        if job_id in self._pending:
+            _, on_discard = self._pending[job_id]
+            self._discard(job_id, on_discard, JOB_CANCELLED, None)
+            return True
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        return False
+
+    def _discard(self, job_id, on_discard, status, error):
+        self._pending.pop(job_id, None)
+        self.store.update(job_id, status=status, error=error)
+        if on_discard is not None:
+            try:
+                on_discard()
+            except Exception as e:
+                logger.warning("Could not release the resources of job {}: {}".format(job_id, e))
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                entry = self._pending.pop(job_id, None)
+                if entry is None:
+                    # Cancelled while it was queued
+                    continue
+                (coroutine_function, args), _ = entry
+                self.store.update(job_id, status=JOB_RUNNING)
+                task = asyncio.create_task(coroutine_function(*args))
+                self._running[job_id] = task
+                try:
+                    result = await task
+                    self.store.update(job_id, status=JOB_SUCCEEDED, result=result)
+                except asyncio.CancelledError:
+                    if not task.cancelled():
+                        # The worker itself is being stopped
+                        task.cancel()
+                        self.store.update(job_id, status=JOB_FAILED, error="Shut down while running")
+                        raise
+                    self.store.update(job_id, status=JOB_CANCELLED)
+                except Exception as e:
+                    logger.exception("Job {} failed".format(job_id))
+                    self.store.update(job_id, status=JOB_FAILED, error=str(e))
+                finally:
+                    self._running.pop(job_id, None)
+            finally:
+                self._queue.task_done()
+
+
+def create_job_store(kind, path=None):
+    """Returns the job store selected in the configuration: 'memory' or 'sqlite'."""
+    if kind == "sqlite":
+        return SQLiteJobStore(path)
+    if kind == "memory":
+        return InMemoryJobStore()
+    raise ValueError("Unknown job store: {}".format(kind))
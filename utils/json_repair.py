@@ -0,0 +1,194 @@
+"""
+Filename: json_repair.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Tolerant JSON parsing for model output: code fences, trailing commas, single quotes,
+             Python literals, sets written as objects and truncated output.
+"""
+
+import json
+import re
+from utils.logs import logger
+
+_code_fence = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_number = re.compile(r"^-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?$")
+_literals = {"true": True, "false": False, "null": None, "none": None}
+_escapes = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+# Characters that end an unquoted value
+_bare_end = set(",}]:\n")
+
+
+class JSONRepairError(ValueError):
+    """Raised when no JSON value can be recovered from the text."""
+
+
+class _LenientParser:
+    """
+    Recursive descent parser that accepts everything json.loads accepts and repairs the
+    usual model mistakes instead of failing. When the text ends early, the containers that
+    are still open are closed and the values read so far are returned. A string or bare value
+    the text ends inside is left out, it may be cut short, e.g. "$10,8 of "$10,880.00", and
+    so is an object of a list the text ends inside.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.position = 0
+        self.truncated = False
+
+    def _skip(self, characters=" \t\r\n"):
+        while self.position < len(self.text) and self.text[self.position] in characters:
+            self.position += 1
+
+    def _peek(self):
+        return self.text[self.position] if self.position < len(self.text) else None
+
+    def parse_value(self):
+        """Returns the next value, or the _MISSING sentinel when the text ends first."""
+        self._skip()
+        character = self._peek()
+        if character is None:
+            self.truncated = True
+            return _MISSING
+        if character == "{":
+            self.position += 1
+            return self._parse_object()
+        if character == "[":
+            self.position += 1
+            return self._parse_array()
+        if character in "\"'":
+            return self._parse_string()
+        return self._parse_bare()
+
+    def _parse_object(self):
+        result = {}
+        while True:
+            self._skip(" \t\r\n,")
+            character = self._peek()
+            if character is None:
+                self.truncated = True
+                return result
+            if character == "}":
+                self.position += 1
+                return result
+            if character == "]":
+                # Mismatched bracket, treated as the end of the object
+                self.position += 1
+                return result
+            if character in "{[" and not result:
+                # Values without keys, e.g. { {...}, {...} }, are read as a list
+                return self._parse_array()
+            key = self._parse_string() if character in "\"'" else self._parse_bare(as_key=True)
+            if key is _MISSING:
+                return result
+            self._skip()
+            if self._peek() == ":":
+                self.position += 1
+            value = self.parse_value()
+            if value is _MISSING:
+                return result
+            result[str(key)] = value
+
+    def _parse_array(self):
+        result = []
+        while True:
+            self._skip(" \t\r\n,")
+            character = self._peek()
+            if character is None:
+                self.truncated = True
+                return result
+            if character in "]}":
+                self.position += 1
+                return result
+            value = self.parse_value()
+            # An object cut off inside a list, e.g. the last line item, is left out as a whole
+            if value is _MISSING or (self.truncated and isinstance(value, dict)):
+                return result
+            result.append(value)
+
+    def _parse_string(self):
+        quote = self.text[self.position]
+        self.position += 1
+        characters = []
+        while self.position < len(self.text):
+            character = self.text[self.position]
+            if character == "\\" and self.position + 1 < len(self.text):
+                escaped = self.text[self.position + 1]
+                if escaped == "u" and self.position + 6 <= len(self.text):
+                    try:
+                        characters.append(chr(int(self.text[self.position + 2:self.position + 6], 16)))
+                        self.position += 6
+                        continue
+                    except ValueError:
+                        pass
+                characters.append(_escapes.get(escaped, escaped))
+                self.position += 2
+                continue
+            self.position += 1
+            if character == quote:
+                return "".join(characters)
+            characters.append(character)
+        self.truncated = True
+        return _MISSING
+
+    def _parse_bare(self, as_key=False):
+        start = self.position
+        while self.position < len(self.text) and self.text[self.position] not in _bare_end:
+            self.position += 1
+        if self.position == start:
+            # A stray delimiter, skipped so that parsing always moves forward
+            self.position += 1
+        word = self.text[start:self.position].strip()
+        if self.position >= len(self.text):
+            self.truncated = True
+            return _MISSING
+        if as_key:
+            return word
+        if word.lower() in _literals:
+            return _literals[word.lower()]
+        if _number.match(word):
+            return float(word) if any(c in word for c in ".eE") else int(word)
+        return word
+
+
+_MISSING = object()
+
+
+def _strip_code_fences(text):
+    return _code_fence.sub("", text.strip()).strip()
+
+
+def parse_json_lenient(text):
+    """
+    Parses model output as JSON, repairing it when needed.
+
+    Returns:
+        tuple: The parsed value and whether it was complete (False when the text ended
+            early and only the values read whole were kept).
+
+    Raises:
+        JSONRepairError: When the text holds no object or array at all.
+    """
+    text = _strip_code_fences(text or "")
+    try:
+        return json.loads(text), True
+    except ValueError:
+        pass
+    starts = [position for position in (text.find("{"), text.find("[")) if position >= 0]
+    if not starts:
+        raise JSONRepairError("No JSON object or array in the model output")
+    parser = _LenientParser(text[min(starts):])
+    value = parser.parse_value()
+    if value is _MISSING:
+        raise JSONRepairError("No JSON object or array in the model output")
+    return value, not parser.truncated
+
+
+def parse_llm_json(text):
+    """Parses the JSON reply of a model, logging when it was cut short."""
+    value, complete = parse_json_lenient(text)
+    if not complete:
+        logger.warning("Model output was truncated, using the values it holds whole")
+    return value
+
@@ -0,0 +1,283 @@
+"""
+Filename: ledger.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Locale-aware money parsing and a columnar ledger of bill amounts in exact integer cents.
+"""
+
+import re
+from array import array
+from decimal import Decimal, ROUND_HALF_EVEN
+from config.config import DEFAULT_CURRENCY
+
+# Currency symbols and words, matched case-insensitively, to ISO 4217 codes
+CURRENCY_SYMBOLS = {
+    "$": "USD", "us$": "USD", "usd": "USD", "€": "EUR", "eur": "EUR", "£": "GBP", "gbp": "GBP",
+    "¥": "JPY", "jpy": "JPY", "₹": "INR", "rs": "INR", "rs.": "INR", "inr": "INR", "c$": "CAD",
+    "cad": "CAD", "a$": "AUD", "aud": "AUD", "chf": "CHF", "fr.": "CHF", "kr": "SEK", "sek": "SEK",
+    "zł": "PLN", "pln": "PLN", "r$": "BRL", "brl": "BRL", "₩": "KRW", "krw": "KRW",
+}
+# Symbols used when formatting an amount, other currencies are written with their code
+CURRENCY_FORMAT_SYMBOLS = {"USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥", "INR": "₹"}
+
+# Characters used to group thousands: any space, including no-break spaces, and apostrophes (1'234.50)
+_group_characters = re.compile(r"[\s'’]")
+# A currency symbol or word, without dots or commas so that they stay with the number ($.50),
+# except for the currency words that end in a dot (Rs.)
+_currency = r"(?i:{})|[^\d\s.,()+-]+".format("|".join(re.escape(token) for token in CURRENCY_SYMBOLS
+                                                     if token.endswith(".")))
+_money = re.compile(
+    r"^(?P<open>\()?\s*(?P<lead>[-+])?\s*(?P<prefix>{0})?\s*(?P<sign>[-+])?\s*"
+    r"(?P<number>\d[\d\s'’.,]*|[.,]\d+)\s*(?P<suffix>{0})?\s*"
+    r"(?P<trail>-)?\s*(?P<close>\))?$".format(_currency)
+)
+
+# The common shapes, $1,234.50 or 1234.5, parsed without the general pattern; the decimal mark is unambiguous
+_simple_money = re.compile(r"(-)?([$€£¥₹])?(\d{1,3}(?:,\d{3})+\.\d{1,2}|\d+(?:\.\d{1,2})?)$")
+_SIMPLE_CURRENCIES = {None: None, "$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR"}
+
+# A whole column of non-negative amounts with two decimals, one amount per line, e.g. $1,234.50\n99.00
+_AMOUNT_WITH_CENTS = r"[$€£¥₹]?[\d,]+\.\d\d"
+_uniform_column = re.compile(r"{0}(?:\n{0})*".format(_AMOUNT_WITH_CENTS))
+_strip_symbols = str.maketrans("", "", "$€£¥₹,.")
+
+_CENT = Decimal("0.01")
+
+
+def currency_code(token):
+    """ISO code of a currency symbol or word, None when it is not a known currency."""
+    if not token:
+        return None
+    token = token.strip()
+    code = CURRENCY_SYMBOLS.get(token.lower())
+    if code is None and len(token) == 3 and token.isalpha() and token.isupper():
+        code = token
+    return code
+
+
+def decimal_mark_of(number):
+    """
+    The decimal mark a number uses: '.', ',' or None when it cannot be told, e.g. 1,234 or 1.234.
+    When both marks appear the last one is the decimal mark, a mark repeated is a thousands separator.
+    """
+    number = _group_characters.sub("", number)
+    dot, comma = number.rfind("."), number.rfind(",")
+    if dot >= 0 and comma >= 0:
+        return "." if dot > comma else ","
+    mark = "." if dot >= 0 else "," if comma >= 0 else None
+    if mark is None or number.count(mark) > 1:
+        return "." if mark == "," else "," if mark == "." else None
+    return None if len(number) - number.rfind(mark) - 1 == 3 else mark
+
+
+def _cents_of(number, decimal_mark):
+    number = _group_characters.sub("", number)
+    group_mark = "," if decimal_mark == "." else "."
+    number = number.replace(group_mark, "")
+    whole, _, fraction = number.partition(decimal_mark)
+    if decimal_mark in fraction:
+        raise ValueError("More than one decimal mark in {}".format(number))
+    if len(fraction) <= 2:
+        return int(whole or "0") * 100 + int(fraction.ljust(2, "0"))
+    # More than two decimals, rounded like Decimal.quantize so the cents match parse_amount
+    return int(Decimal("{}.{}".format(whole or "0", fraction)).quantize(_CENT, ROUND_HALF_EVEN) * 100)
+
+
+def _parse_simple_money(text):
+    match = _simple_money.match(text)
+    if match is None:
+        return None
+    sign, symbol, number = match.groups()
+    whole, _, fraction = number.partition(".")
+    cents = int(whole.replace(",", "")) * 100 + (int(fraction.ljust(2, "0")) if fraction else 0)
+    return -cents if sign else cents, _SIMPLE_CURRENCIES[symbol]
+
+
+def parse_money(value, decimal_mark=None):
+    """
+    Parses an amount such as '$1,234.50', '1.234,50 €', 'EUR 12', '(45.00)' or '₹1,23,456' into
+    exact integer cents and its currency code.
+
+    Args:
+        value: The amount, a string or a number.
+        decimal_mark (str): '.' or ','. Used when the number alone does not tell, e.g. '1,234';
+            defaults to '.'.
+
+    Returns:
+        tuple: The amount in cents and the currency code, or None when no currency is written.
+        'NA', empty and unparsable values are (0, None), as with parse_amount.
+    """
+    if value is None or isinstance(value, bool):
+        return 0, None
+    if isinstance(value, int):
+        return value * 100, None
+    if isinstance(value, (float, Decimal)):
+        return int(Decimal(str(value)).quantize(_CENT, ROUND_HALF_EVEN) * 100), None
+    text = str(value).strip()
+    simple = _parse_simple_money(text)
+    if simple is not None:
+        return simple
+    match = _money.match(text)
+    if match is None or bool(match.group("open")) != bool(match.group("close")):
+        return 0, None
+    prefix, suffix = match.group("prefix"), match.group("suffix")
+    currency = currency_code(prefix) or currency_code(suffix)
+    if (prefix and currency_code(prefix) is None) or (suffix and currency_code(suffix) is None):
+        return 0, None
+    number = match.group("number").strip()
+    mark = decimal_mark_of(number) or decimal_mark or "."
+    try:
+        cents = _cents_of(number, mark)
+    except ValueError:
+        return 0, None
+    negative = bool(match.group("open")) or "-" in (match.group("lead"), match.group("sign"), match.group("trail"))
+    return -cents if negative else cents, currency
+
+
+def format_cents(cents, currency=None):
+    """Formats cents as a currency string with 2 decimal places, e.g. -$1,234.50 or -CHF 12.00."""
+    currency = currency or DEFAULT_CURRENCY
+    symbol = CURRENCY_FORMAT_SYMBOLS.get(currency, currency + " ")
+    sign = "-" if cents < 0 else ""
+    whole, fraction = divmod(abs(cents), 100)
+    return "{}{}{:,}.{:02d}".format(sign, symbol, whole, fraction)
+
+
+def cents_to_decimal(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+class MoneyColumn:
+    """
+    A column of amounts stored as signed 64-bit integer cents, with the currency of each amount
+    as a small index into a table of codes. Sums run over the packed array, not over objects.
+    """
+
+    __slots__ = ("cents", "currency_ids", "codes")
+
+    def __init__(self, cents=None, currency_ids=None, codes=None):
+        self.cents = cents if cents is not None else array("q")
+        self.currency_ids = currency_ids if currency_ids is not None else array("B")
+        self.codes = codes if codes is not None else [None]
+
+    @classmethod
+    def _parse_uniform(cls, values):
+        """
+        Parses a column whose amounts all have two decimals and the same symbol, or none, in bulk:
+        the column is checked with one pattern and converted without a Python loop per amount.
+        """
+        if not values or not all(isinstance(value, str) for value in values):
+            return None
+        joined = "\n".join(values)
+        if not _uniform_column.fullmatch(joined):
+            return None
+        symbol = values[0][0] if values[0][0] in _SIMPLE_CURRENCIES else None
+        if symbol is not None and joined.count(symbol) != len(values):
+            return None
+        if symbol is None and any(joined.count(other) for other in _SIMPLE_CURRENCIES if other):
+            return None
+        cents = array("q", map(int, joined.translate(_strip_symbols).split("\n")))
+        code = _SIMPLE_CURRENCIES[symbol]
+        return cls(cents, array("B", [1 if code else 0]) * len(cents), [None, code] if code else [None])
+
+    @classmethod
+    def parse(cls, values):
+        """
+        Parses a column of amounts in one pass. Repeated strings are parsed once, and numbers whose
+        decimal mark is ambiguous (1,234) follow the mark the rest of the column uses.
+        """
+        values = list(values)
+        uniform = cls._parse_uniform(values)
+        if uniform is not None:
+            return uniform
+        parsed = {}
+        marks = {}
+        votes = {".": 0, ",": 0}
+        for value in values:
+            if isinstance(value, str) and value not in parsed and value not in marks:
+                simple = _parse_simple_money(value.strip())
+                if simple is not None:
+                    parsed[value] = simple
+                    if "." in value:
+                        votes["."] += 1
+                    continue
+                match = _money.match(value.strip())
+                mark = decimal_mark_of(match.group("number")) if match else None
+                marks[value] = mark
+                if mark:
+                    votes[mark] += 1
+        column_mark = "," if votes[","] > votes["."] else "."
+
+        column = cls()
+        code_ids = {None: 0}
+        cents, currency_ids = column.cents, column.currency_ids
+        for value in values:
+            key = value if isinstance(value, str) else None
+            result = parsed.get(key) if key is not None else None
+            if result is None:
+                result = parse_money(value, column_mark)
+                if key is not None:
+                    parsed[key] = result
+            amount, code = result
+            code_id = code_ids.get(code)
+            if code_id is None:
+                code_id = code_ids[code] = len(column.codes)
+                column.codes.append(code)
+            cents.append(amount)
+            currency_ids.append(code_id)
+        return column
+
+    def __len__(self):
+        return len(self.cents)
+
+    def total(self):
+        return sum(self.cents)
+
+    def currencies(self):
+        """The currency codes written in the column, in order of appearance."""
+        used = set(self.currency_ids)
+        return [code for code_id, code in enumerate(self.codes) if code is not None and code_id in used]
+
+    def currency(self, position):
+        return self.codes[self.currency_ids[position]]
+
+    def format(self, position, default_currency=None):
+        return format_cents(self.cents[position], self.currency(position) or default_currency)
+
+    def format_all(self, default_currency=None):
+        """Every amount formatted like format_cents, in one pass over the column."""
+        if not self.cents:
+            return []
+        if len(set(self.currency_ids)) > 1 or min(self.cents) < 0:
+            return [self.format(position, default_currency) for position in range(len(self.cents))]
+        currency = self.currency(0) or default_currency or DEFAULT_CURRENCY
+        symbol = CURRENCY_FORMAT_SYMBOLS.get(currency, currency + " ")
+        return ["{}{:,}.{:02d}".format(symbol, cents // 100, cents % 100) for cents in self.cents]
+
+
+class BillLedger:
+    """The subtotal, tax and total of a list of bills, each parsed once into a MoneyColumn."""
+
+    FIELDS = ("bill_subtotal_paid", "bill_tax_paid", "bill_total_paid")
+
+    def __init__(self, bills):
+        self.columns = {field: MoneyColumn.parse(bill.get(field) for bill in bills) for field in self.FIELDS}
+
+    def __len__(self):
+        return len(self.columns["bill_total_paid"])
+
+    def total(self, field):
+        return self.columns[field].total()
+
+    def currencies(self):
+        seen = []
+        for column in self.columns.values():
+            seen.extend(code for code in column.currencies() if code not in seen)
+        return seen
+
+    def format(self, field, position, default_currency=None):
+        return self.columns[field].format(position, default_currency)
+
+    def format_all(self, field, default_currency=None):
+        return self.columns[field].format_all(default_currency)
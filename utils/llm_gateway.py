@@ -0,0 +1,346 @@
+"""
+Filename: llm_gateway.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Single entry point for LLM calls with client reuse, rate limiting, retries and
+             concurrency control.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from utils.logs import logger
+from utils.metrics import stage, LLM_CALL_SECONDS, LLM_TOKENS, LLM_RETRIES
+from config.config import get_provider, METRICS_ENABLED
+from config.config import (gemini_model_name, LLM_BACKEND, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE,
+                           LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES, LLM_TIMEOUT_SECONDS, LLM_BACKOFF_BASE_SECONDS,
+                           LLM_BACKOFF_MAX_SECONDS, LLM_FAKE_LATENCY_SECONDS)
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Raised when an LLM call fails for good."""
+
+
+class LLMTimeoutError(LLMError):
+    """Raised when an LLM call cannot complete before its deadline."""
+
+
+class LLMResponse:
+    """The text of a completion and its token usage."""
+
+    def __init__(self, text, input_tokens=0, output_tokens=0, model_name=None):
+        self.text = text
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.model_name = model_name
+
+
+def estimate_tokens(text):
+    """Rough token count used for rate limiting, about four characters per token."""
+    return len(text) // 4 + 1
+
+
+class LLMBackend(ABC):
+    """A model provider that the gateway can call."""
+
+    @abstractmethod
+    def generate(self, prompt, model_name, timeout, generation_config=None):
+        """Returns an LLMResponse, raising the provider's exception on failure."""
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini backend, one long-lived GenerativeModel per model name."""
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, model_name):
+        model = self._models.get(model_name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    # The Gemini SDK is imported and configured on first use
+                    genai = get_provider("gemini")
+                    model = genai.GenerativeModel(model_name)
+                    self._models[model_name] = model
+        return model
+
+    def generate(self, prompt, model_name, timeout, generation_config=None):
+        response = self.get_model(model_name).generate_content(
+            prompt,
+            generation_config=generation_config,
+            request_options={"timeout": timeout}
+        )
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResponse(
+            response.text,
+            input_tokens=getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt),
+            output_tokens=getattr(usage, "candidates_token_count", 0) or estimate_tokens(response.text),
+            model_name=model_name
+        )
+
+
+def default_fake_response(prompt, model_name):
+    """A syntactically valid extraction with every field missing, enough for load runs."""
+    fields = ["invoice_number", "invoice_date", "invoice_due_date", "invoice_to", "contact_number", "email",
+              "invoice_subtotal_due", "invoice_tax_due", "invoice_total_due", "bill_number", "bill_date",
+              "bill_payment_date", "bill_paid_by", "bill_subtotal_paid", "bill_tax_paid", "bill_total_paid"]
+    details = {field: "NA" for field in fields}
+    details["line_items"] = []
+    return json.dumps(details)
+
+
+class FakeBackend(LLMBackend):
+    """
+    Local stand-in for a model, for tests and load runs.
+
+    Args:
+        responder: Called with (prompt, model_name), returns the completion text.
+        latency (float): Seconds each call takes.
+    """
+
+    def __init__(self, responder=default_fake_response, latency=0.0):
+        self.responder = responder
+        self.latency = latency
+        self.calls = 0
+
+    def generate(self, prompt, model_name, timeout, generation_config=None):
+        self.calls += 1
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        text = self.responder(prompt, model_name)
+        return LLMResponse(text, estimate_tokens(prompt), estimate_tokens(text), model_name)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at rate_per_minute.
+
+    Consumers may take more than is available, the debt is paid back before anyone
+    else is let through. This keeps the limit exact when the real cost of a call is
+    only known after it returned.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount, deadline):
+        """
+        Waits until the bucket has room for amount, then takes it.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                wait = (amount - self._tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                raise LLMTimeoutError("Rate limit wait exceeds the call deadline")
+            time.sleep(wait)
+            waited += wait
+
+    def consume(self, amount):
+        """Takes amount without waiting, possibly leaving the bucket in debt."""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+
+def get_status_code(error):
+    """Returns the HTTP status code carried by a provider exception, if any."""
+    for attribute in ("code", "status_code", "http_status"):
+        value = getattr(error, attribute, None)
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                value = None
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return get_status_code(error) in RETRYABLE_STATUS_CODES
+
+
+class LLMGateway:
+    """
+    Every LLM call of the application goes through one gateway.
+
+    The gateway reuses the backend's clients, limits requests and tokens per minute with
+    token buckets, caps the number of calls in flight, enforces a deadline per call and
+    retries rate limited and server errors with jittered exponential backoff.
+    """
+
+    def __init__(self, backend: LLMBackend, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_retries=LLM_MAX_RETRIES, timeout=LLM_TIMEOUT_SECONDS,
+                 backoff_base=LLM_BACKOFF_BASE_SECONDS, backoff_max=LLM_BACKOFF_MAX_SECONDS):
+        self.backend = backend
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._in_flight = threading.BoundedSemaphore(max_concurrency)
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0, "timeouts": 0,
+            "throttled_calls": 0, "throttled_seconds": 0.0, "in_flight": 0,
+            "input_tokens": 0, "output_tokens": 0, "latency_seconds": 0.0
+        }
+
+    def _record(self, **increments):
+        with self._metrics_lock:
+            for name, value in increments.items():
+                self.metrics[name] += value
+
+    def get_metrics(self):
+        with self._metrics_lock:
+            return dict(self.metrics)
+
+    def _throttle(self, prompt_tokens, deadline):
+        waited = self.request_bucket.acquire(1, deadline)
+        waited += self.token_bucket.acquire(prompt_tokens, deadline)
+        if waited:
+            self._record(throttled_calls=1, throttled_seconds=waited)
+
+    def generate(self, prompt, model_name=None, timeout=None, generation_config=None):
+        """
+        Calls the model and returns an LLMResponse.
+
+        Args:
+            prompt (str): The prompt.
+            model_name (str): Defaults to the configured Gemini model.
+            timeout (float): Deadline of the whole call, retries and waits included, in seconds.
+            generation_config (dict): Passed to the backend, e.g. a response schema.
+
+        Raises:
+            LLMTimeoutError: When the deadline passes.
+            LLMError: When the call still fails after the retries.
+        """
+        model_name = model_name or gemini_model_name
+        outcome = "error"
+        started = time.monotonic()
+        with stage("llm_call", model=model_name) as span:
+            try:
+                response = self._generate(prompt, model_name, timeout, generation_config)
+                outcome = "success"
+            except LLMTimeoutError:
+                outcome = "timeout"
+                raise
+            finally:
+                if METRICS_ENABLED:
+                    LLM_CALL_SECONDS.observe(time.monotonic() - started, model=model_name, outcome=outcome)
+            if METRICS_ENABLED:
+                LLM_TOKENS.inc(response.input_tokens, model=model_name, direction="input")
+                LLM_TOKENS.inc(response.output_tokens, model=model_name, direction="output")
+            span.update(input_tokens=response.input_tokens, output_tokens=response.output_tokens)
+            return response
+
+    def _generate(self, prompt, model_name, timeout, generation_config):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        prompt_tokens = estimate_tokens(prompt)
+        self._record(calls=1)
+
+        if not self._in_flight.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self._record(timeouts=1, failures=1)
+            raise LLMTimeoutError("Timed out waiting for a free LLM slot")
+        self._record(in_flight=1)
+        try:
+            attempt = 0
+            while True:
+                try:
+                    self._throttle(prompt_tokens, deadline)
+                except LLMTimeoutError:
+                    self._record(timeouts=1, failures=1)
+                    raise
+                started = time.monotonic()
+                try:
+                    response = self.backend.generate(prompt, model_name, max(deadline - started, 0.001),
+                                                     generation_config)
+                except Exception as e:
+                    backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        self._record(failures=1)
+                        raise LLMError("LLM call to {} failed: {}".format(model_name, e)) from e
+                    if time.monotonic() + backoff > deadline:
+                        self._record(timeouts=1, failures=1)
+                        raise LLMTimeoutError("LLM call to {} timed out after {} attempts".format(
+                            model_name, attempt + 1)) from e
+                    logger.warning("Retrying LLM call to {} in {:.2f}s after: {}".format(model_name, backoff, e))
+                    self._record(retries=1)
+                    if METRICS_ENABLED:
+                        LLM_RETRIES.inc(model=model_name)
+                    time.sleep(backoff)
+                    attempt += 1
+                    continue
+                # Charge what the prompt really cost beyond the estimate, plus the completion
+                self.token_bucket.consume(max(response.input_tokens - prompt_tokens, 0) + response.output_tokens)
+                self._record(successes=1, input_tokens=response.input_tokens,
+                             output_tokens=response.output_tokens,
+                             latency_seconds=time.monotonic() - started)
+                return response
+        finally:
+            self._record(in_flight=-1)
+            self._in_flight.release()
+
+    async def agenerate(self, prompt, model_name=None, timeout=None, generation_config=None):
+        """Async variant of generate, the blocking call runs on a worker thread."""
+        return await asyncio.to_thread(self.generate, prompt, model_name, timeout, generation_config)
+
+
+def create_backend(name):
+    if name == "gemini":
+        return GeminiBackend()
+    if name == "fake":
+        return FakeBackend(latency=LLM_FAKE_LATENCY_SECONDS)
+    raise ValueError("Unknown LLM backend: {}".format(name))
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway():
+    """Returns the process-wide gateway using the backend selected by LLM_BACKEND."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(create_backend(LLM_BACKEND))
+    return _gateway
+
+
+def set_llm_gateway(gateway):
+    """Replaces the process-wide gateway, e.g. with one using a FakeBackend."""
+    global _gateway
+    _gateway = gateway
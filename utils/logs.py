@@ -6,7 +6,26 @@ License: MIT License
 Description: Logging utility functions.
 """
 
+import json
 import logging
+import random
+from config.config import LOG_LEVEL, LOG_FORMAT
+
+
+class JSONFormatter(logging.Formatter):
+    """Writes each record as one JSON object, merging the fields of structured events."""
+
+    def format(self, record):
+        entry = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name}
+        fields = getattr(record, "fields", None)
+        if fields is not None:
+            entry.update(fields)
+        else:
+            entry["message"] = record.getMessage()
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
 
 # Configure logging to print logs to console
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -14,8 +33,32 @@ logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %
 # Get the root logger
 root_logger = logging.getLogger()
 
-# Set the level of the root logger to DEBUG
-root_logger.setLevel(logging.INFO)
+# Set the level of the root logger, INFO unless LOG_LEVEL says otherwise
+root_logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+
+if LOG_FORMAT == "json":
+    for handler in root_logger.handlers:
+        handler.setFormatter(JSONFormatter())
 
 # Define a logger
-logger = logging.getLogger(__name__)
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+
+def log_event(level, event, sample_rate=1.0, **fields):
+    """
+    Logs a structured event, e.g. log_event(logging.DEBUG, "llm_response", text=response.text).
+
+    Nothing is formatted unless the level is enabled and the event is sampled, so large
+    payloads cost nothing when they are not written. A field given as a callable is only
+    computed then. With LOG_FORMAT=json the fields become keys of the JSON line, otherwise
+    they are appended as key=value pairs.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return
+    fields = {"event": event, **{name: value() if callable(value) else value for name, value in fields.items()}}
+    if LOG_FORMAT == "json":
+        logger.log(level, event, extra={"fields": fields})
+    else:
+        logger.log(level, " ".join("{}={}".format(name, value) for name, value in fields.items()))
@@ -0,0 +1,302 @@
+"""
+Filename: matching.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Indexed exact, fuzzy and semantic matching of bill line items against invoice line items.
+"""
+
+import re
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+from utils.general import parse_amount, clean_currency
+from config.config import (FUZZY_MATCH_THRESHOLD, RECONCILIATION_TOLERANCE, LINE_ITEM_MATCH_MODE,
+                           SEMANTIC_MATCH_THRESHOLD)
+
+NGRAM_SIZE = 3
+# Fuzzy candidates scored exactly per bill line item, picked by shared n-gram count
+MAX_FUZZY_CANDIDATES = 50
+# N-grams shared by more than this share of the invoice items are skipped while blocking
+MAX_POSTING_RATIO = 0.1
+
+_non_alphanumeric = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_description(description):
+    """Lowercases a line item description and collapses punctuation and whitespace."""
+    return _non_alphanumeric.sub(" ", (description or "").lower()).strip()
+
+
+def description_ngrams(normalized, size=NGRAM_SIZE):
+    """Returns the set of character n-grams of a normalized description, padded at the word edges."""
+    padded = " {} ".format(normalized)
+    return frozenset(padded[i:i + size] for i in range(max(len(padded) - size + 1, 1)))
+
+
+def as_item_list(items):
+    """Line items as a list, extractions sometimes give them as a dict keyed by position."""
+    if isinstance(items, dict):
+        return list(items.values())
+    return items or []
+
+
+def get_bill_item_amount(item):
+    return parse_amount(item.get('amount') or item.get('Amount') or '0')
+
+
+class InvoiceLineItem:
+    """An invoice line item with its description and amounts parsed once."""
+
+    __slots__ = ("position", "description", "normalized", "ngrams", "amount", "quantity_rate_consistent")
+
+    def __init__(self, position, item):
+        self.position = position
+        self.description = item.get('description') or ''
+        self.normalized = normalize_description(self.description)
+        self.ngrams = description_ngrams(self.normalized)
+        self.amount = parse_amount(item.get('line_total') or '0')
+        self.quantity_rate_consistent = check_quantity_rate(item, self.amount)
+
+
+def check_quantity_rate(item, line_total):
+    """
+    Checks that quantity x rate equals the line total of an invoice item.
+
+    Returns:
+        bool: The result of the check, or None when quantity or rate is missing or not a number.
+    """
+    if item.get('hrs_or_quantity') in (None, '', 'NA') or item.get('rate_or_cost') in (None, '', 'NA'):
+        return None
+    try:
+        quantity = Decimal(clean_currency(item.get('hrs_or_quantity')).strip())
+        rate = Decimal(clean_currency(item.get('rate_or_cost')).strip())
+    except (InvalidOperation, ValueError):
+        return None
+    expected = (quantity * rate).quantize(Decimal("0.01"))
+    return abs(expected - line_total) <= RECONCILIATION_TOLERANCE
+
+
+class LineItemIndex:
+    """
+    Index over the line items of one invoice, built once per reconciliation.
+
+    Exact matches are found through a hash index on the normalized description. Near
+    matches are found by blocking on character n-grams: only invoice items that share
+    n-grams with a bill description are scored, so a lookup does not scan every item.
+    Invoice items that have already matched a bill item are consumed, so duplicate
+    descriptions are paired one to one whenever possible.
+    """
+
+    def __init__(self, invoice_items, fuzzy_threshold=FUZZY_MATCH_THRESHOLD):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.items = [InvoiceLineItem(position, item) for position, item in enumerate(as_item_list(invoice_items))]
+        self.exact = defaultdict(list)
+        self.postings = defaultdict(list)
+        self.consumed = set()
+        for item in self.items:
+            self.exact[item.normalized].append(item)
+            for ngram in item.ngrams:
+                self.postings[ngram].append(item.position)
+        self.max_posting = max(50, int(len(self.items) * MAX_POSTING_RATIO))
+
+    def _pick(self, candidates, amount):
+        """Prefers an unconsumed item with the same amount, then any with the same amount, then unconsumed."""
+        best = None
+        best_rank = None
+        for item in candidates:
+            rank = (item.amount == amount, item.position not in self.consumed)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = item, rank
+                if rank == (True, True):
+                    break
+        return best
+
+    def _fuzzy_candidates(self, ngrams):
+        postings = [self.postings[ngram] for ngram in ngrams if ngram in self.postings]
+        selective = [posting for posting in postings if len(posting) <= self.max_posting]
+        shared = Counter()
+        for posting in selective or postings:
+            shared.update(posting)
+        return [self.items[position] for position, _ in shared.most_common(MAX_FUZZY_CANDIDATES)]
+
+    def find(self, description, amount):
+        """
+        Finds the invoice item matching a bill line item.
+
+        Returns:
+            tuple: The matching InvoiceLineItem (or None), the match type ('exact', 'semantic' or 'fuzzy')
+            and a confidence score between 0 and 1.
+        """
+        normalized = normalize_description(description)
+        exact_candidates = self.exact.get(normalized)
+        if exact_candidates:
+            return self._pick(exact_candidates, amount), "exact", 1.0
+
+        ngrams = description_ngrams(normalized)
+        best = None
+        best_score = None
+        for item in self._fuzzy_candidates(ngrams):
+            similarity = 2 * len(ngrams & item.ngrams) / (len(ngrams) + len(item.ngrams))
+            if similarity < self.fuzzy_threshold:
+                continue
+            score = (similarity, item.amount == amount, item.position not in self.consumed)
+            if best_score is None or score > best_score:
+                best, best_score = item, score
+        if best is None:
+            return None, None, 0.0
+        return best, "fuzzy", round(best_score[0], 4)
+
+    def consume(self, item):
+        self.consumed.add(item.position)
+
+    def release(self, positions):
+        """Makes consumed invoice items available again, e.g. when their bill is removed."""
+        self.consumed.difference_update(positions)
+
+    def prepare(self, bill_items):
+        """Called with the line items of every bill before they are looked up, see SemanticLineItemIndex."""
+
+
+class SemanticLineItemIndex(LineItemIndex):
+    """
+    Adds embedding similarity between the exact and the fuzzy lookups, so that 'Foundation labour'
+    finds 'Foundation Labor'.
+
+    prepare embeds the descriptions of every bill in batched calls and scores them against the
+    invoice items in one vectorized pass. Bill items are then paired one to one with the invoice
+    items, most similar first, preferring equal amounts on ties. Items with an exact match take
+    no part, and a bill item left unpaired still gets the fuzzy lookup.
+    """
+
+    def __init__(self, invoice_items, fuzzy_threshold=FUZZY_MATCH_THRESHOLD,
+                 semantic_threshold=SEMANTIC_MATCH_THRESHOLD, embedder=None):
+        super().__init__(invoice_items, fuzzy_threshold)
+        self.semantic_threshold = semantic_threshold
+        self.embedder = embedder
+        # (normalized description, amount) -> [(invoice item, similarity)], in bill item order
+        self.assigned = defaultdict(list)
+
+    def prepare(self, bill_items):
+        import numpy as np
+        from utils.embeddings import embed_texts, create_vector_index, assign_one_to_one
+        bill_descriptions = set()
+        queries = []
+        for item in bill_items:
+            normalized = normalize_description(item.get('description'))
+            bill_descriptions.add(normalized)
+            if normalized and normalized not in self.exact:
+                queries.append((normalized, get_bill_item_amount(item)))
+        # Invoice items that a bill item matches exactly are left to that bill item
+        candidates = [item for item in self.items if item.normalized not in bill_descriptions]
+        if not queries or not candidates:
+            return
+
+        query_vectors = embed_texts([normalized for normalized, _ in queries], self.embedder)
+        vector_index = create_vector_index(embed_texts([item.normalized for item in candidates], self.embedder))
+        try:
+            similarities = vector_index.similarities(query_vectors)
+        finally:
+            vector_index.close()
+        same_amount = np.equal.outer(np.array([int(amount * 100) for _, amount in queries], dtype=np.int64),
+                                     np.array([int(item.amount * 100) for item in candidates], dtype=np.int64))
+        for row, column, similarity in assign_one_to_one(similarities, self.semantic_threshold, same_amount):
+            self.assigned[queries[row]].append((candidates[column], round(similarity, 4)))
+
+    def find(self, description, amount):
+        normalized = normalize_description(description)
+        if normalized not in self.exact:
+            assigned = self.assigned.get((normalized, amount))
+            if assigned:
+                item, similarity = assigned.pop(0)
+                return item, "semantic", similarity
+        return super().find(description, amount)
+
+
+def create_line_item_index(invoice_items, mode=LINE_ITEM_MATCH_MODE):
+    """The index of the LINE_ITEM_MATCH_MODE, 'fuzzy' or 'semantic'."""
+    if mode == "semantic":
+        return SemanticLineItemIndex(invoice_items)
+    if mode == "fuzzy":
+        return LineItemIndex(invoice_items)
+    raise ValueError("Unknown line item match mode: {}".format(mode))
+
+
+def match_line_items(invoice_items, bill_items, index: LineItemIndex = None, consumed: list = None):
+    """
+    Matches bill line items against invoice line items.
+
+    Args:
+        invoice_items (list): The invoice line items, ignored when index is given.
+        bill_items (list): The bill line items.
+        index (LineItemIndex): An index built once for the invoice and shared by all its bills,
+            already prepared with their line items. By default one is built in LINE_ITEM_MATCH_MODE.
+        consumed (list): Receives the positions of the invoice items these bill items matched, so
+            that they can be released again with LineItemIndex.release.
+
+    Returns:
+        tuple: The matched items and the mismatched items.
+    """
+    bill_items = as_item_list(bill_items)
+    if index is None:
+        index = create_line_item_index(invoice_items)
+        index.prepare(bill_items)
+
+    mismatches = []
+    matched_items = []
+
+    for b_item in bill_items:
+        b_desc = (b_item.get('description') or '').strip()
+        b_amount = get_bill_item_amount(b_item)
+
+        if not b_desc:
+            mismatches.append({
+                "description": "NA",
+                "bill_amount": f"${b_amount:.2f}",
+                "invoice_amount": "NA",
+                "match": False,
+                "reason": "Missing description in bill line item"
+            })
+            continue
+
+        i_item, match_type, confidence = index.find(b_desc, b_amount)
+
+        if i_item is None:
+            mismatches.append({
+                "description": b_item['description'],
+                "bill_amount": f"${b_amount:.2f}",
+                "invoice_amount": "NA",
+                "match": False,
+                "reason": "Line item not found in invoice"
+            })
+            continue
+
+        # An invoice line whose quantity x rate disagrees with its total lowers the confidence
+        if i_item.quantity_rate_consistent is False:
+            confidence = round(confidence * 0.9, 4)
+        details = {
+            "invoice_description": i_item.description,
+            "match_type": match_type,
+            "confidence": confidence,
+            "quantity_rate_consistent": i_item.quantity_rate_consistent
+        }
+        if b_amount != i_item.amount:
+            mismatches.append({
+                "description": b_item['description'],
+                "bill_amount": f"${b_amount:.2f}",
+                "invoice_amount": f"${i_item.amount:.2f}",
+                "match": False,
+                "reason": "Amount mismatch",
+                **details
+            })
+        else:
+            index.consume(i_item)
+            if consumed is not None:
+                consumed.append(i_item.position)
+            matched_items.append({
+                "description": b_item['description'],
+                "amount": f"${b_amount:.2f}",
+                "match": True,
+                **details
+            })
+
+    return matched_items, mismatches
@@ -0,0 +1,244 @@
+"""
+Filename: metrics.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Counters and latency histograms in the Prometheus text format, and optional
+             per-request trace spans of the processing stages.
+"""
+
+import bisect
+import contextvars
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from utils.cache import LRUCache
+from utils.logs import log_event
+from config.config import METRICS_ENABLED, TRACE_SAMPLE_RATE, TRACE_HISTORY_ITEMS
+
+# Upper bounds of the latency buckets, in seconds, from a cached lookup to a slow LLM call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append('{}="{}"'.format(*extra))
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return ["{}{} {}".format(self.name, _label_text(self.label_names, key), _format_number(value))
+                for key, value in values]
+
+
+class Histogram:
+    """
+    Observations counted into fixed buckets per label set. An observation increments a single
+    bucket, the cumulative counts Prometheus expects are only computed when rendering.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Bucket counts, the last one is +Inf, then the sum of the observations
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[position] += 1
+            series[-1] += value
+
+    def get(self, **labels):
+        """The count and sum of the observations of a label set."""
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            return (sum(series[:-1]), series[-1]) if series else (0, 0.0)
+
+    def render(self):
+        with self._lock:
+            series_list = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in series_list:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(
+                    self.name, _label_text(self.label_names, key, ("le", _format_number(float(bound)))), cumulative))
+            lines.append("{}_sum{} {}".format(self.name, _label_text(self.label_names, key), repr(series[-1])))
+            lines.append("{}_count{} {}".format(self.name, _label_text(self.label_names, key), cumulative))
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All the metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append("# HELP {} {}".format(metric.name, metric.documentation))
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "invoice_recon_stage_seconds", "Latency of a processing stage.", ("stage", "outcome")))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "invoice_recon_http_request_seconds", "Latency of an API request until its response starts.",
+    ("method", "route", "status")))
+LLM_CALL_SECONDS = REGISTRY.register(Histogram(
+    "invoice_recon_llm_call_seconds", "Latency of an LLM call, retries and rate limit waits included.",
+    ("model", "outcome")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "invoice_recon_llm_tokens_total", "Tokens sent to and received from the LLM.", ("model", "direction")))
+LLM_RETRIES = REGISTRY.register(Counter(
+    "invoice_recon_llm_retries_total", "LLM attempts retried after a retryable error.", ("model",)))
+MODEL_ROUTING_DECISIONS = REGISTRY.register(Counter(
+    "invoice_recon_model_routing_total", "Routed extractions by the model tier whose output was kept.",
+    ("kind", "tier")))
+VALIDATION_FAILURES = REGISTRY.register(Counter(
+    "invoice_recon_validation_failures_total", "Extractions failing a local validation check, by tier.",
+    ("kind", "tier", "check")))
+
+
+class Trace:
+    """The spans of one traced request, each with its offset from the start of the request."""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name, started, duration, outcome, attributes):
+        span = {"name": name, "start_ms": round((started - self.started) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3), "outcome": outcome, **attributes}
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            return {"trace_id": self.trace_id, "spans": sorted(self.spans, key=lambda span: span["start_ms"])}
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_trace_history = LRUCache(TRACE_HISTORY_ITEMS)
+
+
+def should_trace(requested=False, sample_rate=TRACE_SAMPLE_RATE):
+    return requested or (sample_rate > 0 and random.random() < sample_rate)
+
+
+def start_trace(trace_id=None):
+    """
+    Starts tracing the current request. Stages run in this context, and in worker threads
+    started from it with run_blocking, add their spans to the trace.
+
+    Returns:
+        tuple: The trace and the token to pass to finish_trace.
+    """
+    trace = Trace(trace_id or uuid.uuid4().hex)
+    return trace, _current_trace.set(trace)
+
+
+def finish_trace(token):
+    """Stops tracing, keeps the trace for get_trace and logs it as one structured event."""
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    if trace is not None:
+        _trace_history.put(trace.trace_id, trace)
+        log_event(logging.INFO, "trace", trace_id=trace.trace_id, spans=lambda: trace.to_dict()["spans"])
+    return trace
+
+
+def get_trace(trace_id):
+    trace = _trace_history.get(trace_id)
+    return trace.to_dict() if trace is not None else None
+
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Times a processing stage into STAGE_SECONDS, and into a span when the request is traced.
+
+    Yields a dict the stage can add span attributes to, e.g. the number of bytes read.
+    """
+    if not METRICS_ENABLED and _current_trace.get() is None:
+        yield attributes
+        return
+    outcome = "ok"
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        if METRICS_ENABLED:
+            STAGE_SECONDS.observe(duration, stage=name, outcome=outcome)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, started, duration, outcome, attributes)
+
+
+def render_metrics():
+    return REGISTRY.render()
@@ -0,0 +1,112 @@
+"""
+Filename: model_routing.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Tiered model routing of extractions. Documents go to the fast model first, and only
+             those whose output fails the local checks of utils.validation are extracted again
+             with the strong model. Every decision is counted, so the escalation rate is known.
+"""
+
+import threading
+from collections import Counter
+from utils.logs import logger
+from utils.metrics import stage, MODEL_ROUTING_DECISIONS, VALIDATION_FAILURES
+from utils.llm_gateway import LLMError, LLMTimeoutError
+from utils.json_repair import JSONRepairError
+from utils.validation import validate_details
+from config.config import gemini_model_name, GEMINI_FAST_MODEL_NAME, MODEL_ROUTING_ENABLED, METRICS_ENABLED
+
+_stats_lock = threading.Lock()
+_stats = {"documents": 0, "fast_accepted": 0, "escalated": 0, "fast_errors": 0, "escalated_still_invalid": 0}
+_failed_checks = Counter()
+
+
+def get_extraction_models():
+    """The models an extraction may use, fast tier first."""
+    if MODEL_ROUTING_ENABLED:
+        return [GEMINI_FAST_MODEL_NAME, gemini_model_name]
+    return [gemini_model_name]
+
+
+def get_model_signature():
+    """Identifies the models extractions come from, part of the extraction cache key."""
+    return ">".join(get_extraction_models())
+
+
+def _record(kind, tier, problems, **increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+        if tier == "fast":
+            _failed_checks.update(problem["check"] for problem in problems)
+    if METRICS_ENABLED:
+        for problem in problems:
+            VALIDATION_FAILURES.inc(kind=kind, tier=tier, check=problem["check"])
+
+
+def accept_or_escalate(details, is_invoice, extract, strong_model=gemini_model_name):
+    """
+    Keeps details extracted by the fast model when they pass validate_details, otherwise
+    returns the extraction of the strong model.
+
+    Args:
+        details (dict): The fast tier's details, None when its call failed.
+        is_invoice (bool): The kind of document.
+        extract: Called with a model name, extracts the document with that model.
+
+    Returns:
+        dict: The details that were kept.
+    """
+    kind = "invoice" if is_invoice else "bill"
+    with stage("model_routing", kind=kind) as span:
+        if details is None:
+            problems = []
+            _record(kind, "fast", problems, documents=1, fast_errors=1)
+        else:
+            problems = validate_details(details, is_invoice)
+            if not problems:
+                _record(kind, "fast", problems, documents=1, fast_accepted=1)
+                if METRICS_ENABLED:
+                    MODEL_ROUTING_DECISIONS.inc(kind=kind, tier="fast")
+                span["tier"] = "fast"
+                return details
+            _record(kind, "fast", problems, documents=1)
+
+        logger.info("Escalating {} extraction to {}: {}".format(
+            kind, strong_model, "; ".join(problem["detail"] for problem in problems) or "fast tier call failed"))
+        details = extract(strong_model)
+        remaining = validate_details(details, is_invoice)
+        _record(kind, "strong", remaining, escalated=1, escalated_still_invalid=1 if remaining else 0)
+        if METRICS_ENABLED:
+            MODEL_ROUTING_DECISIONS.inc(kind=kind, tier="strong")
+        span.update(tier="strong", failed_checks=len(problems))
+        return details
+
+
+def route_extraction(extract, is_invoice, fast_model=GEMINI_FAST_MODEL_NAME, strong_model=gemini_model_name):
+    """
+    Extracts a document with the fast model and escalates it to the strong model when the
+    output fails validation or the fast call fails, see accept_or_escalate.
+
+    Args:
+        extract: Called with a model name, extracts the document with that model.
+        is_invoice (bool): The kind of document.
+    """
+    try:
+        details = extract(fast_model)
+    except LLMTimeoutError:
+        raise
+    except (LLMError, JSONRepairError) as e:
+        logger.warning("Fast tier extraction with {} failed: {}".format(fast_model, e))
+        details = None
+    return accept_or_escalate(details, is_invoice, extract, strong_model)
+
+
+def get_model_routing_stats():
+    """Routing decisions since the process started, with the escalation rate and the checks that failed most."""
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["failed_checks"] = dict(_failed_checks.most_common())
+    stats["escalation_rate"] = round(stats["escalated"] / stats["documents"], 4) if stats["documents"] else 0.0
+    return stats
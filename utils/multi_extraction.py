@@ -0,0 +1,195 @@
+"""
+Filename: multi_extraction.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Extracts an invoice and several bills with a single schema-constrained LLM call.
+"""
+
+import functools
+import threading
+from typing import List
+from utils.logs import logger
+from utils.llm_gateway import get_llm_gateway, estimate_tokens, LLMError, LLMTimeoutError
+from utils.json_repair import parse_json_lenient, JSONRepairError
+from utils.schemas import INVOICE_SCHEMA, BILL_SCHEMA, json_generation_config, normalize_details
+from utils.invoice_processing import fetch_document_details, extract_document, INVOICE_FIELD_GUIDE, BILL_FIELD_GUIDE
+from utils.chunked_extraction import needs_chunking
+from utils.model_routing import accept_or_escalate
+from config.config import EXTRACTION_CONTEXT_TOKENS, EXTRACTION_MAX_OUTPUT_TOKENS, EXTRACTION_MAX_DOCUMENTS_PER_CALL
+from config.config import CHUNKED_EXTRACTION_ENABLED, MODEL_ROUTING_ENABLED, GEMINI_FAST_MODEL_NAME
+
+# Tokens of the instructions around the documents in a multi-document prompt
+PROMPT_OVERHEAD_TOKENS = 1000
+# Reply tokens expected for a document: the fixed fields plus a share of its text for the line items
+BASE_OUTPUT_TOKENS = 200
+
+MULTI_DOCUMENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "documents": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "document_id": {"type": "STRING"},
+                    "invoice": dict(INVOICE_SCHEMA, nullable=True),
+                    "bill": dict(BILL_SCHEMA, nullable=True)
+                },
+                "required": ["document_id"]
+            }
+        }
+    },
+    "required": ["documents"]
+}
+
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "documents": 0, "salvaged_replies": 0, "fallback_documents": 0}
+
+
+class ExtractionDocument:
+    """A document waiting for extraction: its id in the prompt, its kind and its text."""
+
+    __slots__ = ("document_id", "is_invoice", "text", "input_tokens", "output_tokens", "chunked")
+
+    def __init__(self, document_id, is_invoice, text):
+        self.document_id = document_id
+        self.is_invoice = is_invoice
+        self.text = text or ""
+        self.input_tokens = estimate_tokens(self.text)
+        self.output_tokens = BASE_OUTPUT_TOKENS + self.input_tokens // 2
+        # Long documents are extracted chunk by chunk, never batched with others
+        self.chunked = CHUNKED_EXTRACTION_ENABLED and needs_chunking(self.text)
+
+
+def _count(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+
+
+def plan_batches(documents: List[ExtractionDocument], context_tokens=EXTRACTION_CONTEXT_TOKENS,
+                 max_output_tokens=EXTRACTION_MAX_OUTPUT_TOKENS, max_documents=EXTRACTION_MAX_DOCUMENTS_PER_CALL):
+    """
+    Groups documents, in order, into batches whose prompt fits context_tokens and whose
+    expected reply fits max_output_tokens. A document too large for any batch, or extracted in
+    chunks, gets its own.
+    """
+    batches = []
+    batch, input_tokens, output_tokens = [], PROMPT_OVERHEAD_TOKENS, 0
+    for document in documents:
+        fits = (not document.chunked and not (batch and batch[-1].chunked)
+                and len(batch) < max_documents
+                and input_tokens + document.input_tokens <= context_tokens
+                and output_tokens + document.output_tokens <= max_output_tokens)
+        if batch and not fits:
+            batches.append(batch)
+            batch, input_tokens, output_tokens = [], PROMPT_OVERHEAD_TOKENS, 0
+        batch.append(document)
+        input_tokens += document.input_tokens
+        output_tokens += document.output_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def build_multi_document_prompt(documents: List[ExtractionDocument]):
+    sections = []
+    for document in documents:
+        sections.append("<document id=\"{}\" kind=\"{}\">\n{}\n</document>".format(
+            document.document_id, "invoice" if document.is_invoice else "bill", document.text))
+    documents_text = "\n\n".join(sections)
+    return f'''
+    You are an advanced data extraction system specialized in parsing invoice and bill documents. The text below holds {len(documents)} separate documents, each between <document> tags with its id and kind. Extract the details of every document on its own and output them in a structured JSON format.
+
+    Details to extract from an invoice:
+    {INVOICE_FIELD_GUIDE}
+
+    Details to extract from a bill:
+    {BILL_FIELD_GUIDE}
+
+    Documents:
+    {documents_text}
+
+    ***Important:***
+    - Return exactly one entry in "documents" per document, with its "document_id" and its details under "invoice" or "bill" according to its kind.
+    - Only use information directly from the text of the same document. Do not infer or hallucinate values, and never mix values between documents.
+    - Double check the line items and ensure that you are not missing any of them.
+    - If a field is not found, return 'NA' for that field.
+    - Tax amount can't be less than $0.00.
+    '''
+
+
+def split_reply(reply, complete, documents: List[ExtractionDocument]):
+    """
+    Returns the details of each document found in a multi-document reply, by document id.
+    When the reply was cut short the last entry may be partial, so it is left out.
+    """
+    entries = reply.get("documents") if isinstance(reply, dict) else reply
+    if not isinstance(entries, list):
+        return {}
+    if not complete:
+        entries = entries[:-1]
+    kinds = {document.document_id: document.is_invoice for document in documents}
+    results = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        document_id = str(entry.get("document_id"))
+        if document_id not in kinds or document_id in results:
+            continue
+        details = entry.get("invoice" if kinds[document_id] else "bill")
+        if isinstance(details, dict) and details:
+            results[document_id] = normalize_details(details, kinds[document_id])
+    return results
+
+
+def extract_documents(documents: List[ExtractionDocument]):
+    """
+    Extracts a batch of documents with one LLM call.
+
+    Documents missing from the reply, e.g. because it was cut off, are extracted one by one. With
+    model routing the call goes to the fast model, and each document whose details fail
+    validation is extracted again alone with the strong model.
+
+    Returns:
+        dict: The details of every document, by document id.
+    """
+    if len(documents) == 1:
+        document = documents[0]
+        return {document.document_id: fetch_document_details(document.text, document.is_invoice)}
+
+    results = {}
+    try:
+        response = get_llm_gateway().generate(
+            build_multi_document_prompt(documents),
+            model_name=GEMINI_FAST_MODEL_NAME if MODEL_ROUTING_ENABLED else None,
+            generation_config=json_generation_config(MULTI_DOCUMENT_SCHEMA, EXTRACTION_MAX_OUTPUT_TOKENS)
+        )
+        reply, complete = parse_json_lenient(response.text)
+        if not complete:
+            _count(salvaged_replies=1)
+        results = split_reply(reply, complete, documents)
+    except LLMTimeoutError:
+        raise
+    except (LLMError, JSONRepairError) as e:
+        logger.warning("Multi-document extraction of {} documents failed: {}".format(len(documents), e))
+    _count(calls=1, documents=len(documents))
+
+    for document in documents:
+        if document.document_id in results:
+            if MODEL_ROUTING_ENABLED:
+                results[document.document_id] = accept_or_escalate(
+                    results[document.document_id], document.is_invoice,
+                    functools.partial(extract_document, document.text, document.is_invoice))
+        else:
+            logger.info("Document {} missing from the multi-document reply, extracting it alone".format(
+                document.document_id))
+            _count(fallback_documents=1)
+            results[document.document_id] = fetch_document_details(document.text, document.is_invoice)
+    return results
+
+
+def get_multi_extraction_stats():
+    with _stats_lock:
+        return dict(_stats)
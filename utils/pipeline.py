@@ -0,0 +1,322 @@
+"""
+Filename: pipeline.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Async document processing pipeline used by the API endpoints.
+"""
+
+import asyncio
+import contextvars
+import copy
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from fastapi import UploadFile
+from utils.logs import logger
+from utils.invoice_processing import (process_spooled_file, prepare_spooled_file, complete_extraction,
+                                      flag_duplicate_bill, perform_reconciliation)
+from utils.multi_extraction import ExtractionDocument, plan_batches, extract_documents
+from utils.uploads import SpooledUpload, spool_upload, new_request_id
+from utils.general import get_file_type
+from utils.extractors import check_file_type
+from utils.storage import store_reconciliations
+from utils.sessions import get_session_store
+from utils.duplicates import same_upload_candidate
+from config.config import MAX_CONCURRENT_DOCUMENTS_PER_REQUEST, MAX_CONCURRENT_DOCUMENTS_PER_PROCESS, EXTRACTION_MODE
+from config.config import DUPLICATE_DETECTION_ENABLED
+
+_executor = None
+_executor_lock = threading.Lock()
+_process_semaphore = None
+
+
+def get_executor():
+    """Returns the thread pool that runs blocking document work (disk I/O, PDF parsing, LLM calls)."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=MAX_CONCURRENT_DOCUMENTS_PER_PROCESS,
+                    thread_name_prefix="document-worker"
+                )
+    return _executor
+
+
+def get_process_semaphore():
+    """Returns the semaphore that caps in-flight documents across every request of this process."""
+    global _process_semaphore
+    if _process_semaphore is None:
+        _process_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOCUMENTS_PER_PROCESS)
+    return _process_semaphore
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking callable on the document worker pool without blocking the event loop.
+    The callable runs in a copy of the current context, so it is part of the request's trace.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+
+async def spool_uploads(files: List[UploadFile], request_id: str):
+    """
+    Spools every upload of a request concurrently, see utils.uploads.spool_upload. Fails with
+    UnsupportedFileTypeError before reading anything when a file cannot be extracted.
+    """
+    for file in files:
+        check_file_type(get_file_type(file.filename), file.filename)
+    results = await asyncio.gather(*[run_blocking(spool_upload, file, request_id) for file in files],
+                                   return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        close_uploads([result for result in results if not isinstance(result, BaseException)])
+        raise errors[0]
+    return results
+
+
+async def extract_spooled_uploads(uploads: List[SpooledUpload], kinds: List[bool], max_concurrency: int = None):
+    """
+    Extracts the details of spooled uploads concurrently.
+
+    Identical documents, by content hash and kind, are only extracted once. In the 'batched'
+    extraction mode the documents that need the LLM share as few calls as fit its context.
+
+    Args:
+        uploads (List[SpooledUpload]): The spooled uploads.
+        kinds (List[bool]): Whether each upload is an invoice (True) or a bill (False).
+        max_concurrency (int): Per-request limit on documents in flight, defaults to
+            MAX_CONCURRENT_DOCUMENTS_PER_REQUEST.
+
+    Returns:
+        list: The extracted details, in the order of uploads.
+    """
+    request_semaphore = asyncio.Semaphore(max_concurrency or MAX_CONCURRENT_DOCUMENTS_PER_REQUEST)
+    first_positions = {}
+    for position, (upload, is_invoice) in enumerate(zip(uploads, kinds)):
+        first_positions.setdefault((upload.sha256, is_invoice), position)
+
+    async def extract(position):
+        async with request_semaphore:
+            async with get_process_semaphore():
+                upload, is_invoice = uploads[position], kinds[position]
+                logger.info("Processing {} '{}'".format("invoice" if is_invoice else "bill", upload.filename))
+                return await run_blocking(process_spooled_file, upload, is_invoice)
+
+    if EXTRACTION_MODE == "batched":
+        extracted = await extract_batched(uploads, kinds, list(first_positions.values()), request_semaphore)
+    else:
+        extracted = await asyncio.gather(*[extract(position) for position in first_positions.values()])
+    details_by_key = dict(zip(first_positions.keys(), extracted))
+
+    results = []
+    for position, (upload, is_invoice) in enumerate(zip(uploads, kinds)):
+        key = (upload.sha256, is_invoice)
+        details = details_by_key[key]
+        if first_positions[key] == position:
+            results.append(details)
+        else:
+            results.append(repeated_upload_details(details, uploads, kinds, first_positions[key]))
+    return results
+
+
+def repeated_upload_details(details, uploads: List[SpooledUpload], kinds: List[bool], first_position: int):
+    """
+    The details of an upload repeating the one at first_position, in a copy so that callers can
+    change them independently. A repeated bill is flagged as a duplicate of the first upload.
+    """
+    details = copy.deepcopy(details)
+    if kinds[first_position] or not DUPLICATE_DETECTION_ENABLED:
+        return details
+    bill_index = sum(1 for is_invoice in kinds[:first_position] if not is_invoice)
+    candidate = same_upload_candidate(details, uploads[first_position].filename, bill_index)
+    details["duplicate_candidates"] = [candidate] + details.get("duplicate_candidates", [])
+    return details
+
+
+async def iter_extractions(uploads: List[SpooledUpload], kinds: List[bool], max_concurrency: int = None):
+    """
+    Extracts spooled uploads concurrently and yields (position, details) as each one finishes,
+    in completion order. Identical documents are extracted once and yielded for every position.
+
+    Documents are always extracted one per call here, even in the 'batched' extraction mode,
+    so that each result can be sent as soon as it is ready. Extractions still running when the
+    caller stops iterating are cancelled.
+    """
+    request_semaphore = asyncio.Semaphore(max_concurrency or MAX_CONCURRENT_DOCUMENTS_PER_REQUEST)
+    positions_by_key = {}
+    for position, (upload, is_invoice) in enumerate(zip(uploads, kinds)):
+        positions_by_key.setdefault((upload.sha256, is_invoice), []).append(position)
+
+    async def extract(key, positions):
+        async with request_semaphore:
+            async with get_process_semaphore():
+                return key, await run_blocking(process_spooled_file, uploads[positions[0]], key[1])
+
+    tasks = [asyncio.ensure_future(extract(key, positions)) for key, positions in positions_by_key.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            key, details = await next_done
+            positions = positions_by_key[key]
+            yield positions[0], details
+            for position in positions[1:]:
+                yield position, repeated_upload_details(details, uploads, kinds, positions[0])
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def extract_batched(uploads: List[SpooledUpload], kinds: List[bool], positions: List[int],
+                          request_semaphore: asyncio.Semaphore):
+    """
+    Prepares the documents at positions concurrently, then extracts the ones that were neither
+    cached nor matched by a template with multi-document LLM calls.
+
+    Returns:
+        list: The extracted details, in the order of positions.
+    """
+    async def run_limited(func, *args):
+        async with request_semaphore:
+            async with get_process_semaphore():
+                return await run_blocking(func, *args)
+
+    prepared = await asyncio.gather(*[run_limited(prepare_spooled_file, uploads[position], kinds[position])
+                                      for position in positions])
+    results = [details for _, details, _ in prepared]
+    documents = {}
+    for index, (position, (_, details, text)) in enumerate(zip(positions, prepared)):
+        if details is None:
+            document_id = "D{}".format(index + 1)
+            documents[document_id] = (index, ExtractionDocument(document_id, kinds[position], text))
+
+    batches = plan_batches([document for _, document in documents.values()])
+    logger.info("Extracting {} documents with {} LLM calls".format(len(documents), len(batches)))
+    for batch_results in await asyncio.gather(*[run_limited(extract_documents, batch) for batch in batches]):
+        for document_id, details in batch_results.items():
+            index, document = documents[document_id]
+            cache_key, _, text = prepared[index]
+            results[index] = await run_blocking(complete_extraction, cache_key, document.is_invoice, text, details)
+
+    for index, position in enumerate(positions):
+        if not kinds[position]:
+            results[index] = await run_blocking(flag_duplicate_bill, uploads[position], results[index],
+                                                prepared[index][2])
+    return results
+
+
+async def extract_uploads(files: List[UploadFile], kinds: List[bool], max_concurrency: int = None):
+    """Spools and extracts a list of uploads concurrently, returning the details in upload order."""
+    uploads = await spool_uploads(files, new_request_id())
+    try:
+        return await extract_spooled_uploads(uploads, kinds, max_concurrency)
+    finally:
+        close_uploads(uploads)
+
+
+async def process_documents(invoice_file: UploadFile, bill_files: List[UploadFile], max_concurrency: int = None):
+    """
+    Extracts the invoice and every bill concurrently.
+
+    Args:
+        invoice_file (UploadFile): The uploaded invoice.
+        bill_files (List[UploadFile]): The uploaded bills.
+        max_concurrency (int): Per-request limit on documents in flight, defaults to
+            MAX_CONCURRENT_DOCUMENTS_PER_REQUEST.
+
+    Returns:
+        tuple: The invoice details and the list of bill details, in upload order.
+    """
+    results = await extract_uploads([invoice_file] + list(bill_files), [True] + [False] * len(bill_files),
+                                    max_concurrency)
+    return results[0], results[1:]
+
+
+async def process_document_batch(invoice_files: List[UploadFile], bill_files: List[UploadFile],
+                                 max_concurrency: int = None):
+    """
+    Extracts a batch of invoices and bills concurrently, each distinct document exactly once.
+
+    Returns:
+        tuple: The list of invoice details and the list of bill details, in upload order.
+    """
+    results = await extract_uploads(list(invoice_files) + list(bill_files),
+                                    [True] * len(invoice_files) + [False] * len(bill_files), max_concurrency)
+    return results[:len(invoice_files)], results[len(invoice_files):]
+
+
+async def reconcile_spooled_uploads(invoice_upload: SpooledUpload, bill_uploads: List[SpooledUpload]):
+    """
+    Extracts and reconciles an invoice and its bills that were spooled beforehand, e.g. by a
+    background job. The spools are closed once done.
+
+    Returns:
+        dict: The same response as the /api/invoice/reconcile endpoint.
+    """
+    try:
+        results = await extract_spooled_uploads([invoice_upload] + list(bill_uploads),
+                                                [True] + [False] * len(bill_uploads))
+    finally:
+        close_uploads([invoice_upload] + list(bill_uploads))
+    invoice_details, bill_details_list = results[0], results[1:]
+    reconciliation_data = await run_blocking(perform_reconciliation, invoice_details, bill_details_list)
+    await persist_reconciliations([reconciliation_entry(invoice_details, bill_details_list, reconciliation_data)])
+    return {
+        "invoice_details": invoice_details,
+        "bill_details": bill_details_list,
+        "result": reconciliation_data
+    }
+
+
+async def open_session(invoice_file: UploadFile):
+    """
+    Returns the reconciliation session of an invoice, see utils.sessions. Sessions are keyed by
+    the content of the invoice file, so the invoice is only extracted when it has no session yet.
+    """
+    uploads = await spool_uploads([invoice_file], new_request_id())
+    try:
+        session_id = uploads[0].sha256[:32]
+        session = get_session_store().find(session_id)
+        if session is None:
+            invoice_details = (await extract_spooled_uploads(uploads, [True]))[0]
+            session = await run_blocking(get_session_store().open, session_id, invoice_details)
+        return session
+    finally:
+        close_uploads(uploads)
+
+
+async def add_session_bills(session, bill_files: List[UploadFile]):
+    """Extracts the new bills only and adds them to a session, returning their ids in the session."""
+    uploads = await spool_uploads(bill_files, new_request_id())
+    try:
+        bill_details_list = await extract_spooled_uploads(uploads, [False] * len(uploads))
+    finally:
+        close_uploads(uploads)
+    bill_ids = []
+    for upload, details in zip(uploads, bill_details_list):
+        # A bill repeated in this upload points at the session id of its first upload
+        for candidate in details.get("duplicate_candidates", []):
+            if "bill_index" in candidate:
+                candidate["bill_id"] = bill_ids[candidate["bill_index"]]
+        bill_ids.append(await run_blocking(session.add_bill, details, upload.filename))
+    return bill_ids
+
+
+def reconciliation_entry(invoice_details, bill_details_list, reconciliation_data):
+    return {"invoice_details": invoice_details, "bill_details": bill_details_list, "result": reconciliation_data}
+
+
+async def persist_reconciliations(entries):
+    """Stores reconciliations when a store is configured. A failure is logged, it does not fail the request."""
+    try:
+        await run_blocking(store_reconciliations, entries)
+    except Exception as e:
+        logger.warning("Could not store {} reconciliations: {}".format(len(entries), e))
+
+
+def close_uploads(uploads: List[SpooledUpload]):
+    for upload in uploads:
+        upload.close()
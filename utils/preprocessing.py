@@ -0,0 +1,172 @@
+"""
+Filename: preprocessing.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Shrinks extracted document text before it is put into an extraction prompt.
+"""
+
+import re
+import threading
+from collections import Counter
+from utils.general import PAGE_SEPARATOR
+from utils.llm_gateway import estimate_tokens
+from config.config import PROMPT_TOKEN_BUDGET
+
+# Bump whenever the output of preprocess_document_text changes, it is part of the cache key
+PREPROCESSING_VERSION = "3"
+# A line on at least this share of the pages (and on two pages or more) is page furniture
+FURNITURE_PAGE_RATIO = 0.6
+# Most lines of prose dropped after a boilerplate heading
+BOILERPLATE_BLOCK_LINES = 5
+
+_whitespace = re.compile(r"[ \t\u00a0]+")
+_money = re.compile(r"(?:[$€£₹¥]\s?\d|\d[\d,.]*[.,]\d{2}\b)")
+_digits = re.compile(r"\d")
+# An amount ending a line, as in the rows of a table, e.g. 'PCC 1,170', but not a date or a time
+_trailing_amount = re.compile(r"(?<![\d/.:-])\d[\d,]*(?:\.\d+)?\s*$")
+_page_number = re.compile(r"^(?:page\s*\d+(?:\s*(?:of|/)\s*\d+)?|\d+\s*(?:of|/)\s*\d+|-\s*\d+\s*-)$", re.IGNORECASE)
+_key_terms = re.compile(
+    r"\b(?:total|sub\s*-?\s*total|tax|vat|gst|invoice|bill|due|date|amount|paid|balance|qty|quantity|hrs|"
+    r"rate|price|description|payment|receipt|number|no\.|to:|from:|email|phone|contact)\b",
+    re.IGNORECASE
+)
+_boilerplate_heading = re.compile(
+    r"^(?:terms\s*(?:and|&)\s*conditions|terms of (?:sale|service)|disclaimer|privacy (?:notice|policy)|"
+    r"legal notice|confidentiality notice)\s*:?$",
+    re.IGNORECASE
+)
+_boilerplate_line = re.compile(
+    r"(?:all rights reserved|this is a computer[- ]generated|thank you for your business|"
+    r"does not require a signature|confidential and intended solely|printed on|powered by)",
+    re.IGNORECASE
+)
+
+_stats_lock = threading.Lock()
+_stats = {"documents": 0, "tokens_before": 0, "tokens_after": 0}
+
+
+def line_priority(line):
+    """2 for lines with amounts, 1 for lines with key terms or other numbers, 0 for the rest."""
+    if _money.search(line) or _trailing_amount.search(line):
+        return 2
+    if _key_terms.search(line) or _digits.search(line):
+        return 1
+    return 0
+
+
+def _clean_page(page):
+    """
+    Collapses whitespace and drops boilerplate blocks and lines of one page.
+
+    A block starts at a heading standing alone on its line and ends at a blank line, at the first
+    line with a number or a key term, or after BOILERPLATE_BLOCK_LINES lines. Lines with numbers
+    are never dropped as repeats, two identical rows are two line items.
+    """
+    lines = []
+    boilerplate_left = 0
+    previous = None
+    for raw_line in page.splitlines():
+        line = _whitespace.sub(" ", raw_line).strip()
+        if not line:
+            boilerplate_left = 0
+            continue
+        if _boilerplate_heading.match(line):
+            boilerplate_left = BOILERPLATE_BLOCK_LINES
+            continue
+        if boilerplate_left and not _digits.search(line) and not _key_terms.search(line):
+            boilerplate_left -= 1
+            continue
+        boilerplate_left = 0
+        if _boilerplate_line.search(line) and not _money.search(line):
+            continue
+        if _page_number.match(line) or (line == previous and not _digits.search(line)):
+            continue
+        lines.append(line)
+        previous = line
+    return lines
+
+
+def _drop_page_furniture(pages):
+    """Removes the headers and footers repeated on most pages, unless they carry numbers."""
+    if len(pages) < 2:
+        return pages
+    occurrences = Counter(line for lines in pages for line in set(lines))
+    threshold = max(2, FURNITURE_PAGE_RATIO * len(pages))
+    furniture = {line for line, count in occurrences.items() if count >= threshold and not _digits.search(line)}
+    if not furniture:
+        return pages
+    # The first occurrence is kept, headers often hold the vendor and document number
+    seen = set()
+    result = []
+    for lines in pages:
+        kept = []
+        for line in lines:
+            if line in furniture:
+                if line in seen:
+                    continue
+                seen.add(line)
+            kept.append(line)
+        result.append(kept)
+    return result
+
+
+def _apply_token_budget(pages, token_budget):
+    """Keeps the highest priority lines, in document order, until the token budget is spent."""
+    entries = [(page_index, line_index, line)
+               for page_index, lines in enumerate(pages) for line_index, line in enumerate(lines)]
+    costs = [estimate_tokens(line) for _, _, line in entries]
+    if sum(costs) <= token_budget:
+        return pages
+    order = sorted(range(len(entries)), key=lambda i: (-line_priority(entries[i][2]), i))
+    kept = set()
+    spent = 0
+    for i in order:
+        if spent + costs[i] > token_budget:
+            continue
+        kept.add(i)
+        spent += costs[i]
+    result = [[] for _ in pages]
+    for i in sorted(kept):
+        page_index, _, line = entries[i]
+        result[page_index].append(line)
+    return result
+
+
+def preprocess_document_text(text, token_budget=PROMPT_TOKEN_BUDGET):
+    """
+    Prepares extracted document text for an extraction prompt.
+
+    Whitespace is collapsed, page numbers, repeated headers/footers and boilerplate such
+    as terms and conditions are dropped, and when the text is still larger than the token
+    budget the lines without amounts or key terms go first. Page separators are kept.
+
+    Args:
+        text (str): The extracted text.
+        token_budget (int): Largest number of tokens kept, 0 disables the budget.
+
+    Returns:
+        tuple: The preprocessed text and a dict with the token counts before and after.
+    """
+    text = text or ""
+    tokens_before = estimate_tokens(text)
+    pages = [_clean_page(page) for page in text.split(PAGE_SEPARATOR)]
+    pages = _drop_page_furniture(pages)
+    if token_budget:
+        pages = _apply_token_budget(pages, token_budget)
+    result = PAGE_SEPARATOR.join("\n".join(lines) for lines in pages)
+    tokens_after = estimate_tokens(result)
+
+    with _stats_lock:
+        _stats["documents"] += 1
+        _stats["tokens_before"] += tokens_before
+        _stats["tokens_after"] += tokens_after
+    return result, {"tokens_before": tokens_before, "tokens_after": tokens_after}
+
+
+def get_preprocessing_stats():
+    """Token counts summed over every preprocessed document since the process started."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+    return stats
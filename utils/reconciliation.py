@@ -0,0 +1,149 @@
+"""
+Filename: reconciliation.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Deterministic reconciliation of an invoice against its bills.
+"""
+
+from utils.ledger import BillLedger, parse_money, format_cents, cents_to_decimal
+from config.config import RECONCILIATION_TOLERANCE
+
+# Summary lines, filled in with formatted amounts
+SUBTOTAL_DISCREPANCY_TEMPLATE = (
+    "There is a discrepancy of {difference} in the subtotal. The invoice shows a subtotal of "
+    "{invoice_amount}, while the bill indicates a subtotal of {bills_amount}."
+)
+TAX_DISCREPANCY_TEMPLATE = (
+    "There is a discrepancy of {difference} in the tax. The invoice indicates tax due of "
+    "{invoice_amount}, whereas the bill shows tax paid as {bills_amount}."
+)
+TOTAL_DISCREPANCY_TEMPLATE = (
+    "The total amount differs by {difference}. According to the invoice, the total due is "
+    "{invoice_amount}, but the bill records a total paid of {bills_amount}."
+)
+NO_DISCREPANCY_SUMMARY = "All amounts match. No discrepancies found between the invoice and bill."
+MIXED_CURRENCY_TEMPLATE = (
+    "The documents are in more than one currency ({currencies}), amounts were compared without conversion."
+)
+
+BILL_SUMMARY_FIELDS = ["bill_number", "bill_date", "bill_payment_date", "bill_subtotal_paid",
+                       "bill_tax_paid", "bill_total_paid", "bill_paid_by"]
+
+
+def format_amount(amount, currency=None):
+    """Formats a Decimal as a currency string with 2 decimal places, e.g. -$1,234.50."""
+    return format_cents(int(amount.scaleb(2)), currency)
+
+
+def is_discrepancy(difference, tolerance=RECONCILIATION_TOLERANCE):
+    """Returns True when a difference is larger than the reconciliation tolerance."""
+    return abs(difference) > tolerance
+
+
+def build_reconciliation_summary(totals, tolerance=RECONCILIATION_TOLERANCE):
+    """Renders the reconciliation summary of the amounts computed by compute_reconciliation_totals."""
+    currency = totals.get("currency")
+    lines = []
+    if is_discrepancy(totals["subtotal_difference"], tolerance):
+        lines.append(SUBTOTAL_DISCREPANCY_TEMPLATE.format(
+            difference=format_amount(totals["subtotal_difference"], currency),
+            invoice_amount=format_amount(totals["invoice_subtotal_due"], currency),
+            bills_amount=format_amount(totals["bills_subtotal_paid"], currency)
+        ))
+    if is_discrepancy(totals["tax_difference"], tolerance):
+        lines.append(TAX_DISCREPANCY_TEMPLATE.format(
+            difference=format_amount(totals["tax_difference"], currency),
+            invoice_amount=format_amount(totals["invoice_tax_due"], currency),
+            bills_amount=format_amount(totals["bills_tax_paid"], currency)
+        ))
+    if lines or is_discrepancy(totals["total_difference"], tolerance):
+        lines.append(TOTAL_DISCREPANCY_TEMPLATE.format(
+            difference=format_amount(totals["total_difference"], currency),
+            invoice_amount=format_amount(totals["invoice_total_due"], currency),
+            bills_amount=format_amount(totals["bills_total_paid"], currency)
+        ))
+    else:
+        lines.append(NO_DISCREPANCY_SUMMARY)
+    if len(totals.get("currencies", ())) > 1:
+        lines.append(MIXED_CURRENCY_TEMPLATE.format(currencies=", ".join(totals["currencies"])))
+    return " ".join(lines)
+
+
+def compute_reconciliation_totals(invoice_data, bills_data, ledger: BillLedger = None):
+    """
+    Sums the bills and computes the differences against the invoice in exact integer cents.
+
+    Every bill amount is parsed once into the ledger, pass it to build_reconciliation_result
+    to format the bills without parsing them again.
+
+    Returns:
+        dict: Decimal amounts for the invoice, the summed bills and their differences, the
+        currency of the invoice, every currency seen and the bill ledger.
+    """
+    if ledger is None:
+        ledger = BillLedger(bills_data)
+    invoice = {field: parse_money(invoice_data.get(field))
+               for field in ("invoice_subtotal_due", "invoice_tax_due", "invoice_total_due")}
+    currencies = list(dict.fromkeys([code for _, code in invoice.values() if code] + ledger.currencies()))
+    totals = {"currency": currencies[0] if currencies else None, "currencies": currencies, "ledger": ledger}
+    for invoice_field, bills_field, difference_field in (
+            ("invoice_subtotal_due", "bill_subtotal_paid", "subtotal_difference"),
+            ("invoice_tax_due", "bill_tax_paid", "tax_difference"),
+            ("invoice_total_due", "bill_total_paid", "total_difference")):
+        invoice_cents = invoice[invoice_field][0]
+        bills_cents = ledger.total(bills_field)
+        totals[invoice_field] = cents_to_decimal(invoice_cents)
+        totals[bills_field.replace("bill_", "bills_")] = cents_to_decimal(bills_cents)
+        totals[difference_field] = cents_to_decimal(invoice_cents - bills_cents)
+    return totals
+
+
+def build_reconciliation_result(invoice_data, bills_data, totals, tolerance=RECONCILIATION_TOLERANCE):
+    """Builds the reconciliation result from precomputed totals, see reconcile_amounts."""
+    discrepancies = any(
+        is_discrepancy(totals[field], tolerance)
+        for field in ("subtotal_difference", "tax_difference", "total_difference")
+    )
+    currency = totals.get("currency")
+    ledger = totals.get("ledger") or BillLedger(bills_data)
+    formatted = [ledger.format_all(field, currency) for field in BillLedger.FIELDS]
+    bills = []
+    for bill, amounts in zip(bills_data, zip(*formatted)):
+        summary = {field: bill.get(field, "NA") for field in BILL_SUMMARY_FIELDS}
+        summary.update(zip(BillLedger.FIELDS, amounts))
+        bills.append(summary)
+    return {
+        "invoice_number": invoice_data.get('invoice_number', "NA"),
+        "invoice_date": invoice_data.get('invoice_date', "NA"),
+        "invoice_due_date": invoice_data.get('invoice_due_date', "NA"),
+        "invoice_to": invoice_data.get('invoice_to', "NA"),
+        "invoice_subtotal_due": format_amount(totals["invoice_subtotal_due"], currency),
+        "invoice_tax_due": format_amount(totals["invoice_tax_due"], currency),
+        "invoice_total_due": format_amount(totals["invoice_total_due"], currency),
+        "bills": bills,
+        "subtotal_difference": format_amount(totals["subtotal_difference"], currency),
+        "tax_difference": format_amount(totals["tax_difference"], currency),
+        "total_difference": format_amount(totals["total_difference"], currency),
+        "discrepancies": str(discrepancies),
+        "reconciliation_summary": build_reconciliation_summary(totals, tolerance),
+    }
+
+
+def reconcile_amounts(invoice_data, bills_data, tolerance=RECONCILIATION_TOLERANCE):
+    """
+    Reconciles the amounts of an invoice against its bills without calling the LLM.
+
+    A difference counts as a discrepancy when its absolute value is larger than tolerance,
+    so bills that overpay the invoice are reported as well as those that underpay it.
+
+    Args:
+        invoice_data (dict): The extracted invoice details.
+        bills_data (list): The extracted details of each bill.
+        tolerance (Decimal): Largest difference still treated as a match.
+
+    Returns:
+        dict: The reconciliation result, in the format the API has always returned.
+    """
+    totals = compute_reconciliation_totals(invoice_data, bills_data)
+    return build_reconciliation_result(invoice_data, bills_data, totals, tolerance)
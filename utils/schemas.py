@@ -0,0 +1,56 @@
+"""
+Filename: schemas.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Response schemas of the extraction prompts and normalisation of extracted details.
+"""
+
+INVOICE_FIELDS = ("invoice_number", "invoice_date", "invoice_due_date", "invoice_to", "contact_number", "email",
+                  "invoice_subtotal_due", "invoice_tax_due", "invoice_total_due")
+INVOICE_LINE_ITEM_FIELDS = ("description", "hrs_or_quantity", "rate_or_cost", "line_total")
+BILL_FIELDS = ("bill_number", "bill_date", "bill_payment_date", "bill_paid_by", "bill_subtotal_paid",
+               "bill_tax_paid", "bill_total_paid")
+BILL_LINE_ITEM_FIELDS = ("description", "amount")
+
+
+def object_schema(fields, **properties):
+    """Schema of an object whose fields are all strings, plus any extra properties."""
+    schema_properties = {field: {"type": "STRING"} for field in fields}
+    schema_properties.update(properties)
+    return {"type": "OBJECT", "properties": schema_properties, "required": list(schema_properties)}
+
+
+INVOICE_SCHEMA = object_schema(
+    INVOICE_FIELDS, line_items={"type": "ARRAY", "items": object_schema(INVOICE_LINE_ITEM_FIELDS)}
+)
+BILL_SCHEMA = object_schema(
+    BILL_FIELDS, line_items={"type": "ARRAY", "items": object_schema(BILL_LINE_ITEM_FIELDS)}
+)
+
+
+def json_generation_config(schema, max_output_tokens=None):
+    """Generation config asking the model for JSON that follows schema."""
+    config = {"response_mime_type": "application/json", "response_schema": schema}
+    if max_output_tokens:
+        config["max_output_tokens"] = max_output_tokens
+    return config
+
+
+def normalize_details(details, is_invoice):
+    """
+    Gives extracted details the shape the reconciliation expects: every field present,
+    missing ones as 'NA', and line_items as a list of objects.
+    """
+    if not isinstance(details, dict):
+        details = {}
+    fields = INVOICE_FIELDS if is_invoice else BILL_FIELDS
+    for field in fields:
+        value = details.get(field)
+        details[field] = "NA" if value is None or value == "" else str(value)
+    line_items = details.get("line_items")
+    if isinstance(line_items, dict):
+        line_items = list(line_items.values()) if all(isinstance(v, dict) for v in line_items.values()) \
+            else [line_items]
+    details["line_items"] = [item for item in line_items or [] if isinstance(item, dict)]
+    return details
@@ -0,0 +1,305 @@
+"""
+Filename: sessions.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Incremental reconciliation sessions: an invoice whose bills are added and removed one
+             at a time, with running totals and line item matches updated for that bill only.
+             Sessions are kept in a SQLite file, so they outlive the process that opened them.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from utils.cache import LRUCache
+from utils.ledger import BillLedger, parse_money, format_cents
+from utils.matching import create_line_item_index, match_line_items, as_item_list
+from utils.reconciliation import compute_reconciliation_totals, build_reconciliation_result
+from utils.duplicates import collect_duplicate_flags
+from config.config import SESSION_MAX_ITEMS, SESSION_STORE_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY, invoice_details TEXT, next_bill_number INTEGER, version INTEGER, created_at REAL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS session_bills (
+    session_id TEXT, number INTEGER, filename TEXT, bill_details TEXT, PRIMARY KEY (session_id, number)
+);
+"""
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+class SessionNotFoundError(Exception):
+    """Raised for a session or a bill of a session that does not exist."""
+
+
+class RunningLedger:
+    """
+    The BillLedger interface over bills added and removed one at a time. Each bill is parsed when
+    it is added and the totals are kept up to date, so reading them costs nothing.
+    """
+
+    FIELDS = BillLedger.FIELDS
+
+    def __init__(self):
+        # bill id -> {field: (cents, currency code)}, in the order the bills were added
+        self.amounts = {}
+        self.totals = dict.fromkeys(self.FIELDS, 0)
+        self.currency_counts = Counter()
+
+    def add(self, bill_id, bill):
+        amounts = {field: parse_money(bill.get(field)) for field in self.FIELDS}
+        self.amounts[bill_id] = amounts
+        for field, (cents, code) in amounts.items():
+            self.totals[field] += cents
+            if code:
+                self.currency_counts[code] += 1
+
+    def remove(self, bill_id):
+        for field, (cents, code) in self.amounts.pop(bill_id).items():
+            self.totals[field] -= cents
+            if code:
+                self.currency_counts[code] -= 1
+                if not self.currency_counts[code]:
+                    del self.currency_counts[code]
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def total(self, field):
+        return self.totals[field]
+
+    def currencies(self):
+        return list(self.currency_counts)
+
+    def format_all(self, field, default_currency=None):
+        return [format_cents(cents, code or default_currency)
+                for cents, code in (amounts[field] for amounts in self.amounts.values())]
+
+
+class ReconciliationSession:
+    """
+    An invoice and the bills added to it so far.
+
+    The invoice line items are indexed once. Adding a bill parses its amounts into the running
+    totals and matches its line items against the index, removing it subtracts the amounts and
+    releases the invoice items it matched. Neither touches the other bills, and the current
+    result is built from this state without any LLM call.
+    """
+
+    def __init__(self, session_id, invoice_details, store=None):
+        self.session_id = session_id
+        self.invoice_details = invoice_details
+        self.created_at = self.updated_at = time.time()
+        # Every change is written to the store first, its version of the session after the last
+        # change made here. None when another worker changed the session in between
+        self.store = store
+        self.version = 0
+        self.bills = {}
+        self.filenames = {}
+        self.ledger = RunningLedger()
+        self.line_item_index = create_line_item_index(invoice_details.get("line_items"))
+        # bill id -> (matched items, mismatched items, positions of the invoice items consumed)
+        self.line_item_results = {}
+        self._next_bill_number = 1
+        self._lock = threading.Lock()
+
+    def _add(self, bill_id, bill_details, filename):
+        bill_items = as_item_list(bill_details.get("line_items"))
+        self.line_item_index.prepare(bill_items)
+        consumed = []
+        matched, mismatched = match_line_items(None, bill_items, self.line_item_index, consumed)
+        self.line_item_results[bill_id] = (matched, mismatched, consumed)
+        self.ledger.add(bill_id, bill_details)
+        self.bills[bill_id] = bill_details
+        self.filenames[bill_id] = filename
+
+    def _changed(self, version):
+        self.version = version if self.version is not None and version == self.version + 1 else None
+        self.updated_at = time.time()
+
+    def add_bill(self, bill_details, filename=None):
+        """Adds an extracted bill, returns its id within the session."""
+        with self._lock:
+            if self.store is None:
+                number = self._next_bill_number
+                self._next_bill_number += 1
+                self.updated_at = time.time()
+            else:
+                number, version = self.store.save_bill(self.session_id, bill_details, filename)
+                self._changed(version)
+            bill_id = "bill-{}".format(number)
+            self._add(bill_id, bill_details, filename)
+            return bill_id
+
+    def remove_bill(self, bill_id):
+        """
+        Removes a bill. The invoice items it matched become available again, bills added after it
+        keep the matches they were given.
+        """
+        with self._lock:
+            if bill_id not in self.bills:
+                raise SessionNotFoundError("Bill {} is not part of session {}".format(bill_id, self.session_id))
+            if self.store is None:
+                self.updated_at = time.time()
+            else:
+                self._changed(self.store.delete_bill(self.session_id, bill_number(bill_id)))
+            _, _, consumed = self.line_item_results.pop(bill_id)
+            self.line_item_index.release(consumed)
+            self.ledger.remove(bill_id)
+            del self.bills[bill_id]
+            del self.filenames[bill_id]
+
+    def result(self):
+        """The reconciliation of the invoice against the current bills, as /api/invoice/reconcile returns it."""
+        with self._lock:
+            bills_data = list(self.bills.values())
+            totals = compute_reconciliation_totals(self.invoice_details, bills_data, self.ledger)
+            reconciliation_data = build_reconciliation_result(self.invoice_details, bills_data, totals)
+            matched_items = [item for matched, _, _ in self.line_item_results.values() for item in matched]
+            mismatched_items = [item for _, mismatched, _ in self.line_item_results.values() for item in mismatched]
+            reconciliation_data["line_item_verification"] = {
+                "matched_items": matched_items,
+                "mismatched_items": mismatched_items,
+                "discrepancy_found": bool(mismatched_items)
+            }
+            reconciliation_data["duplicate_bills"] = collect_duplicate_flags(bills_data)
+            return {
+                "session_id": self.session_id,
+                "invoice_details": self.invoice_details,
+                "bills": [{"bill_id": bill_id, "filename": self.filenames[bill_id], "bill_details": details}
+                          for bill_id, details in self.bills.items()],
+                "result": reconciliation_data
+            }
+
+
+def bill_number(bill_id):
+    """The number of a bill id of a session, 'bill-3' -> 3."""
+    return int(bill_id.rsplit("-", 1)[-1])
+
+
+class SessionStore:
+    """
+    Sessions in a SQLite file, the least recently used beyond max_items only there.
+
+    Every change to a session is written to the file before it is applied in memory. A session
+    that is not in memory, after a restart, an eviction or a change made by another worker
+    sharing the file, is rebuilt from its invoice and bills, each bill under its original id.
+    The version of a session, raised by every change, tells a worker that its copy is stale.
+    """
+
+    def __init__(self, path=SESSION_STORE_PATH, max_items=SESSION_MAX_ITEMS):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._sessions = LRUCache(max_items)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def _load(self, session_id):
+        """The session, rebuilt from the file unless the copy in memory is current. None when it does not exist."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT invoice_details, next_bill_number, version, created_at, updated_at FROM sessions WHERE id = ?",
+                (session_id,)
+            ).fetchone()
+            session = self._sessions.get(session_id)
+            if row is None:
+                self._sessions.pop(session_id)
+                return None
+            invoice_details, next_bill_number, version, created_at, updated_at = row
+            if session is not None and session.version == version:
+                return session
+            bills = self._connection.execute(
+                "SELECT number, filename, bill_details FROM session_bills WHERE session_id = ? ORDER BY number",
+                (session_id,)
+            ).fetchall()
+
+        session = ReconciliationSession(session_id, json.loads(invoice_details), self)
+        for number, filename, bill_details in bills:
+            session._add("bill-{}".format(number), json.loads(bill_details), filename)
+        session._next_bill_number = next_bill_number
+        session.version, session.created_at, session.updated_at = version, created_at, updated_at
+        self._sessions.put(session_id, session)
+        return session
+
+    def open(self, session_id, invoice_details):
+        """Returns the session of an invoice, starting it when the invoice has none yet."""
+        session = self._load(session_id)
+        if session is not None:
+            return session
+        now = time.time()
+        with self._lock, self._connection:
+            # Another worker may have started it since, its session is kept
+            started = self._connection.execute(
+                "INSERT OR IGNORE INTO sessions (id, invoice_details, next_bill_number, version, created_at, "
+                "updated_at) VALUES (?, ?, 1, 0, ?, ?)",
+                (session_id, json.dumps(invoice_details, default=str), now, now)
+            ).rowcount
+        if not started:
+            return self._load(session_id)
+        session = ReconciliationSession(session_id, invoice_details, self)
+        self._sessions.put(session_id, session)
+        return session
+
+    def find(self, session_id):
+        return self._load(session_id)
+
+    def get(self, session_id):
+        session = self._load(session_id)
+        if session is None:
+            raise SessionNotFoundError("Session {} not found, it was closed or never opened".format(session_id))
+        return session
+
+    def save_bill(self, session_id, bill_details, filename):
+        """Stores a bill added to a session, returns its number and the new version of the session."""
+        with self._lock, self._connection:
+            # Updating first takes the write lock, so two workers never give out the same number
+            updated = self._connection.execute(
+                "UPDATE sessions SET next_bill_number = next_bill_number + 1, version = version + 1, updated_at = ? "
+                "WHERE id = ?", (time.time(), session_id)
+            ).rowcount
+            if not updated:
+                raise SessionNotFoundError("Session {} not found, it was closed or never opened".format(session_id))
+            number, version = self._connection.execute(
+                "SELECT next_bill_number - 1, version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            self._connection.execute(
+                "INSERT INTO session_bills (session_id, number, filename, bill_details) VALUES (?, ?, ?, ?)",
+                (session_id, number, filename, json.dumps(bill_details, default=str))
+            )
+        return number, version
+
+    def delete_bill(self, session_id, number):
+        """Deletes a bill of a session, returns the new version of the session."""
+        with self._lock, self._connection:
+            deleted = self._connection.execute(
+                "DELETE FROM session_bills WHERE session_id = ? AND number = ?", (session_id, number)).rowcount
+            if not deleted:
+                raise SessionNotFoundError("Bill bill-{} is not part of session {}".format(number, session_id))
+            self._connection.execute("UPDATE sessions SET version = version + 1, updated_at = ? WHERE id = ?",
+                                     (time.time(), session_id))
+            return self._connection.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+
+    def close(self, session_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM session_bills WHERE session_id = ?", (session_id,))
+            closed = self._connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+            self._sessions.pop(session_id)
+        if not closed:
+            raise SessionNotFoundError("Session {} not found, it was closed or never opened".format(session_id))
+
+
+def get_session_store():
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                _session_store = SessionStore()
+    return _session_store
@@ -0,0 +1,431 @@
+"""
+Filename: storage.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Persistent store of invoices, bills and reconciliation results, on Postgres with a
+             connection pool or on SQLite for local testing.
+"""
+
+import csv
+import io
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from utils.logs import logger
+from utils.general import parse_amount
+from utils.dates import DOCUMENT_DATE_FIELDS, document_day_first, normalize_date_column
+from config.config import (RECONCILIATION_STORE, RECONCILIATION_STORE_PATH, DB_NAME, DB_USER, DB_PASSWORD, DB_HOST,
+                           DB_PORT, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_FETCH_SIZE)
+
+# Columns of a reconciliation row, in the order of the result rows
+RESULT_KEYS = (
+    "invoice_number", "invoice_date", "invoice_due_date", "invoice_to", "invoice_subtotal_due",
+    "invoice_tax_due", "invoice_total_due", "invoice_file_url", "bill_number", "bill_date",
+    "bill_payment_date", "bill_paid_by", "bill_subtotal_paid", "bill_tax_paid", "bill_total_paid",
+    "bill_file_url", "discrepancies", "reconciliation_summary", "total_difference", "contact_number",
+    "email"
+)
+DATE_KEYS = ("invoice_date", "invoice_due_date", "bill_date", "bill_payment_date")
+
+INVOICE_COLUMNS = ("id", "invoice_number", "invoice_date", "invoice_due_date", "invoice_to", "contact_number", "email",
+                   "invoice_subtotal_due", "invoice_tax_due", "invoice_total_due", "invoice_file_url")
+BILL_COLUMNS = ("id", "invoice_id", "bill_number", "bill_date", "bill_payment_date", "bill_paid_by",
+                "bill_subtotal_paid", "bill_tax_paid", "bill_total_paid", "bill_file_url")
+RECONCILIATION_COLUMNS = ("invoice_id", "discrepancies", "reconciliation_summary", "subtotal_difference",
+                          "tax_difference", "total_difference", "result")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id {id_type} PRIMARY KEY, invoice_number TEXT, invoice_date DATE, invoice_due_date DATE, invoice_to TEXT,
+    contact_number TEXT, email TEXT, invoice_subtotal_due NUMERIC(14, 2), invoice_tax_due NUMERIC(14, 2),
+    invoice_total_due NUMERIC(14, 2), invoice_file_url TEXT
+);
+CREATE TABLE IF NOT EXISTS bills (
+    id {id_type} PRIMARY KEY, invoice_id BIGINT REFERENCES invoices (id), bill_number TEXT, bill_date DATE,
+    bill_payment_date DATE, bill_paid_by TEXT, bill_subtotal_paid NUMERIC(14, 2), bill_tax_paid NUMERIC(14, 2),
+    bill_total_paid NUMERIC(14, 2), bill_file_url TEXT
+);
+CREATE TABLE IF NOT EXISTS reconciliations (
+    id {id_type} PRIMARY KEY, invoice_id BIGINT REFERENCES invoices (id), discrepancies BOOLEAN,
+    reconciliation_summary TEXT, subtotal_difference NUMERIC(14, 2), tax_difference NUMERIC(14, 2),
+    total_difference NUMERIC(14, 2), result TEXT
+);
+CREATE INDEX IF NOT EXISTS invoices_invoice_number ON invoices (invoice_number);
+CREATE INDEX IF NOT EXISTS invoices_invoice_date ON invoices (invoice_date);
+CREATE INDEX IF NOT EXISTS bills_bill_number ON bills (bill_number);
+CREATE INDEX IF NOT EXISTS bills_bill_date ON bills (bill_date);
+CREATE INDEX IF NOT EXISTS bills_invoice_id ON bills (invoice_id);
+CREATE INDEX IF NOT EXISTS reconciliations_invoice_id ON reconciliations (invoice_id);
+"""
+
+# Dates are rendered and the discrepancy flag is spelled out by the database, so that result
+# rows need no conversion in Python
+RESULT_QUERY = """
+SELECT i.invoice_number, {invoice_date}, {invoice_due_date}, i.invoice_to, i.invoice_subtotal_due,
+       i.invoice_tax_due, i.invoice_total_due, i.invoice_file_url, b.bill_number, {bill_date},
+       {bill_payment_date}, b.bill_paid_by, b.bill_subtotal_paid, b.bill_tax_paid, b.bill_total_paid,
+       b.bill_file_url, CASE WHEN r.discrepancies THEN 'Yes' ELSE 'No' END, r.reconciliation_summary,
+       r.total_difference, i.contact_number, i.email, b.id
+FROM bills b
+JOIN invoices i ON i.id = b.invoice_id
+LEFT JOIN reconciliations r ON r.invoice_id = i.id
+WHERE b.id > {p}{filters}
+ORDER BY b.id
+"""
+
+
+def iter_result_dicts(rows, keys=RESULT_KEYS, convert=True):
+    """
+    Turns result rows into dicts. With convert, date columns are rendered as ISO strings and
+    a boolean discrepancy flag as 'Yes'/'No'; only those columns are looked at.
+    """
+    date_positions = [position for position, key in enumerate(keys) if key in DATE_KEYS] if convert else []
+    flag_position = keys.index("discrepancies") if convert and "discrepancies" in keys else None
+    if not date_positions and flag_position is None:
+        for row in rows:
+            yield dict(zip(keys, row))
+        return
+    # Convert in the row before building the dict, indexing a list is cheaper than a dict
+    for row in rows:
+        values = list(row)
+        for position in date_positions:
+            value = values[position]
+            if isinstance(value, date):
+                values[position] = value.isoformat()
+        if flag_position is not None:
+            flag = values[flag_position]
+            if flag is True or flag is False:
+                values[flag_position] = 'Yes' if flag else 'No'
+        yield dict(zip(keys, values))
+
+
+def convert_sql_results_to_dicts(results, keys=RESULT_KEYS):
+    return list(iter_result_dicts(results, keys))
+
+
+def _date_columns(documents, is_invoice):
+    """The date columns of a batch of invoices or bills, each document read in its own day/month order."""
+    fields = DOCUMENT_DATE_FIELDS[is_invoice]
+    orders = [document_day_first(document, is_invoice) for document in documents]
+    return [iter(normalize_date_column([document.get(field) for document in documents], orders))
+            for field in fields]
+
+
+def _as_amount(value):
+    return None if value in (None, "", "NA") else parse_amount(value)
+
+
+def _as_text(value):
+    return None if value in (None, "NA") else str(value)
+
+
+class ReconciliationStore(ABC):
+    """
+    Keeps invoices, bills and reconciliation results.
+
+    Writes are batched: ids are allocated up front for a whole batch, then every table is
+    written with one bulk statement. Reads are keyset-paginated on the bill id and stream
+    rows from the database in chunks of fetch_size.
+    """
+
+    placeholder = "%s"
+
+    def __init__(self, fetch_size=DB_FETCH_SIZE):
+        self.fetch_size = fetch_size
+
+    @abstractmethod
+    def transaction(self):
+        """Context manager yielding a cursor, committing on success and rolling back on failure."""
+
+    @abstractmethod
+    def _allocate_ids(self, cursor, table, count):
+        pass
+
+    @abstractmethod
+    def _bulk_insert(self, cursor, table, columns, rows):
+        pass
+
+    @abstractmethod
+    def _stream(self, query, params):
+        """Yields the rows of a query, holding at most fetch_size rows in memory."""
+
+    def _date_text(self, column):
+        return column
+
+    def create_schema(self):
+        with self.transaction() as cursor:
+            for statement in self._schema().split(";"):
+                if statement.strip():
+                    cursor.execute(statement)
+
+    @abstractmethod
+    def _schema(self):
+        pass
+
+    def save_reconciliations(self, entries):
+        """
+        Stores reconciliations in bulk.
+
+        Args:
+            entries (list): Dicts with the 'invoice_details', the list of 'bill_details' and the
+                'result' of a reconciliation, and optionally 'invoice_file_url' and 'bill_file_urls'.
+
+        Returns:
+            list: The invoice id of each entry.
+        """
+        with self.transaction() as cursor:
+            invoice_ids = self._allocate_ids(cursor, "invoices", len(entries))
+            bill_count = sum(len(entry["bill_details"]) for entry in entries)
+            bill_ids = iter(self._allocate_ids(cursor, "bills", bill_count))
+            invoice_dates, invoice_due_dates = _date_columns([entry["invoice_details"] for entry in entries], True)
+            bill_dates, bill_payment_dates = _date_columns(
+                [bill for entry in entries for bill in entry["bill_details"]], False)
+            invoices, bills, reconciliations = [], [], []
+            for invoice_id, entry in zip(invoice_ids, entries):
+                invoice = entry["invoice_details"]
+                invoices.append((
+                    invoice_id, _as_text(invoice.get("invoice_number")), next(invoice_dates),
+                    next(invoice_due_dates), _as_text(invoice.get("invoice_to")),
+                    _as_text(invoice.get("contact_number")), _as_text(invoice.get("email")),
+                    _as_amount(invoice.get("invoice_subtotal_due")), _as_amount(invoice.get("invoice_tax_due")),
+                    _as_amount(invoice.get("invoice_total_due")), entry.get("invoice_file_url")
+                ))
+                bill_file_urls = entry.get("bill_file_urls") or [None] * len(entry["bill_details"])
+                for bill, bill_file_url in zip(entry["bill_details"], bill_file_urls):
+                    bills.append((
+                        next(bill_ids), invoice_id, _as_text(bill.get("bill_number")), next(bill_dates),
+                        next(bill_payment_dates), _as_text(bill.get("bill_paid_by")),
+                        _as_amount(bill.get("bill_subtotal_paid")), _as_amount(bill.get("bill_tax_paid")),
+                        _as_amount(bill.get("bill_total_paid")), bill_file_url
+                    ))
+                result = entry["result"]
+                reconciliations.append((
+                    invoice_id, str(result.get("discrepancies")) == "True", result.get("reconciliation_summary"),
+                    _as_amount(result.get("subtotal_difference")), _as_amount(result.get("tax_difference")),
+                    _as_amount(result.get("total_difference")), json.dumps(result, default=str)
+                ))
+            self._bulk_insert(cursor, "invoices", INVOICE_COLUMNS, invoices)
+            self._bulk_insert(cursor, "bills", BILL_COLUMNS, bills)
+            self._bulk_insert(cursor, "reconciliations", RECONCILIATION_COLUMNS, reconciliations)
+        return invoice_ids
+
+    def _result_query(self, invoice_number=None, bill_number=None, date_from=None, date_to=None, limit=None):
+        p = self.placeholder
+        filters, params = [], []
+        for clause, value in (("i.invoice_number = {}", invoice_number), ("b.bill_number = {}", bill_number),
+                              ("i.invoice_date >= {}", date_from), ("i.invoice_date <= {}", date_to)):
+            if value is not None:
+                filters.append(" AND " + clause.format(p))
+                params.append(value)
+        query = RESULT_QUERY.format(
+            p=p, filters="".join(filters),
+            invoice_date=self._date_text("i.invoice_date"), invoice_due_date=self._date_text("i.invoice_due_date"),
+            bill_date=self._date_text("b.bill_date"), bill_payment_date=self._date_text("b.bill_payment_date")
+        )
+        if limit is not None:
+            query += " LIMIT {}".format(p)
+            params.append(limit)
+        return query, params
+
+    def iter_results(self, invoice_number=None, bill_number=None, date_from=None, date_to=None, after=0, limit=None):
+        """
+        Streams reconciliation rows, one per bill, in bill id order after the bill id 'after'.
+
+        Yields:
+            dict: The RESULT_KEYS columns plus the 'bill_id' to resume from.
+        """
+        query, params = self._result_query(invoice_number, bill_number, date_from, date_to, limit)
+        rows = self._stream(query, [after or 0] + params)
+        return iter_result_dicts(rows, RESULT_KEYS + ("bill_id",), convert=False)
+
+    def get_results_page(self, limit=100, after=0, **filters):
+        """
+        Returns one page of reconciliation rows and the cursor of the next page, None on the last page.
+        """
+        items = list(self.iter_results(after=after, limit=limit + 1, **filters))
+        next_after = items[limit - 1]["bill_id"] if len(items) > limit else None
+        return items[:limit], next_after
+
+
+class PostgresReconciliationStore(ReconciliationStore):
+    """Store on Postgres, with a thread-safe connection pool, COPY for bulk writes and server-side cursors."""
+
+    def __init__(self, dsn=None, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE, fetch_size=DB_FETCH_SIZE,
+                 **connect_kwargs):
+        super().__init__(fetch_size)
+        # psycopg2 is only needed when Postgres is used
+        from psycopg2.pool import ThreadedConnectionPool
+        self._pool = ThreadedConnectionPool(min_size, max_size, dsn, **connect_kwargs)
+        self._cursor_number = 0
+        self._cursor_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        connection = self._pool.getconn()
+        try:
+            yield connection
+        finally:
+            self._pool.putconn(connection)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as connection:
+            try:
+                with connection.cursor() as cursor:
+                    yield cursor
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+
+    def _schema(self):
+        return SCHEMA.format(id_type="BIGSERIAL")
+
+    def _date_text(self, column):
+        return "{}::text".format(column)
+
+    def _allocate_ids(self, cursor, table, count):
+        if not count:
+            return []
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", (table, count))
+        return [row[0] for row in cursor.fetchall()]
+
+    def _bulk_insert(self, cursor, table, columns, rows):
+        if not rows:
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["" if value is None else value for value in row])
+        buffer.seek(0)
+        cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(table, ", ".join(columns)), buffer)
+
+    def _stream(self, query, params):
+        with self._cursor_lock:
+            self._cursor_number += 1
+            name = "results_{}".format(self._cursor_number)
+        with self.connection() as connection:
+            try:
+                # A named cursor keeps the result on the server, rows arrive fetch_size at a time
+                with connection.cursor(name=name) as cursor:
+                    cursor.itersize = self.fetch_size
+                    cursor.execute(query, params)
+                    for row in cursor:
+                        yield row
+            finally:
+                connection.rollback()
+
+    def close(self):
+        self._pool.closeall()
+
+
+class SQLiteReconciliationStore(ReconciliationStore):
+    """Store in a SQLite file for local testing, with one connection per thread."""
+
+    placeholder = "?"
+
+    def __init__(self, path, fetch_size=DB_FETCH_SIZE):
+        super().__init__(fetch_size)
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        connection = self._connection()
+        with self._write_lock:
+            cursor = connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def _schema(self):
+        return SCHEMA.format(id_type="INTEGER")
+
+    def _allocate_ids(self, cursor, table, count):
+        # Safe because the write transaction holds the database lock
+        last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM {}".format(table)).fetchone()[0]
+        return list(range(last_id + 1, last_id + count + 1))
+
+    def _bulk_insert(self, cursor, table, columns, rows):
+        statement = "INSERT INTO {} ({}) VALUES ({})".format(table, ", ".join(columns), ", ".join("?" * len(columns)))
+        cursor.executemany(statement, [[self._adapt(value) for value in row] for row in rows])
+
+    @staticmethod
+    def _adapt(value):
+        if isinstance(value, date):
+            return value.isoformat()
+        if value is not None and not isinstance(value, (str, int, float, bool)):
+            return str(value)
+        return value
+
+    def _stream(self, query, params):
+        cursor = self._connection().execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(self.fetch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cursor.close()
+
+
+def create_reconciliation_store(kind, path=None):
+    """Returns the store selected in the configuration: 'postgres', 'sqlite' or 'none' (None)."""
+    if kind == "none":
+        return None
+    if kind == "sqlite":
+        store = SQLiteReconciliationStore(path)
+    elif kind == "postgres":
+        store = PostgresReconciliationStore(dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, host=DB_HOST,
+                                            port=DB_PORT)
+    else:
+        raise ValueError("Unknown reconciliation store: {}".format(kind))
+    store.create_schema()
+    logger.info("Using the {} reconciliation store".format(kind))
+    return store
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_reconciliation_store():
+    """Returns the process-wide reconciliation store, or None when storing results is disabled."""
+    global _store
+    if _store is None and RECONCILIATION_STORE != "none":
+        with _store_lock:
+            if _store is None:
+                _store = create_reconciliation_store(RECONCILIATION_STORE, RECONCILIATION_STORE_PATH)
+    return _store
+
+
+def store_reconciliations(entries):
+    """Stores reconciliations when a store is configured, see ReconciliationStore.save_reconciliations."""
+    store = get_reconciliation_store()
+    if store is None or not entries:
+        return None
+    return store.save_reconciliations(entries)
@@ -0,0 +1,68 @@
+"""
+Filename: streaming.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Streams the progress of a reconciliation as NDJSON or server-sent events.
+"""
+
+import json
+from typing import List
+from utils.logs import logger
+from utils.invoice_processing import verify_line_items, perform_reconciliation
+from utils.pipeline import (iter_extractions, run_blocking, close_uploads, persist_reconciliations,
+                            reconciliation_entry)
+from utils.uploads import SpooledUpload
+
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def format_event(event, data, stream_format="ndjson"):
+    """Serialises one event, as a JSON line or as a server-sent event."""
+    if stream_format == "sse":
+        return "event: {}\ndata: {}\n\n".format(event, json.dumps(data, default=str))
+    return json.dumps({"event": event, **data}, default=str) + "\n"
+
+
+async def stream_reconciliation(invoice_upload: SpooledUpload, bill_uploads: List[SpooledUpload],
+                                stream_format="ndjson"):
+    """
+    Extracts and reconciles an invoice and its bills, yielding an event for every step:
+
+    - document: one per document as soon as its extraction finishes, in completion order.
+    - line_item_verification: the line item matching, once every document is known.
+    - reconciliation: the same result as the /api/invoice/reconcile endpoint.
+    - error: when a step fails, the stream ends after it.
+
+    The spools are closed once the stream ends.
+    """
+    uploads = [invoice_upload] + list(bill_uploads)
+    kinds = [True] + [False] * len(bill_uploads)
+    results = [None] * len(uploads)
+    try:
+        async for position, details in iter_extractions(uploads, kinds):
+            results[position] = details
+            yield format_event("document", {
+                "kind": "invoice" if kinds[position] else "bill",
+                "index": position - 1 if position else 0,
+                "filename": uploads[position].filename,
+                "details": details
+            }, stream_format)
+
+        invoice_details, bill_details_list = results[0], results[1:]
+        verification = await run_blocking(verify_line_items, invoice_details, bill_details_list)
+        yield format_event("line_item_verification", {"result": verification}, stream_format)
+
+        reconciliation_data = await run_blocking(perform_reconciliation, invoice_details, bill_details_list,
+                                                 line_item_verification=verification)
+        await persist_reconciliations([reconciliation_entry(invoice_details, bill_details_list, reconciliation_data)])
+        yield format_event("reconciliation", {
+            "invoice_details": invoice_details,
+            "bill_details": bill_details_list,
+            "result": reconciliation_data
+        }, stream_format)
+    except Exception as e:
+        logger.exception("Streaming reconciliation failed")
+        yield format_event("error", {"detail": str(e)}, stream_format)
+    finally:
+        close_uploads(uploads)
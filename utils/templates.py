@@ -0,0 +1,527 @@
+"""
+Filename: templates.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Learns extraction templates for recurring bill layouts from earlier LLM extractions,
+             so that known layouts are extracted locally without an LLM call.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+from utils.logs import logger
+from utils.general import PAGE_SEPARATOR, parse_amount
+from utils.matching import normalize_description, get_bill_item_amount
+from config.config import TEMPLATE_DIR, TEMPLATE_MIN_CONFIDENCE, RECONCILIATION_TOLERANCE
+
+# Bump whenever the template format or the way templates are applied changes
+TEMPLATE_VERSION = "3"
+# Number of leading lines of the first page that make up the layout fingerprint
+FINGERPRINT_LINES = 5
+# Most lines between a label standing alone on its line and the value below it
+LABEL_LINE_OFFSET = 2
+
+BILL_TEXT_FIELDS = ("bill_number", "bill_date", "bill_payment_date", "bill_paid_by")
+BILL_AMOUNT_FIELDS = ("bill_subtotal_paid", "bill_tax_paid", "bill_total_paid")
+# Words expected in the label of each field, used to choose between places a value appears
+FIELD_HINTS = {
+    "bill_number": {"bill", "no", "number", "ref", "reference", "receipt"},
+    "bill_date": {"date", "dated", "issued"},
+    "bill_payment_date": {"payment", "paid", "date"},
+    "bill_paid_by": {"paid", "by", "from", "payer", "customer", "name"},
+    "bill_subtotal_paid": {"subtotal", "sub", "net"},
+    "bill_tax_paid": {"tax", "vat", "gst"},
+    "bill_total_paid": {"total", "paid", "amount", "grand"},
+}
+
+_whitespace = re.compile(r"\s+")
+_digits = re.compile(r"\d+")
+_money = re.compile(r"[$€£₹¥]?\s?-?\d[\d,]*(?:\.\d+)?")
+_row_amount = re.compile(r"\s(?P<amount>[$€£₹¥]?\s?-?\d[\d,]*(?:\.\d{1,2})?)$")
+_label_end = re.compile(r"[\d$€£₹¥]")
+_cents = re.compile(r"[.,]\d{1,2}$")
+_separators = " :#-."
+
+
+def is_missing(value):
+    return value is None or str(value).strip() in ("", "NA")
+
+
+def document_lines(text):
+    """Returns the non-empty lines of a document across pages, with whitespace collapsed."""
+    lines = []
+    for page in (text or "").split(PAGE_SEPARATOR):
+        for line in page.splitlines():
+            line = _whitespace.sub(" ", line).strip()
+            if line:
+                lines.append(line)
+    return lines
+
+
+def layout_fingerprint(text):
+    """
+    Fingerprints the letterhead of a document: its first lines with every number removed,
+    so that bills of one vendor layout share a fingerprint whatever their numbers and dates.
+    """
+    first_page = (text or "").split(PAGE_SEPARATOR, 1)[0]
+    lines = document_lines(first_page)[:FINGERPRINT_LINES]
+    skeleton = "\n".join(_digits.sub("#", line.lower()) for line in lines)
+    if not skeleton:
+        return None
+    return hashlib.sha256(skeleton.encode("utf-8")).hexdigest()[:32]
+
+
+def line_label(line):
+    """The lowercased text of a line before its first number or currency symbol."""
+    match = _label_end.search(line)
+    label = line[:match.start()] if match else line
+    return label.lower().rstrip(_separators)
+
+
+def split_row(line):
+    """Splits a line item row into its description and its trailing amount, or returns None."""
+    match = _row_amount.search(line)
+    if match is None:
+        return None
+    description = line[:match.start()].strip()
+    if not re.search(r"[A-Za-z]", description):
+        return None
+    return description, match.group("amount").strip()
+
+
+def amounts_equal(first, second):
+    return abs(parse_amount(first) - parse_amount(second)) <= RECONCILIATION_TOLERANCE
+
+
+def check_bill_arithmetic(details):
+    """
+    Checks that the line items add up to the subtotal and that subtotal plus tax is the total,
+    for the amounts that are present. A total written without cents may be rounded to the unit.
+    """
+    subtotal, tax, total = (details.get(field) for field in BILL_AMOUNT_FIELDS)
+    items = details.get("line_items") or []
+    if items and not is_missing(subtotal):
+        if abs(sum(get_bill_item_amount(item) for item in items) - parse_amount(subtotal)) > RECONCILIATION_TOLERANCE:
+            return False
+    if not is_missing(subtotal) and not is_missing(total):
+        tax_amount = parse_amount(tax) if not is_missing(tax) else 0
+        tolerance = RECONCILIATION_TOLERANCE if _cents.search(str(total).strip()) else \
+            max(RECONCILIATION_TOLERANCE, Decimal("0.5"))
+        if abs(parse_amount(subtotal) + tax_amount - parse_amount(total)) > tolerance:
+            return False
+    return True
+
+
+def learn_field_rule(lines, field, value, is_amount):
+    """
+    Finds the line holding an extracted value and describes how to find it again:
+    the label before the value, the separator in between, which of the lines with that
+    label it was on and how much of the line the value takes.
+
+    When the value appears in several places, labels that share words with the field
+    name win, then labels without numbers, then amounts written with cents or a currency.
+    A text value without a label on its line is looked for below a label standing alone
+    on its line, see learn_label_line_rule.
+
+    Returns:
+        dict: The best rule that finds the value again, or None when there is none.
+    """
+    if is_missing(value):
+        return {"kind": "missing"}
+    wanted = _whitespace.sub(" ", str(value)).strip().lower()
+    pattern = re.compile(r"(?<!\w){}(?!\w)".format(re.escape(wanted)))
+    hints = FIELD_HINTS[field]
+    best, best_score = None, None
+    for position, line in enumerate(lines):
+        if is_amount:
+            spans = [match.span() for match in _money.finditer(line) if amounts_equal(match.group(), value)]
+        else:
+            spans = [match.span() for match in pattern.finditer(line.lower())]
+        for start, end in spans:
+            prefix = line[:start].lower()
+            # The label is the text after the last number before the value, e.g. "date" in
+            # "Bill No: 100 Date: 6/26/2012", unless that text holds no word at all
+            numbers = list(_label_end.finditer(prefix))
+            if numbers and re.search(r"[a-z]", prefix[numbers[-1].end():]):
+                prefix = prefix[numbers[-1].end():].lstrip(_separators + ",)%")
+            label = prefix.rstrip(_separators)
+            if not re.search(r"[a-z]", label):
+                continue
+            rule = {"label": label, "separator": prefix[len(label):]}
+            if is_amount:
+                rule["kind"] = "amount"
+            elif not line[end:].strip():
+                rule["kind"] = "rest"
+            else:
+                rule["kind"] = "words"
+                rule["words"] = len(wanted.split())
+            rule["occurrence"] = sum(1 for other in lines[:position]
+                                     if find_anchor(other, label + rule["separator"]) is not None)
+            found = apply_field_rule(lines, rule)
+            if found is None or not (amounts_equal(found, value) if is_amount else found.lower() == wanted):
+                continue
+            score = (len(hints & set(re.findall(r"[a-z]+", label))),
+                     not _digits.search(label),
+                     bool(re.search(r"[$€£₹¥.]", line[start:end])))
+            if best_score is None or score > best_score:
+                best, best_score = rule, score
+    if best is None and not is_amount:
+        return learn_label_line_rule(lines, field, wanted)
+    return best
+
+
+def label_line(line):
+    """The label a line is made of, e.g. 'paid by' for 'Paid By:', or None when it holds more than a label."""
+    label = line.lower().rstrip(_separators)
+    return label if label == line_label(line) and re.search(r"[a-z]", label) else None
+
+
+def learn_label_line_rule(lines, field, wanted):
+    """
+    Describes a text value that starts a line below a label standing alone on its line, as
+    'JP Constructions' below 'Paid By': the label, how many lines below it the value is and
+    which of the lines with that label it is. Labels sharing words with the field name win,
+    then the closest label.
+    """
+    words = len(wanted.split())
+    best, best_score = None, None
+    for position, line in enumerate(lines):
+        if " ".join(line.lower().split()[:words]) != wanted:
+            continue
+        for offset in range(1, min(LABEL_LINE_OFFSET, position) + 1):
+            label = label_line(lines[position - offset])
+            if label is None:
+                continue
+            rule = {"kind": "below", "label": label, "offset": offset, "words": words,
+                    "occurrence": sum(1 for other in lines[:position - offset] if label_line(other) == label)}
+            found = apply_field_rule(lines, rule)
+            if found is None or found.lower() != wanted:
+                continue
+            score = (len(FIELD_HINTS[field] & set(re.findall(r"[a-z]+", label))), -offset)
+            if best_score is None or score > best_score:
+                best, best_score = rule, score
+    return best
+
+
+def find_anchor(line, anchor):
+    """Returns where the text after a label starts in a line, or None when the label is not in the line."""
+    match = re.search(r"(?<!\w){}".format(re.escape(anchor)), line.lower())
+    return match.end() if match else None
+
+
+def apply_field_rule(lines, rule):
+    """Returns the value a field rule finds in the lines, "NA" for missing fields, or None when not found."""
+    if rule["kind"] == "missing":
+        return "NA"
+    if rule["kind"] == "below":
+        positions = [position for position, line in enumerate(lines) if label_line(line) == rule["label"]]
+        if len(positions) <= rule["occurrence"] or positions[rule["occurrence"]] + rule["offset"] >= len(lines):
+            return None
+        words = lines[positions[rule["occurrence"]] + rule["offset"]].split()
+        return " ".join(words[:rule["words"]]) if len(words) >= rule["words"] else None
+    anchor = rule["label"] + rule["separator"]
+    occurrence = 0
+    for line in lines:
+        position = find_anchor(line, anchor)
+        if position is None:
+            continue
+        if occurrence < rule["occurrence"]:
+            occurrence += 1
+            continue
+        remainder = line[position:].strip()
+        if rule["kind"] == "amount":
+            match = _money.match(remainder)
+            return match.group().strip() if match else None
+        if rule["kind"] == "words":
+            words = remainder.split()
+            return " ".join(words[:rule["words"]]) if len(words) >= rule["words"] else None
+        return remainder or None
+    return None
+
+
+def learn_line_item_rule(lines, items):
+    """
+    Finds the rows of the extracted line items and returns the labels of the lines just
+    before and just after the table, or None when the rows cannot be found in order.
+    """
+    if not items:
+        return {"start": None, "end": None}
+    positions = []
+    cursor = 0
+    for item in items:
+        wanted = normalize_description(item.get("description"))
+        amount = get_bill_item_amount(item)
+        for position in range(cursor, len(lines)):
+            row = split_row(lines[position])
+            if row and normalize_description(row[0]) == wanted and parse_amount(row[1]) == amount:
+                positions.append(position)
+                cursor = position + 1
+                break
+        else:
+            return None
+    if positions[0] == 0:
+        return None
+    start = line_label(lines[positions[0] - 1])
+    end = line_label(lines[positions[-1] + 1]) if positions[-1] + 1 < len(lines) else None
+    if not start:
+        return None
+    return {"start": start, "end": end}
+
+
+def apply_line_item_rule(lines, rule):
+    """Returns the line items between the learned start and end lines, or None when the table is not found."""
+    if rule["start"] is None:
+        return []
+    try:
+        first = next(i for i, line in enumerate(lines) if line_label(line) == rule["start"]) + 1
+    except StopIteration:
+        return None
+    items = []
+    for line in lines[first:]:
+        if rule["end"] is not None and line_label(line) == rule["end"]:
+            return items
+        row = split_row(line)
+        if row is not None:
+            items.append({"description": row[0], "amount": row[1]})
+    # The end of the table was never found
+    return items if rule["end"] is None else None
+
+
+def find_unexplained_line(template, lines, details):
+    """
+    Returns a line of a bill holding something the template treats as absent, or None.
+
+    Such a line has a label the learned layout did not have, and either looks like a line item
+    row while the template has no line item table, or its label shares words with a field the
+    template has no value for, e.g. "Payment date: 05/02/2024" for bill_payment_date.
+    """
+    known_labels = set(template["labels"])
+    missing_fields = [field for field, rule in template["fields"].items() if rule["kind"] == "missing"]
+    has_table = template["line_items"]["start"] is not None
+    item_descriptions = {normalize_description(item["description"]) for item in details["line_items"]}
+    for line in lines:
+        label = line_label(line)
+        if not label or label in known_labels or not _label_end.search(line):
+            continue
+        row = split_row(line)
+        if row is not None and normalize_description(row[0]) in item_descriptions:
+            continue
+        if row is not None and not has_table:
+            return line
+        words = set(re.findall(r"[a-z]+", label))
+        if any(words & FIELD_HINTS[field] for field in missing_fields):
+            return line
+    return None
+
+
+class TemplateStore:
+    """Templates persisted as one JSON file per layout fingerprint, all kept in memory."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._templates = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        templates = {}
+        if self.directory.exists():
+            for path in self.directory.glob("*.json"):
+                try:
+                    with open(path, "r", encoding="utf-8") as template_file:
+                        template = json.load(template_file)
+                except (OSError, ValueError) as e:
+                    logger.warning("Skipping unreadable template {}: {}".format(path, e))
+                    continue
+                if template.get("version") == TEMPLATE_VERSION:
+                    templates[template["fingerprint"]] = template
+        return templates
+
+    def get(self, fingerprint):
+        with self._lock:
+            if self._templates is None:
+                self._templates = self._load()
+            return self._templates.get(fingerprint)
+
+    def put(self, template):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / (template["fingerprint"] + ".json")
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump(template, tmp_file)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._templates is None:
+                self._templates = self._load()
+            self._templates[template["fingerprint"]] = template
+
+    def __len__(self):
+        with self._lock:
+            if self._templates is None:
+                self._templates = self._load()
+            return len(self._templates)
+
+
+class TemplateExtractor:
+    """
+    Fast path for bills whose layout has been seen before.
+
+    After a successful LLM extraction, a template is learned from the text: for each field
+    the label it follows, and the lines that open and close the line item table. The template
+    is only kept when it reproduces the LLM extraction from the same text. Later bills with
+    the same layout fingerprint are extracted with the template, and the result is only used
+    when enough fields were found, the amounts add up and the bill holds nothing the template
+    treats as absent; otherwise the caller falls back to the LLM.
+    """
+
+    def __init__(self, store: TemplateStore, min_confidence=TEMPLATE_MIN_CONFIDENCE):
+        self.store = store
+        self.min_confidence = min_confidence
+        self._stats_lock = threading.Lock()
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "rejected": 0, "learned": 0, "not_learned": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def apply(self, template, lines):
+        """
+        Extracts a bill with a template.
+
+        Returns:
+            tuple: The bill details and the share of the fields of the layout that were found.
+                Fields the layout does not have, and a line item table it does not have, are not
+                counted, see find_unexplained_line for bills that do have them.
+        """
+        details = {}
+        found = counted = 0
+        for field, rule in template["fields"].items():
+            if rule["kind"] == "missing":
+                details[field] = "NA"
+                continue
+            counted += 1
+            value = apply_field_rule(lines, rule)
+            if value is None:
+                details[field] = "NA"
+            else:
+                details[field] = value
+                found += 1
+        items = apply_line_item_rule(lines, template["line_items"])
+        if template["line_items"]["start"] is not None:
+            counted += 1
+            if items is not None:
+                found += 1
+        details["line_items"] = items or []
+        return details, found / counted if counted else 0.0
+
+    def extract(self, text):
+        """Returns the bill details extracted with a known template, or None when the LLM is needed."""
+        self._count("lookups")
+        fingerprint = layout_fingerprint(text)
+        template = self.store.get(fingerprint) if fingerprint else None
+        if template is None:
+            self._count("misses")
+            return None
+        lines = document_lines(text)
+        details, confidence = self.apply(template, lines)
+        if confidence < self.min_confidence or not check_bill_arithmetic(details):
+            logger.info("Template {} rejected (confidence {:.2f})".format(fingerprint, confidence))
+            self._count("rejected")
+            return None
+        unexplained = find_unexplained_line(template, lines, details)
+        if unexplained is not None:
+            logger.info("Template {} rejected, the bill has '{}' the template has no place for".format(
+                fingerprint, unexplained))
+            self._count("rejected")
+            return None
+        self._count("hits")
+        return details
+
+    def learn(self, text, details):
+        """
+        Learns a template from a bill extracted by the LLM.
+
+        Returns:
+            bool: True when a template was stored.
+        """
+        fingerprint = layout_fingerprint(text)
+        if fingerprint is None or not check_bill_arithmetic(details):
+            self._count("not_learned")
+            return False
+        lines = document_lines(text)
+        fields = {}
+        for field in BILL_TEXT_FIELDS + BILL_AMOUNT_FIELDS:
+            rule = learn_field_rule(lines, field, details.get(field), field in BILL_AMOUNT_FIELDS)
+            if rule is None:
+                self._count("not_learned")
+                return False
+            fields[field] = rule
+        line_items = learn_line_item_rule(lines, details.get("line_items") or [])
+        if line_items is None:
+            self._count("not_learned")
+            return False
+        template = {"version": TEMPLATE_VERSION, "fingerprint": fingerprint, "fields": fields,
+                    "line_items": line_items, "labels": sorted({line_label(line) for line in lines} - {""}),
+                    "learned_at": time.time()}
+
+        # Only keep templates that give back what the LLM extracted
+        replayed, confidence = self.apply(template, lines)
+        if confidence < 1 or not self.matches(replayed, details):
+            self._count("not_learned")
+            return False
+        try:
+            self.store.put(template)
+        except OSError as e:
+            logger.warning("Could not persist template {}: {}".format(fingerprint, e))
+            return False
+        self._count("learned")
+        logger.info("Learned template {}".format(fingerprint))
+        return True
+
+    @staticmethod
+    def matches(replayed, details):
+        for field in BILL_TEXT_FIELDS:
+            expected = details.get(field)
+            if is_missing(expected):
+                if not is_missing(replayed[field]):
+                    return False
+            elif _whitespace.sub(" ", str(expected)).strip().lower() != replayed[field].lower():
+                return False
+        for field in BILL_AMOUNT_FIELDS:
+            if is_missing(details.get(field)) != is_missing(replayed[field]):
+                return False
+            if not is_missing(replayed[field]) and not amounts_equal(replayed[field], details[field]):
+                return False
+        expected_items = details.get("line_items") or []
+        if len(expected_items) != len(replayed["line_items"]):
+            return False
+        return all(normalize_description(expected.get("description")) == normalize_description(item["description"])
+                   and get_bill_item_amount(expected) == get_bill_item_amount(item)
+                   for expected, item in zip(expected_items, replayed["line_items"]))
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        stats["templates"] = len(self.store)
+        return stats
+
+
+_template_extractor = None
+_template_extractor_lock = threading.Lock()
+
+
+def get_template_extractor():
+    """Returns the process-wide template extractor."""
+    global _template_extractor
+    if _template_extractor is None:
+        with _template_extractor_lock:
+            if _template_extractor is None:
+                _template_extractor = TemplateExtractor(TemplateStore(TEMPLATE_DIR))
+    return _template_extractor
@@ -0,0 +1,216 @@
+"""
+Filename: uploads.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Streams uploaded files into private per-request spools.
+"""
+
+import hashlib
+import io
+import mmap
+import re
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from fastapi import UploadFile
+from utils.logs import logger
+from utils.metrics import stage
+from config.config import (upload_directory_path, UPLOAD_CHUNK_SIZE, UPLOAD_MEMORY_LIMIT_BYTES,
+                           UPLOAD_RETENTION_SECONDS)
+
+# Uploads are sharded as <root>/<YYYYMMDD>/<request id prefix>/<request id>/<file>
+SHARD_DATE_FORMAT = "%Y%m%d"
+# How often spooling checks the upload directory for expired shards
+PURGE_INTERVAL_SECONDS = 3600
+
+_unsafe_filename_characters = re.compile(r"[^A-Za-z0-9._-]+")
+_last_purge = None
+_purge_lock = threading.Lock()
+
+
+def new_request_id():
+    """Returns a random identifier used to keep the files of one request apart."""
+    return uuid.uuid4().hex
+
+
+def safe_filename(filename):
+    """Strips any directory part and unsafe characters from a client supplied filename."""
+    name = Path(filename or "upload").name
+    name = _unsafe_filename_characters.sub("_", name).strip("._")
+    return name or "upload"
+
+
+class SpooledUpload:
+    """
+    An uploaded file held either in memory or in a memory-mapped spool file.
+
+    Attributes:
+        filename (str): The original filename sent by the client.
+        size (int): Number of bytes received.
+        sha256 (str): Hex digest of the content, computed while streaming.
+        path (Path): Location of the spool file, or None when the content stayed in memory.
+        request_id (str): Identifier of the request the upload belongs to.
+    """
+
+    def __init__(self, filename, size, sha256, data=None, path=None, request_id=None):
+        self.filename = filename
+        self.request_id = request_id
+        self.size = size
+        self.sha256 = sha256
+        self.path = path
+        self._data = data
+        self._file = None
+        self._mmap = None
+        if path is not None and size:
+            self._file = open(path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def in_memory(self):
+        return self.path is None
+
+    def open_stream(self):
+        """
+        Returns a seekable binary stream over the content without copying it.
+
+        In-memory content is wrapped in a BytesIO, which shares the underlying bytes
+        object, and spooled content is served straight from the memory map.
+        """
+        if self._mmap is not None:
+            self._mmap.seek(0)
+            return self._mmap
+        return io.BytesIO(self._data or b"")
+
+    def read_bytes(self):
+        if self._mmap is not None:
+            return self._mmap[:]
+        return self._data or b""
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def spool_upload(file: UploadFile, request_id: str, memory_limit: int = UPLOAD_MEMORY_LIMIT_BYTES):
+    """
+    Streams an upload into a private spool, hashing it on the way.
+
+    Content up to memory_limit bytes stays in memory. Larger uploads are written once
+    to a per-request directory under the upload root and memory-mapped for reading.
+
+    Args:
+        file (UploadFile): The uploaded file.
+        request_id (str): Identifier of the request the upload belongs to.
+        memory_limit (int): Largest upload kept in memory, in bytes.
+
+    Returns:
+        SpooledUpload: The spooled content.
+    """
+    with stage("spool_upload") as span:
+        upload = _spool(file, request_id, memory_limit)
+        span.update(bytes=upload.size, in_memory=upload.in_memory)
+        return upload
+
+
+def _spool(file: UploadFile, request_id: str, memory_limit: int):
+    maybe_purge_expired_uploads()
+
+    content_hash = hashlib.sha256()
+    chunks = []
+    size = 0
+    spool_path = None
+    spool_file = None
+    try:
+        while True:
+            chunk = file.file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            content_hash.update(chunk)
+            size += len(chunk)
+            if spool_file is None and size > memory_limit:
+                spool_path = get_spool_path(request_id, file.filename)
+                spool_path.parent.mkdir(parents=True, exist_ok=True)
+                spool_file = open(spool_path, "wb")
+                spool_file.writelines(chunks)
+                chunks = []
+            if spool_file is not None:
+                spool_file.write(chunk)
+            else:
+                chunks.append(chunk)
+    finally:
+        if spool_file is not None:
+            spool_file.close()
+
+    if spool_path is None:
+        logger.info("Spooled '{}' in memory ({} bytes)".format(file.filename, size))
+        return SpooledUpload(file.filename, size, content_hash.hexdigest(), data=b"".join(chunks),
+                             request_id=request_id)
+    logger.info("Spooled '{}' to {} ({} bytes)".format(file.filename, spool_path, size))
+    return SpooledUpload(file.filename, size, content_hash.hexdigest(), path=spool_path, request_id=request_id)
+
+
+def get_spool_path(request_id, filename, now=None):
+    """Returns the sharded location of a spooled upload."""
+    shard = (now or datetime.now()).strftime(SHARD_DATE_FORMAT)
+    unique_name = "{}_{}".format(uuid.uuid4().hex[:8], safe_filename(filename))
+    return Path(upload_directory_path) / shard / request_id[:2] / request_id / unique_name
+
+
+def purge_expired_uploads(root=upload_directory_path, retention_seconds=UPLOAD_RETENTION_SECONDS, now=None):
+    """
+    Deletes every date shard of the upload directory that is older than the retention period.
+
+    Files that are not inside a date shard (for example the sample documents) are left alone.
+
+    Returns:
+        int: The number of shards removed.
+    """
+    root = Path(root)
+    if not root.is_dir():
+        return 0
+    cutoff = (now or datetime.now()) - timedelta(seconds=retention_seconds)
+    removed = 0
+    for shard in root.iterdir():
+        if not shard.is_dir():
+            continue
+        try:
+            shard_date = datetime.strptime(shard.name, SHARD_DATE_FORMAT)
+        except ValueError:
+            continue
+        # A shard holds a whole day, so it expires once the end of that day passes the cutoff
+        if shard_date + timedelta(days=1) <= cutoff:
+            shutil.rmtree(shard, ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info("Removed {} expired upload shard(s) from {}".format(removed, root))
+    return removed
+
+
+def maybe_purge_expired_uploads():
+    """Runs purge_expired_uploads at most once every PURGE_INTERVAL_SECONDS."""
+    global _last_purge
+    now = time.monotonic()
+    if _last_purge is not None and now - _last_purge < PURGE_INTERVAL_SECONDS:
+        return
+    with _purge_lock:
+        if _last_purge is not None and now - _last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        _last_purge = now
+    try:
+        purge_expired_uploads()
+    except OSError as e:
+        logger.warning("Could not purge expired uploads: {}".format(e))
@@ -0,0 +1,87 @@
+"""
+Filename: validation.py
+Author: Ashish Sharma
+Date created: 18/10/2026
+License: MIT License
+Description: Local checks of extracted invoice and bill details: required fields, subtotal + tax =
+             total, line totals adding up to the subtotal and quantity x rate = line total.
+"""
+
+from utils.general import parse_amount
+from utils.ledger import parse_money, cents_to_decimal
+from utils.matching import as_item_list, check_quantity_rate
+from utils.reconciliation import is_discrepancy
+
+MISSING_VALUES = (None, "", "NA")
+# Fields without which the reconciliation has nothing to work with
+REQUIRED_INVOICE_FIELDS = ("invoice_number", "invoice_date", "invoice_total_due")
+REQUIRED_BILL_FIELDS = ("bill_date", "bill_total_paid")
+# Names of the checks, as reported in problems and in the metrics
+VALIDATION_CHECKS = ("required_fields", "line_items", "total_arithmetic", "tax_range", "line_items_sum",
+                     "line_item_arithmetic")
+
+
+def _present(details, field):
+    return details.get(field) not in MISSING_VALUES
+
+
+def _problem(check, detail):
+    return {"check": check, "detail": detail}
+
+
+def validate_details(details, is_invoice):
+    """
+    Checks extracted details without any LLM call. Amounts that are missing are not checked.
+
+    Args:
+        details (dict): Normalized details, see utils.schemas.normalize_details.
+        is_invoice (bool): The kind of document.
+
+    Returns:
+        list: One dict per failed check, with its name (see VALIDATION_CHECKS) and a detail.
+            Empty when the details pass every check.
+    """
+    if is_invoice:
+        required = REQUIRED_INVOICE_FIELDS
+        subtotal_field, tax_field, total_field = "invoice_subtotal_due", "invoice_tax_due", "invoice_total_due"
+        amount_field = "line_total"
+    else:
+        required = REQUIRED_BILL_FIELDS
+        subtotal_field, tax_field, total_field = "bill_subtotal_paid", "bill_tax_paid", "bill_total_paid"
+        amount_field = "amount"
+    problems = []
+
+    missing = [field for field in required if not _present(details, field)]
+    if missing:
+        problems.append(_problem("required_fields", "Missing {}".format(", ".join(missing))))
+    items = as_item_list(details.get("line_items"))
+    if is_invoice and not items:
+        problems.append(_problem("line_items", "No line items"))
+
+    subtotal = parse_money(details.get(subtotal_field))[0]
+    tax = parse_money(details.get(tax_field))[0]
+    total = parse_money(details.get(total_field))[0]
+    has_subtotal, has_tax = _present(details, subtotal_field), _present(details, tax_field)
+    if has_subtotal and has_tax and _present(details, total_field) and \
+            is_discrepancy(cents_to_decimal(subtotal + tax - total)):
+        problems.append(_problem("total_arithmetic", "{} + {} != {}".format(
+            details[subtotal_field], details[tax_field], details[total_field])))
+    if has_tax and (tax < 0 or (has_subtotal and tax > subtotal)):
+        problems.append(_problem("tax_range", "Tax {} outside 0 to the subtotal".format(details[tax_field])))
+
+    if items and (has_subtotal or _present(details, total_field)):
+        items_total = sum(parse_money(item.get(amount_field))[0] for item in items)
+        # Items are net of tax on most documents, tax inclusive on some receipts
+        expected = [amount for amount, present in ((subtotal, has_subtotal), (total, _present(details, total_field)))
+                    if present]
+        if all(is_discrepancy(cents_to_decimal(items_total - amount)) for amount in expected):
+            problems.append(_problem("line_items_sum", "Line items add up to {:.2f}, not to the {}".format(
+                cents_to_decimal(items_total), "subtotal" if has_subtotal else "total")))
+
+    if is_invoice:
+        inconsistent = [item.get("description") for item in items
+                        if check_quantity_rate(item, parse_amount(item.get("line_total"))) is False]
+        if inconsistent:
+            problems.append(_problem("line_item_arithmetic", "Quantity x rate is not the line total of {} item(s), "
+                                                             "e.g. '{}'".format(len(inconsistent), inconsistent[0])))
+    return problems